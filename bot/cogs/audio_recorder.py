@@ -14,7 +14,13 @@ from config import BotConfig
 from cogs.commands_loader import register_all_commands
 from utils.ApiController import ApiController, ModelType
 from utils.audio_sink import PerUserPCMSink
+from utils.packing import plan_packs, build_pack
+from utils.bundle_cache import BundleCache
+from utils.pipeline import OrderedPipeline
+from utils.search import SearchIndex
+from utils.vector_index import VectorIndex, chunk_transcript
 from utils.storage import TranscriptionStore
+from utils.streaming import StreamingMessage
 
 
 class AudioRecorder(commands.Cog):
@@ -54,13 +60,18 @@ class AudioRecorder(commands.Cog):
         ApiController.set_base_url(BotConfig.API_URL)
 
         self.user_contexts = {}
+        self.search_index = None  # SearchIndex, wczytywany w cog_load
+        self.vector_index = None  # VectorIndex (wyszukiwanie semantyczne), jw.
+        self._embed_tasks = set()
 
         # --- Ustawienia edytowalne w locie przez /config -------------------
         self.ollama_model = BotConfig.OLLAMA_DEFAULT_MODEL
+        self.task_models = self._parse_task_models(BotConfig.OLLAMA_TASK_MODELS)
         self.silence_timeout_min = BotConfig.SILENCE_TIMEOUT_MIN
         self.silence_rms_threshold = BotConfig.SILENCE_RMS_THRESHOLD
         self.result_channel_id = BotConfig.RESULT_CHANNEL_ID
         self.audio_retention_days = BotConfig.AUDIO_RETENTION_DAYS
+        self.transcribe_concurrency = BotConfig.TRANSCRIBE_CONCURRENCY
 
         self.recordings_dir = BotConfig.RECORDINGS_DIR
         os.makedirs(self.recordings_dir, exist_ok=True)
@@ -70,18 +81,35 @@ class AudioRecorder(commands.Cog):
             base_dir=BotConfig.DATA_DIR,
             recordings_dir=self.recordings_dir,
             audio_retention_days=self.audio_retention_days,
+            backend=BotConfig.STORE_BACKEND,
+            fsync=BotConfig.STORE_FSYNC,
+            journal_max_kb=BotConfig.STORE_JOURNAL_MAX_KB,
         )
+        # Gotowe paczki ZIP; zmiana nagrania w magazynie unieważnia jego paczki.
+        self.bundle_cache = BundleCache(
+            os.path.join(BotConfig.DATA_DIR, "bundles"),
+            int(BotConfig.BUNDLE_CACHE_MAX_MB * 1024 * 1024),
+        )
+        self.bundle_cache.watch(self.store)
         # Wczytaj zapisane nadpisania ustawień (jeśli są).
         self._load_runtime_config()
+
+        # Transkrypcja wypowiedzi: N żądań naraz, linie wydawane chronologicznie.
+        self._pipeline = OrderedPipeline(
+            self._transcribe_item, self._on_transcribed, self.transcribe_concurrency
+        )
         print(f"Magazyn danych: {BotConfig.DATA_DIR} (audio: {self.audio_retention_days} dni)")
 
-        self.check_services()
         register_all_commands(self)
 
     # =======================================================================
     #  Cykl życia cog-a
     # =======================================================================
     async def cog_load(self):
+        await self.check_services()
+        await self._open_search_index()
+        if BotConfig.SEMANTIC_SEARCH:
+            await self._open_vector_index()
         try:
             removed = await asyncio.to_thread(self.store.prune_audio)
             if removed:
@@ -91,10 +119,14 @@ class AudioRecorder(commands.Cog):
         if not self.audio_cleanup_loop.is_running():
             self.audio_cleanup_loop.start()
 
-    def cog_unload(self):
+    async def cog_unload(self):
         self.audio_cleanup_loop.cancel()
         self.monitor_loop.cancel()
         self.flush_loop.cancel()
+        for task in list(self._embed_tasks):
+            task.cancel()
+        await ApiController.aclose()
+        await asyncio.to_thread(self.store.close)
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -169,6 +201,18 @@ class AudioRecorder(commands.Cog):
     # =======================================================================
     #  Połączenie / tryby
     # =======================================================================
+    @staticmethod
+    def _make_sink(threshold):
+        return PerUserPCMSink(
+            rms_threshold=threshold,
+            utterance_gap=BotConfig.UTTERANCE_GAP_SEC,
+            downsample=BotConfig.INGEST_16K_MONO,
+            keep_full_rate=BotConfig.ARCHIVE_FULL_RATE,
+            buffer_sec=BotConfig.SINK_BUFFER_SEC,
+            vad_backend=BotConfig.VAD_BACKEND,
+            hangover_ms=BotConfig.VAD_HANGOVER_MS,
+        )
+
     async def _connect(self, channel, gated: bool):
         threshold = self.silence_rms_threshold if gated else 0
         guild = channel.guild
@@ -180,7 +224,7 @@ class AudioRecorder(commands.Cog):
                 await vc.move_to(channel)
             if vc.is_listening():
                 vc.stop_listening()
-        sink = PerUserPCMSink(rms_threshold=threshold, utterance_gap=BotConfig.UTTERANCE_GAP_SEC)
+        sink = self._make_sink(threshold)
         vc.listen(sink)
         self.voice_client = vc
         self.sink = sink
@@ -282,10 +326,7 @@ class AudioRecorder(commands.Cog):
             return
         try:
             # Świeży sink pod następną sesję (czysty stan).
-            sink = PerUserPCMSink(
-                rms_threshold=self.silence_rms_threshold,
-                utterance_gap=BotConfig.UTTERANCE_GAP_SEC,
-            )
+            sink = self._make_sink(self.silence_rms_threshold)
             if vc.is_listening():
                 vc.stop_listening()
             vc.listen(sink)
@@ -296,11 +337,19 @@ class AudioRecorder(commands.Cog):
     # =======================================================================
     #  Finalizacja nagrania -> transkrypcja + podsumowanie + nazwa
     # =======================================================================
+    @staticmethod
+    def _archive_format():
+        """(częstotliwość, kanały) surowego audio zapisywanego do archiwum."""
+        if BotConfig.INGEST_16K_MONO and not BotConfig.ARCHIVE_FULL_RATE:
+            return 16000, 1
+        return BotConfig.AUDIO_SAMPLE_RATE, BotConfig.AUDIO_CHANNELS
+
     def _save_wav(self, frames: bytes, filepath: str):
+        rate, channels = self._archive_format()
         with wave.open(filepath, 'wb') as wf:
-            wf.setnchannels(BotConfig.AUDIO_CHANNELS)
+            wf.setnchannels(channels)
             wf.setsampwidth(BotConfig.AUDIO_SAMPLE_WIDTH)
-            wf.setframerate(BotConfig.AUDIO_SAMPLE_RATE)
+            wf.setframerate(rate)
             wf.writeframes(frames)
 
     def _display_name(self, user_id):
@@ -376,27 +425,17 @@ class AudioRecorder(commands.Cog):
                 except Exception as e:  # noqa: BLE001
                     print(f"[live] Nie udało się edytować wiadomości: {e}")
 
-    @staticmethod
-    async def _send_chunks(send, text, header=None):
-        if header:
-            await send(header)
-        text = text or "(pusto)"
-        for i in range(0, len(text), 1900):
-            await send(text[i:i + 1900])
-
-    async def _transcribe_pcm(self, pcm) -> str:
-        """Transkrybuje pojedynczą wypowiedź (PCM) przez plik tymczasowy."""
-        import tempfile
-        fd, path = tempfile.mkstemp(suffix=".wav", dir=self.recordings_dir)
-        os.close(fd)
+    async def _transcribe_pcm(self, pcm, rate=BotConfig.AUDIO_SAMPLE_RATE,
+                              channels=BotConfig.AUDIO_CHANNELS) -> str:
+        """Transkrybuje pojedynczą wypowiedź - surowe PCM prosto do API (bez WAV)."""
         try:
-            self._save_wav(bytes(pcm), path)
-            return await self.transcribe_audio(path)
-        finally:
-            try:
-                os.remove(path)
-            except OSError:
-                pass
+            result = await ApiController.transcribe_pcm(pcm, rate, channels)
+            if not result or "text" not in result:
+                return "Błąd transkrypcji: brak tekstu w wyniku"
+            return result["text"]
+        except Exception as e:
+            traceback.print_exc()
+            return f"Błąd podczas transkrypcji: {str(e)}"
 
     @staticmethod
     def _append_raw(path, pcm):
@@ -405,19 +444,20 @@ class AudioRecorder(commands.Cog):
 
     async def _process_items(self, items):
         """
-        Przetwarza ZAKOŃCZONE wypowiedzi: dopisuje audio na dysk (surowe PCM),
-        transkrybuje i zapamiętuje linię z czasem. Zakłada trzymany _proc_lock.
+        Przyjmuje ZAKOŃCZONE wypowiedzi: dopisuje audio na dysk (surowe PCM)
+        i zgłasza je do potoku transkrypcji (``_pipeline``), który wysyła kilka
+        naraz, a linie wydaje w kolejności zgłoszeń (``_on_transcribed``).
+        Zakłada trzymany _proc_lock.
         """
-        new_lines = []
-        for it in items:
+        ready, skipped = [], []
+        for it in sorted(items, key=lambda x: x["start"]):
             uid = it["uid"]
-            if self.manual_only_users and uid not in self.manual_only_users:
-                continue
             pcm = it["pcm"]
-            if not pcm:
+            if (self.manual_only_users and uid not in self.manual_only_users) or not pcm:
+                skipped.append(it)
                 continue
             start = it["start"]
-            display = it["display"] or self._display_name(uid)
+            it["display"] = it["display"] or self._display_name(uid)
 
             if self._session_ts is None:
                 self._session_ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -430,10 +470,109 @@ class AudioRecorder(commands.Cog):
                 safe = channel_name.replace(" ", "_")
                 raw = os.path.join(self.recordings_dir, f"{safe}_{uid}_{self._session_ts}.pcm")
                 self._flush_audio_raw[uid] = raw
-                self._flush_display[uid] = display
+                self._flush_display[uid] = it["display"]
+
+            # audio -> dysk (zwalnia RAM); pełna jakość, jeśli sink ją zachował
+            await asyncio.to_thread(self._append_raw, raw, it.pop("raw", None) or pcm)
+            ready.append(it)
+        self._submit(ready, skipped)
+
+    def _submit(self, items, skipped=()):
+        """
+        Zgłasza wypowiedzi do potoku. Krótkie, kolejne wypowiedzi (także różnych
+        osób) są sklejane w jedno okno Whispera (``PACK_WINDOW_SEC``) - jedno
+        żądanie zamiast kilku prawie pustych okien; whisper-api rozdziela tekst
+        z powrotem wg czasów słów (``_transcribe_pack``). Wymaga whisper-api,
+        które to potrafi - inaczej każda wypowiedź idzie osobno.
+
+        ``skipped`` (bez mowy / spoza listy) nie idą do Whispera, ale miejsce
+        w buforze sinka zwalniają dopiero za resztą partii (``_unpack``) -
+        zwolnienie od razu oddałoby też wcześniejsze, czekające wypowiedzi.
+        """
+        if BotConfig.PACK_WINDOW_SEC <= 0 or not ApiController.spans_available():
+            packs = [[it] for it in items]
+        else:
+            packs = plan_packs(items, BotConfig.PACK_WINDOW_SEC, BotConfig.PACK_GAP_SEC)
+        for parts in packs:
+            if len(parts) == 1:
+                self._pipeline.submit(parts[0])
+                continue
+            pack = build_pack(parts, BotConfig.PACK_GAP_SEC)
+            for it in parts:
+                # Audio skopiowane do okna, ale miejsce w buforze zwalnia dopiero
+                # ``_on_transcribed`` - w kolejności zgłoszeń. ``PCMRing.release``
+                # przesuwa odczyt do końca zakresu, więc zwolnienie teraz
+                # oddałoby też wcześniejsze wypowiedzi mówcy, które jeszcze czekają.
+                it.pop("pcm", None)
+            self._pipeline.submit(pack)
+        if skipped:
+            self._pipeline.submit({"skipped": list(skipped)})
+
+    @staticmethod
+    def _release(it):
+        """Zwalnia miejsce wypowiedzi w buforze sinka (audio już niepotrzebne)."""
+        it.pop("pcm", None)
+        it.pop("raw", None)
+        release = it.pop("release", None)
+        if release is not None:
+            release()
+
+    async def _transcribe_item(self, it):
+        if "skipped" in it:
+            return None
+        if "parts" in it:
+            return await self._transcribe_pack(it)
+        return await self._transcribe_pcm(it["pcm"], it["rate"], it["channels"])
+
+    async def _transcribe_pack(self, pack):
+        """
+        Sklejone okno -> lista tekstów jego części. Podział (wg czasów słów)
+        i filtr halucynacji - osobno dla każdej części - robi whisper-api.
+        """
+        n = len(pack["parts"])
+        try:
+            result = await ApiController.transcribe_pcm(
+                pack["pcm"], pack["rate"], pack["channels"], spans=pack["spans"]
+            )
+        except Exception as e:
+            traceback.print_exc()
+            return [f"Błąd podczas transkrypcji: {str(e)}"] * n
+        parts = (result or {}).get("parts")
+        if parts is not None and len(parts) == n:
+            return parts
+        # whisper-api nie podzielił okna (np. starsza wersja) - części osobno.
+        frame = pack["channels"] * 2
+        texts = []
+        for begin, end in pack["spans"]:
+            a, b = (int(round(t * pack["rate"])) * frame for t in (begin, end))
+            texts.append(await self._transcribe_pcm(
+                memoryview(pack["pcm"])[a:b], pack["rate"], pack["channels"]
+            ))
+        return texts
+
+    @classmethod
+    def _unpack(cls, results):
+        """Wyniki sklejonych okien -> (wypowiedź, tekst) jak przy osobnych żądaniach."""
+        out = []
+        for it, text in results:
+            if "skipped" in it:
+                for skipped in it["skipped"]:
+                    cls._release(skipped)
+                continue
+            if "parts" not in it:
+                out.append((it, text))
+                continue
+            cls._release(it)
+            texts = text if isinstance(text, list) else [text] * len(it["parts"])
+            out.extend(zip(it["parts"], texts))
+        return out
 
-            await asyncio.to_thread(self._append_raw, raw, pcm)  # audio -> dysk (zwalnia RAM)
-            text = await self._transcribe_pcm(pcm)
+    async def _on_transcribed(self, results):
+        """Wyniki potoku (w kolejności zgłoszeń) -> transkrypt + żywa wiadomość."""
+        new_lines = []
+        for it, text in self._unpack(results):
+            self._release(it)
+            start, display = it["start"], it["display"]
             stripped = (text or "").strip()
             if stripped and not stripped.startswith("Błąd"):
                 entry = (start, display, stripped)
@@ -447,22 +586,121 @@ class AudioRecorder(commands.Cog):
         # Świeżo przetworzone wypowiedzi -> żywa wiadomość na czacie.
         await self._update_live_transcript(new_lines)
 
+    async def _open_search_index(self):
+        """Wczytuje indeks wyszukiwania i dociąga nagrania, których w nim brakuje."""
+        try:
+            index = await asyncio.to_thread(SearchIndex, os.path.join(BotConfig.DATA_DIR, "search"))
+            index.watch(self.store)
+            added = await asyncio.to_thread(index.sync, self.store)
+            self.search_index = index
+            if added:
+                print(f"Zaindeksowano {added} nagrań do wyszukiwania.")
+        except Exception as e:  # noqa: BLE001
+            print(f"Błąd indeksu wyszukiwania: {e}")
+
+    EMBED_BATCH = 32  # kawałków na jedno żądanie /embed/
+
+    async def _open_vector_index(self):
+        """
+        Wczytuje indeks wektorów i podpina go pod magazyn: nowe nagranie
+        (zdarzenie "add", wołane w wątku zapisu) zleca liczenie embeddingów
+        na pętli zdarzeń, usunięte znika z indeksu od razu. Brakujące
+        nagrania dociągane są w tle.
+        """
+        try:
+            index = await asyncio.to_thread(
+                VectorIndex, os.path.join(BotConfig.DATA_DIR, "vectors"),
+                BotConfig.VECTOR_IVF_LISTS, BotConfig.VECTOR_IVF_NPROBE,
+            )
+        except Exception as e:  # noqa: BLE001
+            print(f"Błąd indeksu wektorów: {e}")
+            return
+        loop = asyncio.get_running_loop()
+
+        def on_event(event, session):
+            if event == "add":
+                loop.call_soon_threadsafe(self._schedule_embed, session["id"])
+            elif event == "delete":
+                index.remove(session["id"])
+
+        self.store.subscribe(on_event)
+        self.vector_index = index
+        self._schedule_embed(None)
+
+    def _schedule_embed(self, session_id):
+        """Zadanie w tle: embeddingi jednego nagrania (None = wszystkich brakujących)."""
+        coro = self._embed_backfill() if session_id is None else self._embed_new(session_id)
+        task = asyncio.create_task(coro)
+        self._embed_tasks.add(task)
+        task.add_done_callback(self._embed_tasks.discard)
+
+    async def embed_session(self, session_id):
+        """Liczy embeddingi kawałków transkryptu i dopisuje je do indeksu wektorów."""
+        session = await asyncio.to_thread(self.store.get_by_id, session_id)
+        if not session or not self.store.has_transcript(session):
+            return False
+        text = await asyncio.to_thread(self.store.read_transcript, session)
+        chunks = chunk_transcript(text)
+        if not chunks:
+            return False
+        vectors, model = [], None
+        for i in range(0, len(chunks), self.EMBED_BATCH):
+            batch = chunks[i:i + self.EMBED_BATCH]
+            result = await ApiController.embed([c[2] for c in batch])
+            vectors.extend(result["embeddings"])
+            model = result["model_used"]
+        # Nagranie mogło zostać usunięte w trakcie liczenia - wtedy nie może
+        # wrócić do indeksu (zdarzenie "delete" już je z niego wyjęło).
+        return await asyncio.to_thread(
+            self.store.if_present, session_id,
+            lambda: self.vector_index.add(session_id, chunks, vectors, model),
+        )
+
+    async def _embed_new(self, session_id):
+        try:
+            await self.embed_session(session_id)
+        except Exception as e:  # noqa: BLE001
+            print(f"Wyszukiwanie semantyczne: nie zaindeksowano {session_id}: {e}")
+
+    async def _embed_backfill(self):
+        sessions = await asyncio.to_thread(self.store.list_sessions)
+        missing = [s["id"] for s in sessions if s["id"] not in self.vector_index]
+        done = 0
+        for sid in missing:
+            try:
+                if await self.embed_session(sid):
+                    done += 1
+            except Exception as e:  # noqa: BLE001
+                # Zwykle brak modelu embeddingów / niedostępny worker - spróbujemy
+                # przy następnym starcie, nie zasypujemy logów błędem na nagranie.
+                print(f"Wyszukiwanie semantyczne: przerwano indeksowanie ({e}).")
+                break
+        if done:
+            print(f"Wyszukiwanie semantyczne: zaindeksowano {done} nagrań.")
+
+    def pipeline_stats(self):
+        """Metryki potoku transkrypcji: głębokość kolejki, w toku, opóźnienie."""
+        return self._pipeline.status()
+
     async def _flush_pending(self):
         """Przetwarza zakończone wypowiedzi (wołane cyklicznie przez flush_loop)."""
         if self.sink is None or self.mode == "idle":
             return
         async with self._proc_lock:
             items = self.sink.pop_completed(
-                BotConfig.UTTERANCE_GAP_SEC, BotConfig.MAX_UTTERANCE_SEC
+                BotConfig.UTTERANCE_GAP_SEC, BotConfig.MAX_UTTERANCE_SEC,
+                BotConfig.SEGMENT_TARGET_SEC,
             )
             if items:
                 await self._process_items(items)
 
     async def finalize(self, send=None, reason="", announce=False):
         async with self._proc_lock:
-            # Domknij wszystkie pozostałe (aktywne) wypowiedzi.
+            # Domknij wszystkie pozostałe (aktywne) wypowiedzi i poczekaj na
+            # transkrypcję wszystkiego, co jest jeszcze w potoku.
             if self.sink is not None:
-                await self._process_items(self.sink.drain_all())
+                await self._process_items(self.sink.drain_all(BotConfig.SEGMENT_TARGET_SEC))
+            await self._pipeline.drain()
 
             lines = self._flush_lines
             audio_raw = self._flush_audio_raw
@@ -523,34 +761,61 @@ class AudioRecorder(commands.Cog):
 
             summary = None
             name = ""
+            parts = ", ".join(a["display_name"] for a in audio_files.values()) or "-"
+
+            def header(title):
+                return f"🎧 **{title}**  ·  `{session['id']}`\n👥 {parts}"
+
+            head_msg = None
+            if out and transcript_text.strip():
+                # Nagłówek od razu (nazwa dojdzie po podsumowaniu), pod nim
+                # podsumowanie pisane na bieżąco z tokenów Ollamy.
+                head_msg = await out(header("(generuję nazwę…)"))
+            editable = head_msg is not None and hasattr(head_msg, "edit")
+
+            async def retitle():
+                # Tytuł liczy się z transkryptu równolegle z podsumowaniem
+                # (zwykle mniejszym modelem) - nagłówek dostaje nazwę od razu.
+                title = await self.generate_title(transcript_text)
+                if title:
+                    # Błąd zapisu nazwy nie może zatrzymać zapisu podsumowania.
+                    try:
+                        await asyncio.to_thread(self.store.set_name, session["id"], title)
+                    except Exception as e:  # noqa: BLE001
+                        print(f"[finalize] Nie udało się zapisać nazwy: {e}")
+                if editable:
+                    try:
+                        await head_msg.edit(content=header(title or "(bez nazwy)"))
+                    except Exception as e:  # noqa: BLE001
+                        print(f"[finalize] Nie udało się edytować nagłówka: {e}")
+                return title
+
             if transcript_text.strip():
                 # Transkrypt idzie do podsumowania (Ollama) - wstrzymaj nagrywanie
                 # na ten czas, żeby nie zbierać nowej rozmowy w tle. Wznawiamy
                 # dopiero po zakończeniu (nawet jeśli podsumowanie się wywali).
                 self._pause_capture()
                 try:
-                    summary = await self.summarize_with_ollama(transcript_text)
+                    stream = StreamingMessage(out, header="**Podsumowanie:**") if out else None
+                    summary, name = await asyncio.gather(
+                        self.summarize_with_ollama(transcript_text, stream=stream),
+                        retitle(),
+                    )
                     await asyncio.to_thread(self.store.add_summary, session["id"], "auto", summary)
-                    name = await self.generate_title(summary or transcript_text)
-                    if name:
-                        await asyncio.to_thread(self.store.set_name, session["id"], name)
                 finally:
                     await self._resume_capture()
 
-            if out:
-                parts = ", ".join(a["display_name"] for a in audio_files.values()) or "-"
-                await out(f"🎧 **{name or '(bez nazwy)'}**  ·  `{session['id']}`\n👥 {parts}")
-                if summary:
-                    await self._send_chunks(out, summary, header="**Podsumowanie:**")
+            if out and not editable and (head_msg is None or name):
+                await out(header(name or "(bez nazwy)"))
             return session
 
     # =======================================================================
     #  Usługi API (Whisper / Ollama)
     # =======================================================================
-    def check_services(self):
+    async def check_services(self):
         try:
             print("Sprawdzanie statusu usług API...")
-            health = ApiController.check_health()
+            health = await ApiController.check_health()
             if health.get('status') != 'ok':
                 print(f"OSTRZEŻENIE: API nie w pełni operacyjne: {health.get('message')}")
             else:
@@ -558,19 +823,23 @@ class AudioRecorder(commands.Cog):
             services = health.get('services', {})
             if services.get('whisper', {}).get('loaded'):
                 print("Model Whisper jest załadowany.")
+                enc = ApiController.negotiate_encoding(BotConfig.AUDIO_WIRE_ENCODING, health)
+                print(f"Kodowanie audio do API: {enc}")
+                if BotConfig.PACK_WINDOW_SEC > 0 and not ApiController.negotiate_spans(health):
+                    print("OSTRZEŻENIE: whisper-api nie dzieli sklejonych okien - wypowiedzi idą pojedynczo.")
             else:
                 print("OSTRZEŻENIE: Model Whisper nie jest załadowany.")
             if services.get('ollama', {}).get('available'):
                 print("Ollama API jest dostępne.")
-                self.check_ollama_model()
+                await self.check_ollama_model()
             else:
                 print("OSTRZEŻENIE: Ollama API nie jest dostępne.")
         except Exception as e:
             print(f"Błąd sprawdzania usług API: {str(e)}")
 
-    def check_ollama_model(self):
+    async def check_ollama_model(self):
         try:
-            models = ApiController.list_ollama_models()
+            models = await ApiController.list_ollama_models()
             model_names = [m.get('name') for m in models if 'name' in m]
             print(f"Dostępne modele Ollama: {model_names}")
             if self.ollama_model not in model_names:
@@ -591,7 +860,7 @@ class AudioRecorder(commands.Cog):
                 return f"Błąd transkrypcji: brak pliku ({abs_path})"
             if os.path.getsize(abs_path) == 0:
                 return "Błąd transkrypcji: pusty plik"
-            result = await asyncio.to_thread(ApiController.transcribe, abs_path, ModelType.WHISPER)
+            result = await ApiController.transcribe(abs_path, ModelType.WHISPER)
             if not result or "text" not in result:
                 return "Błąd transkrypcji: brak tekstu w wyniku"
             return result["text"]
@@ -599,27 +868,57 @@ class AudioRecorder(commands.Cog):
             traceback.print_exc()
             return f"Błąd podczas transkrypcji: {str(e)}"
 
-    async def summarize_with_ollama(self, text, user_id=None):
+    @staticmethod
+    def _parse_task_models(raw):
+        """"title=gemma3:1b, summary=deepseek-r1:14b" -> {"title": ..., "summary": ...}."""
+        routes = {}
+        for part in (raw or "").split(","):
+            if not part.strip():
+                continue
+            task, sep, model = part.partition("=")
+            if not sep or not task.strip() or not model.strip():
+                raise ValueError(part)
+            routes[task.strip().lower()] = model.strip()
+        return routes
+
+    def model_for(self, task):
+        """Model Ollamy dla zadania (summary, title, map, ...) wg task_models."""
+        return self.task_models.get(task, self.ollama_model)
+
+    async def summarize_with_ollama(self, text, user_id=None, stream=None):
+        """Podsumowanie transkryptu; z ``stream`` (StreamingMessage) tekst płynie na czat na bieżąco."""
         try:
             context = self.user_contexts.get(user_id) if user_id is not None else None
-            result = await asyncio.to_thread(
-                ApiController.summarize, text, self.ollama_model, None, 0.0, context, "summary"
-            )
-            return result["text"]
+            model = self.model_for("summary")
+            if stream is None:
+                result = await ApiController.summarize(
+                    text, model, None, 0.0, context, "summary", self.task_models
+                )
+                return result["text"]
+            async for delta in ApiController.summarize_stream(
+                    text, model, None, 0.0, context, "summary", self.task_models
+            ):
+                await stream.feed(delta)
+            return (await stream.finish()).strip()
         except Exception as e:
             msg = str(e)
             traceback.print_exc()
             if "not found" in msg.lower() or "404" in msg:
-                return (
-                    f"⚠️ Model `{self.ollama_model}` nie jest dostępny w Ollamie. "
-                    f"Pobierz go (`ollama pull {self.ollama_model}`) lub zmień `/change_model`."
+                model = self.model_for("summary")
+                error = (
+                    f"⚠️ Model `{model}` nie jest dostępny w Ollamie. "
+                    f"Pobierz go (`ollama pull {model}`) lub zmień `/change_model`."
                 )
-            return f"Błąd podczas generowania podsumowania: {msg}"
+            else:
+                error = f"Błąd podczas generowania podsumowania: {msg}"
+            if stream is not None:
+                return await stream.finish(replace=error)
+            return error
 
     async def generate_title(self, text):
         try:
-            result = await asyncio.to_thread(
-                ApiController.summarize, text, self.ollama_model, None, 0.3, None, "title"
+            result = await ApiController.summarize(
+                text, self.model_for("title"), None, 0.3, None, "title", self.task_models
             )
             title = (result.get("text") or "").strip().strip('"').strip()
             if title:
@@ -629,11 +928,11 @@ class AudioRecorder(commands.Cog):
             print(f"Błąd generowania nazwy: {e}")
             return ""
 
-    async def summarize_session(self, session, requester_id=None, label="all"):
+    async def summarize_session(self, session, requester_id=None, label="all", stream=None):
         combined = await asyncio.to_thread(self.store.build_combined_text, session)
         if not combined.strip():
             return None
-        summary = await self.summarize_with_ollama(combined, user_id=requester_id)
+        summary = await self.summarize_with_ollama(combined, user_id=requester_id, stream=stream)
         await asyncio.to_thread(self.store.add_summary, session["id"], label, summary)
         return summary
 
@@ -642,11 +941,13 @@ class AudioRecorder(commands.Cog):
     # =======================================================================
     CONFIG_KEYS = (
         "ollama_model",
+        "task_models",
         "silence_timeout_min",
         "silence_rms_threshold",
         "result_channel_id",
         "home_channel_id",
         "audio_retention_days",
+        "transcribe_concurrency",
     )
 
     def _config_path(self):
@@ -686,6 +987,8 @@ class AudioRecorder(commands.Cog):
                 if not raw:
                     return False, "Podaj nazwę modelu."
                 self.ollama_model = raw
+            elif key == "task_models":
+                self.task_models = self._parse_task_models(raw)
             elif key == "silence_timeout_min":
                 v = float(raw)
                 if v <= 0:
@@ -707,6 +1010,12 @@ class AudioRecorder(commands.Cog):
                     return False, "audio_retention_days musi być >= 0."
                 self.audio_retention_days = v
                 self.store.audio_retention_days = v
+            elif key == "transcribe_concurrency":
+                v = int(raw)
+                if v < 1:
+                    return False, "transcribe_concurrency musi być >= 1."
+                self.transcribe_concurrency = v
+                asyncio.get_running_loop().create_task(self._pipeline.set_concurrency(v))
             else:
                 return False, f"Nieznany klucz: {key}. Dostępne: {', '.join(self.CONFIG_KEYS)}"
         except ValueError:
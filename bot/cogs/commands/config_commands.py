@@ -30,6 +30,27 @@ class ConfigCommands:
         lines = ["⚙️ **Aktualna konfiguracja:**"]
         for k, v in cfg.items():
             lines.append(f"• `{k}` = `{v}`")
+        st = self.cog.pipeline_stats()
+        lines.append(
+            f"\n📊 **Potok transkrypcji:** w kolejce `{st['depth']}` · w toku `{st['in_flight']}`"
+            f" · opóźnienie `{st['lag_sec']} s` · przetworzono `{st['completed']}`"
+        )
+        if self.cog.sink is not None:
+            bs = self.cog.sink.buffer_stats()
+            lines.append(
+                f"🎙️ **Bufory audio:** mówców `{bs['speakers']}` · zajęte `{bs['used'] / 1048576:.1f}`"
+                f"/`{bs['capacity'] / 1048576:.1f} MB` · odrzucone ramki `{bs['overflow_drops']}`"
+            )
+            lines.append(
+                f"🗣️ **VAD:** `{self.cog.sink.vad_backend}` · ramki ciszy `{bs['silence']}`"
+                f" · obcięte `{bs['trimmed_bytes'] / 1048576:.1f} MB`"
+            )
+        bc = self.cog.bundle_cache.status()
+        if bc["enabled"]:
+            lines.append(
+                f"📦 **Cache paczek ZIP:** `{bc['entries']}` · `{bc['bytes'] / 1048576:.1f}`"
+                f"/`{bc['max_bytes'] / 1048576:.0f} MB` · trafienia `{bc['hits']}` · chybienia `{bc['misses']}`"
+            )
         lines.append("\nZmiana: `/config <hasło> set <klucz> <wartość>`")
         return "\n".join(lines)
 
@@ -88,7 +88,7 @@ class RecordingCommands:
                 self.guild = it.guild
 
             async def send(self, *args, **kwargs):
-                await interaction.followup.send(*args, **kwargs)
+                return await interaction.followup.send(*args, **kwargs)
 
         return PseudoContext(interaction)
 
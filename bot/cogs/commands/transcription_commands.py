@@ -1,9 +1,5 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import io
-import os
-import json
-import zipfile
 import asyncio
 import datetime
 from typing import Optional
@@ -14,17 +10,14 @@ from discord import app_commands
 import sys
 sys.path.append('../..')
 from config import BotConfig
-from utils.storage import _safe
+from utils.ApiController import ApiController
+from utils.export import build_zip, upload_file
+from utils.search import parse_line, resolve_hits
+from utils.streaming import StreamingMessage
 
 PAGE_SIZE = 5
-
-
-async def send_chunks(send, text, header=None):
-    if header:
-        await send(header)
-    text = text or "(pusto)"
-    for i in range(0, len(text), 1900):
-        await send(text[i:i + 1900])
+SEARCH_LIMIT = 10
+SEMANTIC_LIMIT = 5
 
 
 def _fmt_date(iso):
@@ -34,45 +27,61 @@ def _fmt_date(iso):
         return iso or "?"
 
 
-def build_pages(store, sessions):
-    """Buduje listę embedów (po PAGE_SIZE nagrań), od najnowszego."""
-    pages = []
-    total = len(sessions)
+async def send_lines(send, lines, limit=1900):
+    """Wysyła linie w jak najmniejszej liczbie wiadomości (limit Discorda: 2000 znaków)."""
+    msg = ""
+    for line in lines:
+        if msg and len(msg) + len(line) + 1 > limit:
+            await send(msg)
+            msg = ""
+        msg += ("\n" if msg else "") + line
+    if msg:
+        await send(msg)
+
+
+def build_page(store, index):
+    """
+    Embed jednej strony listy (PAGE_SIZE nagrań od najnowszego) i liczba stron.
+    Czyta tylko tę stronę z indeksu; ``has_audio`` to flaga, bez stat-ów plików.
+    """
+    total = store.count_sessions()
     total_pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
-    for start in range(0, total, PAGE_SIZE):
-        chunk = sessions[start:start + PAGE_SIZE]
-        embed = discord.Embed(title="🎧 Nagrania (od najnowszego)", color=discord.Color.blue())
-        for i, s in enumerate(chunk, start=start + 1):
-            names = ", ".join(p["display_name"] for p in s.get("participants", [])) or "-"
-            audio = "tak" if store.has_audio(s) else "nie"
-            transcript = "jest" if store.has_transcript(s) else "brak"
-            summaries = len(s.get("summaries", []))
-            title = s.get("name") or "(bez nazwy)"
-            embed.add_field(
-                name=f"#{i} · {title}",
-                value=(
-                    f"🆔 `{s['id']}`\n"
-                    f"🕑 {_fmt_date(s.get('created_at'))} · 👥 {names}\n"
-                    f"🎧 audio: {audio} · 📝 transkrypcja: {transcript} · 🧠 podsumowania: {summaries}"
-                ),
-                inline=False,
-            )
-        embed.set_footer(text=f"Strona {start // PAGE_SIZE + 1}/{total_pages} · łącznie {total}")
-        pages.append(embed)
-    return pages
+    index = max(0, min(index, total_pages - 1))
+    start = index * PAGE_SIZE
+    embed = discord.Embed(title="🎧 Nagrania (od najnowszego)", color=discord.Color.blue())
+    for i, s in enumerate(store.page_sessions(start, PAGE_SIZE), start=start + 1):
+        names = ", ".join(p["display_name"] for p in s.get("participants", [])) or "-"
+        audio = "tak" if store.has_audio(s) else "nie"
+        transcript = "jest" if store.has_transcript(s) else "brak"
+        summaries = len(s.get("summaries", []))
+        title = s.get("name") or "(bez nazwy)"
+        embed.add_field(
+            name=f"#{i} · {title}",
+            value=(
+                f"🆔 `{s['id']}`\n"
+                f"🕑 {_fmt_date(s.get('created_at'))} · 👥 {names}\n"
+                f"🎧 audio: {audio} · 📝 transkrypcja: {transcript} · 🧠 podsumowania: {summaries}"
+            ),
+            inline=False,
+        )
+    embed.set_footer(text=f"Strona {index + 1}/{total_pages} · łącznie {total}")
+    return embed, total_pages
 
 
 class Paginator(discord.ui.View):
-    def __init__(self, pages, author_id, start_index=0, timeout=180):
+    """Strony renderowane dopiero przy przełączeniu (w pamięci tylko numer strony)."""
+
+    def __init__(self, store, author_id, total_pages, start_index=0, timeout=180):
         super().__init__(timeout=timeout)
-        self.pages = pages
+        self.store = store
         self.author_id = author_id
-        self.index = max(0, min(start_index, len(pages) - 1))
+        self.total_pages = total_pages
+        self.index = max(0, min(start_index, total_pages - 1))
         self._sync()
 
     def _sync(self):
         self.children[0].disabled = self.index <= 0
-        self.children[1].disabled = self.index >= len(self.pages) - 1
+        self.children[1].disabled = self.index >= self.total_pages - 1
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
         if interaction.user.id != self.author_id:
@@ -80,17 +89,20 @@ class Paginator(discord.ui.View):
             return False
         return True
 
+    async def _show(self, interaction, index):
+        # Liczba stron liczona na nowo - w międzyczasie mogły dojść/zniknąć nagrania.
+        embed, self.total_pages = await asyncio.to_thread(build_page, self.store, index)
+        self.index = max(0, min(index, self.total_pages - 1))
+        self._sync()
+        await interaction.response.edit_message(embed=embed, view=self)
+
     @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
     async def prev(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.index = max(0, self.index - 1)
-        self._sync()
-        await interaction.response.edit_message(embed=self.pages[self.index], view=self)
+        await self._show(interaction, self.index - 1)
 
     @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
     async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.index = min(len(self.pages) - 1, self.index + 1)
-        self._sync()
-        await interaction.response.edit_message(embed=self.pages[self.index], view=self)
+        await self._show(interaction, self.index + 1)
 
 
 class TranscriptionCommands:
@@ -123,6 +135,16 @@ class TranscriptionCommands:
             """Usuwa nagranie/element: <cel> [all|audio|summary]"""
             await self._delete(ctx.send, target, scope)
 
+        @self.bot.command(name="search")
+        async def search(ctx, *, query: str):
+            """Szuka w transkrypcjach: <słowa> (bez polskich znaków też zadziała)"""
+            await self._search(ctx.send, query)
+
+        @self.bot.command(name="semantic")
+        async def semantic(ctx, *, query: str):
+            """Szuka po znaczeniu: <pytanie> (np. kiedy rozmawialiśmy o wycofaniu wdrożenia)"""
+            await self._semantic(ctx.send, query)
+
     def register_slash_commands(self):
         @self.bot.tree.command(name="recordings", description="Lista nagrań; podaj ID aby pobrać ZIP")
         @app_commands.describe(target="Puste = lista; numer strony; albo ID nagrania = ZIP")
@@ -157,6 +179,18 @@ class TranscriptionCommands:
             await interaction.response.defer(ephemeral=False)
             await self._delete(interaction.followup.send, target, scope.value if scope else "all")
 
+        @self.bot.tree.command(name="search", description="Szuka słów w transkrypcjach nagrań")
+        @app_commands.describe(query="Szukane słowa (wszystkie muszą wystąpić w jednej wypowiedzi)")
+        async def search_slash(interaction: discord.Interaction, query: str):
+            await interaction.response.defer(ephemeral=False)
+            await self._search(interaction.followup.send, query)
+
+        @self.bot.tree.command(name="semantic", description="Szuka w transkrypcjach po znaczeniu, nie po słowach")
+        @app_commands.describe(query="Pytanie lub opis tematu, np. 'wycofanie wdrożenia'")
+        async def semantic_slash(interaction: discord.Interaction, query: str):
+            await interaction.response.defer(ephemeral=False)
+            await self._semantic(interaction.followup.send, query)
+
     # -------------------------------------------------------------------- logika
     async def _recordings(self, send, author_id, target):
         target = (target or "").strip()
@@ -170,64 +204,37 @@ class TranscriptionCommands:
             return
 
         page = int(target) if target.isdigit() else 1
-        sessions = await asyncio.to_thread(self.store.list_sessions)
-        if not sessions:
+        if not await asyncio.to_thread(self.store.count_sessions):
             await send("Brak zapisanych nagrań.")
             return
-        pages = build_pages(self.store, sessions)
-        start = max(0, min(page - 1, len(pages) - 1))
-        await send(embed=pages[start], view=Paginator(pages, author_id, start_index=start))
-
-    def _build_zip(self, session, bundle, include_audio=True):
-        buf = io.BytesIO()
-        omitted = False
-        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
-            info = {
-                "id": session.get("id"),
-                "name": session.get("name") or "",
-                "created_at": session.get("created_at"),
-                "channel": session.get("channel"),
-                "participants": session.get("participants", []),
-            }
-            z.writestr("info.json", json.dumps(info, ensure_ascii=False, indent=2))
-            z.writestr("transkrypcja.txt", bundle.get("transcript_text") or "(brak transkrypcji)")
-            for i, p in enumerate(bundle.get("summaries", []), 1):
-                try:
-                    with open(p, "r", encoding="utf-8") as f:
-                        z.writestr(f"podsumowanie_{i}.txt", f.read())
-                except OSError:
-                    pass
-            if include_audio:
-                for display, path in bundle.get("audio", []):
-                    try:
-                        z.write(path, arcname=f"audio/{_safe(display)}_{os.path.basename(path)}")
-                    except OSError:
-                        pass
-            else:
-                omitted = bool(bundle.get("audio"))
-        buf.seek(0)
-        return buf, omitted
+        embed, total_pages = await asyncio.to_thread(build_page, self.store, page - 1)
+        view = Paginator(self.store, author_id, total_pages, start_index=page - 1)
+        await send(embed=embed, view=view)
 
     async def _send_zip(self, send, session):
-        bundle = await asyncio.to_thread(self.store.export_bundle, session)
         limit = BotConfig.MAX_UPLOAD_MB
-
-        buf, omitted = await asyncio.to_thread(self._build_zip, session, bundle, True)
-        size_mb = buf.getbuffer().nbytes / (1024 * 1024)
-        if size_mb > limit:
-            # spróbuj bez audio
-            buf, omitted = await asyncio.to_thread(self._build_zip, session, bundle, False)
-            omitted = True
-            size_mb = buf.getbuffer().nbytes / (1024 * 1024)
-            if size_mb > limit:
-                await send(f"Paczka jest za duża ({size_mb:.1f} MB > {limit} MB).")
+        limit_bytes = int(limit * 1024 * 1024)
+        cache = self.cog.bundle_cache
+        cached = await asyncio.to_thread(cache.get, session, limit_bytes)
+        if cached is not None:
+            archive, omitted = cached
+        else:
+            bundle = await asyncio.to_thread(self.store.export_bundle, session)
+            archive, omitted, size = await asyncio.to_thread(build_zip, session, bundle, limit_bytes)
+            if archive is None:
+                await send(f"Paczka jest za duża ({size / (1024 * 1024):.1f} MB > {limit} MB).")
                 return
+            try:
+                await asyncio.to_thread(cache.put, session, limit_bytes, archive, omitted)
+            except OSError as e:
+                print(f"[bundles] Nie udało się zapisać paczki w cache: {e}")
 
         note = " (audio pominięte — za duże; dostępne na serwerze)" if omitted else ""
-        await send(
-            content=f"📦 Nagranie `{session['id']}`{note}",
-            file=discord.File(buf, filename=f"{session['id']}.zip"),
-        )
+        with archive:
+            await send(
+                content=f"📦 Nagranie `{session['id']}`{note}",
+                file=discord.File(upload_file(archive), filename=f"{session['id']}.zip"),
+            )
 
     async def _summarize(self, send, requester_id, target):
         targets = await asyncio.to_thread(self.store.resolve_targets, target)
@@ -236,13 +243,75 @@ class TranscriptionCommands:
             return
         await send(f"Generuję podsumowanie dla {len(targets)} nagrań...")
         for s in targets:
-            summary = await self.cog.summarize_session(s, requester_id=requester_id, label="manual")
-            if summary:
-                names = ", ".join(p["display_name"] for p in s.get("participants", [])) or "-"
-                await send_chunks(send, summary, header=f"**Podsumowanie {s['id']}** ({names}):")
-            else:
+            names = ", ".join(p["display_name"] for p in s.get("participants", [])) or "-"
+            # Podsumowanie pisane na bieżąco (edycje wiadomości) zamiast czekać na całość.
+            stream = StreamingMessage(send, header=f"**Podsumowanie {s['id']}** ({names}):")
+            summary = await self.cog.summarize_session(
+                s, requester_id=requester_id, label="manual", stream=stream
+            )
+            if not summary:
                 await send(f"Nagranie `{s['id']}` nie ma transkrypcji - pomijam.")
 
+    async def _search(self, send, query):
+        index = self.cog.search_index
+        if index is None:
+            await send("Indeks wyszukiwania jeszcze się wczytuje - spróbuj za chwilę.")
+            return
+        total, hits = await asyncio.to_thread(index.search, query, SEARCH_LIMIT)
+        if not hits:
+            await send(f"🔎 Brak wyników dla: `{query}`")
+            return
+        rows = await asyncio.to_thread(resolve_hits, self.store, hits)
+        out = [f"🔎 `{query}` — nagrań ze wszystkimi słowami: **{total}** (najnowsze trafienia):"]
+        for r in rows:
+            when = r["ts"] or "?"
+            who = f"**{r['who']}:** " if r["who"] else ""
+            text = r["text"] if len(r["text"]) <= 160 else r["text"][:157] + "..."
+            out.append(f"• `{r['id']}` · {when} · {who}{text}")
+        await send_lines(send, out)
+
+    async def _semantic(self, send, query):
+        index = self.cog.vector_index
+        if index is None:
+            await send("Wyszukiwanie semantyczne jest wyłączone lub jeszcze się wczytuje.")
+            return
+        try:
+            result = await ApiController.embed([query])
+        except Exception as e:  # noqa: BLE001
+            await send(f"Nie udało się policzyć embeddingu zapytania: {e}")
+            return
+        hits = await asyncio.to_thread(index.search, result["embeddings"][0], SEMANTIC_LIMIT)
+        hits = [h for h in hits if h[3] > 0]  # cosinus <= 0 = nic wspólnego
+        if not hits:
+            await send(f"🧭 Brak wyników dla: `{query}` (indeks: {index.status()['sessions']} nagrań)")
+            return
+        rows = await asyncio.to_thread(self._semantic_rows, hits)
+        out = [f"🧭 `{query}` — najbardziej pasujące fragmenty:"]
+        for sid, name, when, score, snippet in rows:
+            title = f" **{name}**" if name else ""
+            out.append(f"• `{sid}`{title} · {when} · {score:.2f}\n  {snippet}")
+        await send_lines(send, out)
+
+    def _semantic_rows(self, hits):
+        """[(id, nr linii, liczba linii, wynik)] -> wiersze do wyświetlenia (fragment transkryptu)."""
+        rows = []
+        for sid, line, lines, score in hits:
+            session = self.store.get_by_id(sid)
+            if not session:
+                continue
+            part = self.store.read_transcript(session).splitlines()[line:line + lines]
+            ts = next((parse_line(l)[0] for l in part if parse_line(l)[0]), None)
+            texts = []
+            for l in part:
+                _ts, who, text = parse_line(l)
+                if text.strip():
+                    texts.append(f"{who}: {text}" if who else text)
+            snippet = " / ".join(texts)
+            if len(snippet) > 200:
+                snippet = snippet[:197] + "..."
+            rows.append((sid, session.get("name"), ts or _fmt_date(session.get("created_at")), score, snippet))
+        return rows
+
     async def _rename(self, send, target, name):
         targets = await asyncio.to_thread(self.store.resolve_targets, target)
         if not targets:
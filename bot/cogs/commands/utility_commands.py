@@ -1,7 +1,5 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import asyncio
-
 import discord
 from discord import app_commands
 from typing import Optional
@@ -21,6 +19,8 @@ HELP_SECTIONS = [
     ]),
     ("🎧 Nagrania", [
         ("/recordings [strona|ID]", "Lista nagrań; z ID pobiera ZIP (audio+transkrypcja+podsumowanie)."),
+        ("/search <słowa>", "Szuka w transkrypcjach; pokazuje ID nagrania, czas i wypowiedź."),
+        ("/semantic <pytanie>", "Szuka po znaczeniu (embeddingi), np. „kiedy mówiliśmy o wycofaniu wdrożenia”."),
         ("/summarize <cel>", "Generuje podsumowanie. cel: ID • all • indeks `2` • przedział `1-3`."),
         ("/rename <cel> <nazwa>", "Zmienia nazwę nagrania."),
         ("/delete <cel> [zakres]", "Usuwa. zakres: `all` (całość) • `audio` • `summary`."),
@@ -152,7 +152,7 @@ class UtilityCommands:
 
     async def _model_names(self):
         """Zwraca listę nazw modeli dostępnych na serwerze Ollama."""
-        models = await asyncio.to_thread(ApiController.list_ollama_models)
+        models = await ApiController.list_ollama_models()
         return [m.get("name") for m in models if m.get("name")]
 
     async def _change_model(self, ctx, model_name):
@@ -200,7 +200,7 @@ class UtilityCommands:
     async def _list_models(self, ctx):
         """Implementacja komendy listowania modeli"""
         try:
-            models = await asyncio.to_thread(ApiController.list_ollama_models)
+            models = await ApiController.list_ollama_models()
             if not models:
                 await ctx.send("Brak dostępnych modeli Ollama.")
                 return
@@ -213,7 +213,7 @@ class UtilityCommands:
         """Implementacja slash komendy listowania modeli"""
         await interaction.response.defer(ephemeral=False)
         try:
-            models = await asyncio.to_thread(ApiController.list_ollama_models)
+            models = await ApiController.list_ollama_models()
             if not models:
                 await interaction.followup.send("Brak dostępnych modeli Ollama.")
                 return
@@ -34,16 +34,38 @@ class BotConfig:
     # Konfiguracja modeli AI
     WHISPER_MODEL_SIZE = os.environ.get("WHISPER_MODEL_SIZE", "large")
     OLLAMA_DEFAULT_MODEL = os.environ.get("OLLAMA_DEFAULT_MODEL", "deepseek-r1:14b")
+    # Modele per zadanie ("title=gemma3:1b,map=..."); brak wpisu = OLLAMA_DEFAULT_MODEL.
+    OLLAMA_TASK_MODELS = os.environ.get("OLLAMA_TASK_MODELS", "")
 
     # Adres serwera transkrypcji (gpuworker)
     API_URL = os.environ.get("API_URL", "http://localhost:8000")
 
+    # Kodowanie audio wysyłanego do gpuworkera: auto (FLAC, jeśli serwer umie) |
+    # flac (bezstratnie) | opus (stratnie, najmniej danych) | pcm (bez kompresji).
+    AUDIO_WIRE_ENCODING = os.environ.get("AUDIO_WIRE_ENCODING", "auto").lower()
+
     # Konfiguracja ścieżek
     RECORDINGS_DIR = os.environ.get(
         "RECORDINGS_DIR", os.path.join(os.getcwd(), "recordings")
     )
     # Trwały magazyn transkrypcji i podsumowań
     DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.getcwd(), "data"))
+    # Indeks nagrań: "sqlite" (index.sqlite3, WAL) albo "json" (index.json)
+    STORE_BACKEND = os.environ.get("STORE_BACKEND", "sqlite").lower()
+    # fsync zapisów indeksu: "always" | "snapshot" | "never"
+    STORE_FSYNC = os.environ.get("STORE_FSYNC", "always").lower()
+    # Backend json: rozmiar dziennika zmian, po którym scala się go w tle
+    STORE_JOURNAL_MAX_KB = int(os.environ.get("STORE_JOURNAL_MAX_KB", "256"))
+
+    # Cache gotowych paczek ZIP (/recordings <ID>) w DATA_DIR/bundles; 0 = wyłączony
+    BUNDLE_CACHE_MAX_MB = float(os.environ.get("BUNDLE_CACHE_MAX_MB", "64"))
+
+    # Wyszukiwanie semantyczne (/semantic): embeddingi transkryptów z /embed/
+    SEMANTIC_SEARCH = os.environ.get("SEMANTIC_SEARCH", "true").lower() in ("1", "true", "yes")
+    # Tryb IVF indeksu wektorów: liczba list (0 = przeszukiwanie pełne) i ile
+    # najbliższych list sprawdzać przy zapytaniu
+    VECTOR_IVF_LISTS = int(os.environ.get("VECTOR_IVF_LISTS", "0"))
+    VECTOR_IVF_NPROBE = int(os.environ.get("VECTOR_IVF_NPROBE", "8"))
 
     # Po ilu dniach usuwać pliki audio (transkrypcje trzymane są bezterminowo)
     AUDIO_RETENTION_DAYS = int(os.environ.get("AUDIO_RETENTION_DAYS", "7"))
@@ -54,6 +76,23 @@ class BotConfig:
     AUDIO_SAMPLE_WIDTH = 2  # 16-bit
     AUDIO_SAMPLE_RATE = 48000
 
+    # Konwersja przy odbiorze: stereo 48 kHz -> mono 16 kHz (tyle i tak używa
+    # Whisper). 6x mniej danych w RAM, w plikach .pcm i w wysyłce do API, ale
+    # archiwum WAV jest wtedy też 16 kHz mono (chyba że ARCHIVE_FULL_RATE).
+    # Domyślnie wyłączona - archiwum zostaje 48 kHz stereo, jak dotąd.
+    INGEST_16K_MONO = os.environ.get("INGEST_16K_MONO", "false").lower() in ("1", "true", "yes", "on")
+    # Archiwum audio (WAV w RECORDINGS_DIR) w pełnej jakości 48 kHz stereo.
+    # Ma sens tylko z INGEST_16K_MONO - kosztuje tyle RAM/dysku co bez konwersji.
+    ARCHIVE_FULL_RATE = os.environ.get("ARCHIVE_FULL_RATE", "false").lower() in ("1", "true", "yes", "on")
+    # Bufor cykliczny audio na mówcę (sekundy): mieści wypowiedzi czekające na
+    # transkrypcję; przy przepełnieniu ramki są odrzucane (licznik w /config).
+    SINK_BUFFER_SEC = float(os.environ.get("SINK_BUFFER_SEC", "180"))
+    # Wykrywanie mowy przed buforem: "numpy" (energia + pasmo + okresowość),
+    # "webrtc" (wymaga pakietu webrtcvad) albo "rms" (sam próg głośności).
+    VAD_BACKEND = os.environ.get("VAD_BACKEND", "numpy").strip().lower()
+    # Ile ms po końcu mowy ramki są jeszcze nagrywane (końcówki słów, pauzy).
+    VAD_HANGOVER_MS = float(os.environ.get("VAD_HANGOVER_MS", "300"))
+
     # --- Tryb automatyczny (bot stale wisi na kanale i sam nagrywa) ---------
     # Kanał głosowy, na którym siedzi bot w trybie auto (ID kanału Discord).
     _vc = os.environ.get("VOICE_CHANNEL_ID", "").strip()
@@ -65,7 +104,8 @@ class BotConfig:
     AUTO_RECORD = os.environ.get("AUTO_RECORD", "false").lower() in ("1", "true", "yes", "on")
     # Po ilu minutach ciszy na kanale finalizować nagranie.
     SILENCE_TIMEOUT_MIN = float(os.environ.get("SILENCE_TIMEOUT_MIN", "5"))
-    # Próg RMS (0-32767) - klatki poniżej traktujemy jako ciszę i odrzucamy.
+    # Próg RMS (0-32767) - klatki poniżej traktujemy jako ciszę i odrzucamy
+    # (minimum głośności dla VAD w trybie auto; w ręcznym nie obowiązuje).
     SILENCE_RMS_THRESHOLD = int(os.environ.get("SILENCE_RMS_THRESHOLD", "300"))
     # Co ile sekund pętla monitorująca sprawdza ciszę/obecność.
     AUTO_CHECK_INTERVAL_SEC = float(os.environ.get("AUTO_CHECK_INTERVAL_SEC", "15"))
@@ -78,6 +118,19 @@ class BotConfig:
     # bardzo długi monolog jest domykany i przetwarzany, by nie rósł w pamięci.
     # 0 = wyłączone.
     MAX_UTTERANCE_SEC = float(os.environ.get("MAX_UTTERANCE_SEC", "60"))
+    # Docelowa długość kawałka do Whispera (sekundy, tuż poniżej jego okna
+    # 30 s): dłuższa wypowiedź jest dzielona w najcichszym miejscu przed celem,
+    # reszta przechodzi do kolejnego kawałka. 0 = wyłączone (tylko twardy limit).
+    SEGMENT_TARGET_SEC = float(os.environ.get("SEGMENT_TARGET_SEC", "28"))
+
+    # Ile wypowiedzi transkrybować równolegle (żądania do whisper-api w locie).
+    # Kolejność linii w transkrypcie jest zachowana niezależnie od tej liczby.
+    TRANSCRIBE_CONCURRENCY = int(os.environ.get("TRANSCRIBE_CONCURRENCY", "4"))
+    # Sklejanie krótkich wypowiedzi (także różnych osób) w jedno okno Whispera
+    # (sekundy, maks. 30) - jedno żądanie zamiast kilku okien z samym
+    # dopełnieniem. 0 = każda wypowiedź osobno. Przerwa ciszy między nimi (s).
+    PACK_WINDOW_SEC = min(30.0, float(os.environ.get("PACK_WINDOW_SEC", "28")))
+    PACK_GAP_SEC = float(os.environ.get("PACK_GAP_SEC", "1.0"))
 
     # Maksymalny rozmiar pliku ZIP wysyłanego na Discord (MB).
     MAX_UPLOAD_MB = float(os.environ.get("MAX_UPLOAD_MB", "8"))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Moduły bota importują się jako ``utils.*`` (katalog bot/ na ścieżce, jak w Dockerfile).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
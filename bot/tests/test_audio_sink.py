@@ -0,0 +1,147 @@
+"""
+Testy bufora cyklicznego (``PCMRing``) i księgowania wypowiedzi w
+``PerUserPCMSink``: pozycje bezwzględne, zawijanie, kolejność zwalniania
+oraz zgodność zakresów pcm (16 kHz mono) i raw (48 kHz stereo) po podziale.
+"""
+import time
+import types
+
+import numpy as np
+import pytest
+
+from utils.audio_dsp import SRC_RATE
+from utils.audio_sink import PCMRing, PerUserPCMSink
+
+
+class User:
+    def __init__(self, uid):
+        self.id = uid
+        self.display_name = f"u{uid}"
+
+
+def frame(amp=8000, n=960, freq=300):
+    """20 ms tonu, 48 kHz stereo int16."""
+    t = np.arange(n) / SRC_RATE
+    s = (np.sin(2 * np.pi * freq * t) * amp).astype("<i2")
+    return np.repeat(s, 2).tobytes()
+
+
+def write(sink, user, frames):
+    for pcm in frames:
+        sink.write(user, types.SimpleNamespace(pcm=pcm))
+
+
+def make_sink(**kwargs):
+    # "rms" z progiem 0: każda ramka to mowa - testujemy księgowanie, nie VAD.
+    kwargs.setdefault("vad_backend", "rms")
+    return PerUserPCMSink(**kwargs)
+
+
+# ------------------------------------------------------------------ PCMRing
+def test_ring_view_without_wrap_is_zero_copy():
+    ring = PCMRing(16)
+    assert ring.append(b"abcdef")
+    view = ring.view(1, 5)
+    assert isinstance(view, memoryview) and bytes(view) == b"bcde"
+
+
+def test_ring_view_across_the_end():
+    ring = PCMRing(8)
+    assert ring.append(b"012345")
+    ring.release(6)
+    assert ring.append(b"6789ab")          # zawija się: 6,7 na końcu, 8..b na początku
+    assert (ring.write_pos, ring.read_pos, ring.used) == (12, 6, 6)
+    assert bytes(ring.view(6, 12)) == b"6789ab"
+    assert bytes(ring.view(7, 9)) == b"78"
+    assert bytes(ring.view(8, 12)) == b"89ab"   # po zawinięciu znów bez kopii
+    assert isinstance(ring.view(8, 12), memoryview)
+
+
+def test_ring_refuses_frame_that_does_not_fit():
+    ring = PCMRing(8)
+    assert ring.append(b"0123")
+    assert not ring.append(b"45678")
+    assert (ring.write_pos, ring.used) == (4, 4)
+    assert bytes(ring.view(0, 4)) == b"0123"
+    assert ring.append(b"4567")             # dokładnie do pełna
+    assert not ring.append(b"x")
+    ring.release(2)
+    assert ring.append(b"89")
+    assert bytes(ring.view(2, 10)) == b"23456789"
+
+
+def test_ring_release_is_monotonic_and_clamped():
+    ring = PCMRing(8)
+    ring.append(b"0123")
+    ring.release(3)
+    ring.release(1)                         # wcześniejszy koniec niczego nie cofa
+    assert ring.read_pos == 3
+    ring.release(100)                       # nie dalej niż zapisane
+    assert ring.read_pos == 4 and ring.used == 0
+
+
+# ------------------------------------------------------- wypowiedzi w sinku
+def test_completed_items_come_out_in_ring_order_and_release_everything():
+    sink = make_sink(downsample=True, keep_full_rate=True, buffer_sec=60)
+    user = User(1)
+    write(sink, user, [frame(amp=4000 + 40 * i) for i in range(1500)])   # 30 s mowy
+    items = sink.pop_completed(min_idle=60, target_seconds=8)
+    items += sink.drain_all(target_seconds=8)
+    assert len(items) >= 4
+    assert all(len(it["pcm"]) <= 8 * sink._bytes_per_sec for it in items)
+    starts = [it["start"] for it in items]
+    assert starts == sorted(starts)
+    assert sum(len(it["pcm"]) for it in items) == sink._captured
+    assert not sink.has_audio()
+    for it in items:
+        it["release"]()
+    assert sink.buffer_stats()["used"] == 0
+
+
+@pytest.mark.parametrize("downsample", [True, False])
+def test_split_keeps_pcm_and_raw_offsets_in_step(downsample):
+    sink = make_sink(downsample=downsample, keep_full_rate=downsample, buffer_sec=10)
+    user = User(1)
+    # Przesunięcie bufora, żeby pozycje były bezwzględne i zakres się zawijał.
+    write(sink, user, [frame() for _ in range(400)])   # 8 z 10 s
+    for it in sink.drain_all():
+        it["release"]()
+    time.sleep(0.01)
+    write(sink, user, [frame() for _ in range(200)])
+    sp = sink._snapshot()[0]
+    seg = sp.active
+    assert seg["begin"] % sp.ring.capacity + (seg["end"] - seg["begin"]) > sp.ring.capacity
+    begin, end, start = seg["begin"], seg["end"], seg["start"]
+    bps = sink._bytes_per_sec
+    frame_bytes = len(frame()) * bps // (SRC_RATE * 4)
+
+    at = begin + 37 * frame_bytes
+    head = sink._split(seg, at)
+    assert (head["begin"], head["end"]) == (begin, at)
+    assert (seg["begin"], seg["end"]) == (at, end)
+    assert (seg["start"] - start).total_seconds() == pytest.approx((at - begin) / bps)
+    if downsample:
+        raw_bps = SRC_RATE * 4
+        assert head["raw_end"] == seg["raw_begin"]
+        assert head["raw_end"] % 4 == 0
+        assert (head["raw_end"] - head["raw_begin"]) / raw_bps == pytest.approx((at - begin) / bps)
+        assert seg["raw_end"] - seg["raw_begin"] == pytest.approx((end - at) * raw_bps / bps)
+        # Raw po podziale to dokładnie te same ramki co pcm.
+        assert bytes(sp.raw_ring.view(head["raw_begin"], head["raw_end"])) == frame() * 37
+    else:
+        assert "raw_begin" not in head
+
+
+def test_segment_without_speech_is_emitted_empty_not_released():
+    sink = make_sink(downsample=False, buffer_sec=10, utterance_gap=0.05, rms_threshold=500)
+    user = User(1)
+    write(sink, user, [frame(amp=8000) for _ in range(20)])
+    time.sleep(0.1)
+    write(sink, user, [frame(amp=100) for _ in range(5)])   # sama cisza z "hangover"
+    items = sink.pop_completed(min_idle=0)
+    assert [bool(it["pcm"]) for it in items] == [True, False]
+    # Nic nie zwolnione przez sink - zwalnia wołający, w kolejności.
+    assert sink.buffer_stats()["used"] == 25 * len(frame())
+    items[0]["release"]()
+    items[1]["release"]()
+    assert sink.buffer_stats()["used"] == 0
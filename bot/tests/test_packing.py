@@ -0,0 +1,83 @@
+"""
+Testy sklejania krótkich wypowiedzi w jedno okno Whispera (``utils.packing``).
+"""
+import pytest
+
+from utils.packing import duration, plan_packs, build_pack
+
+RATE = 16000
+
+
+def item(sec, fill=1, rate=RATE, channels=1):
+    n = int(sec * rate) * channels
+    return {"pcm": memoryview(bytes([fill, 0]) * n), "rate": rate, "channels": channels}
+
+
+def secs(packs):
+    return [[round(duration(it), 3) for it in p] for p in packs]
+
+
+# ---------------------------------------------------------------- plan_packs
+def test_duration_from_pcm_size():
+    assert duration(item(2.5)) == pytest.approx(2.5)
+    assert duration(item(1.0, rate=48000, channels=2)) == pytest.approx(1.0)
+
+
+def test_plan_fills_window_including_gaps():
+    packs = plan_packs([item(10), item(9), item(8), item(5)], window_sec=28, gap_sec=1)
+    # 10 + 1 + 9 + 1 + 8 = 29 > 28 -> trzecia idzie do kolejnego okna.
+    assert secs(packs) == [[10, 9], [8, 5]]
+
+
+def test_plan_exact_fit_and_order():
+    packs = plan_packs([item(3), item(4), item(5), item(2)], window_sec=15, gap_sec=1)
+    assert secs(packs) == [[3, 4, 5], [2]]
+
+
+def test_plan_long_item_goes_alone():
+    packs = plan_packs([item(2), item(40), item(2)], window_sec=28, gap_sec=1)
+    assert secs(packs) == [[2], [40], [2]]
+
+
+def test_plan_never_mixes_formats():
+    packs = plan_packs([item(1), item(1, rate=48000, channels=2), item(1, rate=48000, channels=2)],
+                       window_sec=28, gap_sec=1)
+    assert [[(it["rate"], it["channels"]) for it in p] for p in packs] == [
+        [(RATE, 1)], [(48000, 2), (48000, 2)]
+    ]
+
+
+def test_plan_empty():
+    assert plan_packs([], window_sec=28, gap_sec=1) == []
+
+
+# ---------------------------------------------------------------- build_pack
+def test_build_concatenates_with_silence_and_reports_spans():
+    parts = [item(1.0, fill=1), item(0.5, fill=2), item(2.0, fill=3)]
+    pack = build_pack(parts, gap_sec=0.25)
+    assert pack["parts"] is parts
+    assert (pack["rate"], pack["channels"]) == (RATE, 1)
+    assert pack["spans"] == [(0.0, 1.0), (1.25, 1.75), (2.0, 4.0)]
+
+    pcm = bytes(pack["pcm"])
+    assert len(pcm) == int(4.0 * RATE) * 2
+    for (begin, end), fill in zip(pack["spans"], (1, 2, 3)):
+        a, b = int(begin * RATE) * 2, int(end * RATE) * 2
+        assert pcm[a:b] == bytes([fill, 0]) * ((b - a) // 2)
+    # Przerwy to cisza.
+    assert set(pcm[int(1.0 * RATE) * 2:int(1.25 * RATE) * 2]) == {0}
+
+
+def test_build_copies_audio():
+    src = bytearray(b"\x05\x00" * RATE)
+    part = {"pcm": memoryview(src), "rate": RATE, "channels": 1}
+    pack = build_pack([part, item(1)], gap_sec=0.5)
+    src[:] = bytes(len(src))
+    assert bytes(pack["pcm"][:4]) == b"\x05\x00\x05\x00"
+
+
+def test_build_stereo_gap_keeps_frame_alignment():
+    pack = build_pack([item(0.5, rate=48000, channels=2), item(0.5, rate=48000, channels=2)],
+                      gap_sec=0.1)
+    assert len(pack["pcm"]) % 4 == 0
+    assert pack["spans"][1] == pytest.approx((0.6, 1.1))
@@ -0,0 +1,203 @@
+"""
+Testy indeksu wektorów (``utils.vector_index``) z deterministycznym
+"modelem" embeddingów: worek słów haszowany do stałego wymiaru.
+"""
+import os
+import json
+import hashlib
+
+import numpy as np
+import pytest
+
+from utils.vector_index import VectorIndex, chunk_transcript
+
+DIM = 64
+MODEL = "fake-hash"
+
+
+def embed(text):
+    v = np.zeros(DIM, dtype=np.float32)
+    for word in text.lower().split():
+        v[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % DIM] += 1.0
+    return v
+
+
+def add_text(index, session_id, transcript, model=MODEL, max_chars=800):
+    chunks = chunk_transcript(transcript, max_chars)
+    index.add(session_id, chunks, [embed(c[2]) for c in chunks], model)
+    return chunks
+
+
+def ids(hits):
+    return [h[0] for h in hits]
+
+
+# ------------------------------------------------------------ chunk_transcript
+def test_chunks_cover_all_lines_without_splitting_them():
+    lines = [f"[2025-01-01 10:00:{i:02d}] Ala: zdanie numer {i} " + "x" * 40 for i in range(30)]
+    chunks = chunk_transcript("\n".join(lines), max_chars=200)
+    assert len(chunks) > 1
+    # Kawałki leżą jeden za drugim i razem pokrywają cały transkrypt.
+    assert chunks[0][0] == 0
+    for (first, count, _), (nxt, _, _) in zip(chunks, chunks[1:]):
+        assert first + count == nxt
+    assert chunks[-1][0] + chunks[-1][1] == len(lines)
+    for first, count, text in chunks:
+        assert len(text.splitlines()) == count
+        assert len(text) <= 200
+        assert "[2025" not in text          # znaczniki czasu pominięte
+        assert text.startswith("Ala: ")
+
+
+def test_chunk_longer_than_limit_stays_whole():
+    long_line = "[2025-01-01 10:00:00] Bob: " + "słowo " * 100
+    chunks = chunk_transcript(long_line + "\n[2025-01-01 10:00:01] Bob: krótko", max_chars=50)
+    assert [(c[0], c[1]) for c in chunks] == [(0, 1), (1, 1)]
+    assert chunks[0][2].startswith("Bob: słowo")
+
+
+def test_empty_lines_belong_to_a_chunk_but_add_no_text():
+    chunks = chunk_transcript("[2025-01-01 10:00:00] Ala: raz\n\n[2025-01-01 10:00:02] Ala: dwa")
+    assert chunks == [(0, 3, "Ala: raz\nAla: dwa")]
+    assert chunk_transcript("") == []
+
+
+# ---------------------------------------------------------------- szukanie
+@pytest.fixture
+def index(tmp_path):
+    return VectorIndex(str(tmp_path / "vectors"))
+
+
+def test_search_orders_by_similarity(index):
+    add_text(index, "A", "Ala: wdrożenie rollback produkcja")
+    add_text(index, "B", "Bob: zupa obiad kolacja")
+    add_text(index, "C", "Cez: rollback")
+    hits = index.search(embed("rollback produkcja"), limit=3)
+    assert ids(hits) == ["A", "C", "B"]
+    scores = [h[3] for h in hits]
+    assert scores == sorted(scores, reverse=True)
+    q, doc = embed("rollback produkcja"), embed("Ala: wdrożenie rollback produkcja")
+    expected = float(q @ doc / np.linalg.norm(q) / np.linalg.norm(doc))
+    assert scores[0] == pytest.approx(expected, rel=1e-5)
+
+
+def test_search_limits_chunks_per_session(index):
+    transcript = "\n".join(f"Ala: rollback numer {i}" for i in range(6))
+    chunks = add_text(index, "A", transcript, max_chars=20)
+    assert len(chunks) == 6
+    add_text(index, "B", "Bob: rollback")
+    assert ids(index.search(embed("rollback"), limit=5, per_session=1)) in (["A", "B"], ["B", "A"])
+    hits = index.search(embed("rollback"), limit=5, per_session=3)
+    assert ids(hits).count("A") == 3 and ids(hits).count("B") == 1
+    # Każdy wynik wskazuje inny zakres linii.
+    assert len({(h[0], h[1]) for h in hits}) == len(hits)
+
+
+def test_search_with_wrong_dimension_or_empty_index(index):
+    assert index.search(embed("cokolwiek")) == []
+    add_text(index, "A", "Ala: coś")
+    assert index.search(np.ones(DIM + 1)) == []
+
+
+def test_readding_a_session_replaces_its_chunks(index):
+    add_text(index, "A", "Ala: rollback")
+    add_text(index, "A", "Ala: zupa")
+    assert index.status()["vectors"] == 1
+    assert index.search(embed("rollback"))[0][3] < 0.5
+
+
+def test_model_change_resets_index(index):
+    add_text(index, "A", "Ala: rollback")
+    add_text(index, "B", "Bob: zupa", model="other")
+    assert index.status()["model"] == "other"
+    assert "A" not in index and "B" in index
+
+
+# ------------------------------------------------------- usuwanie i odczyt
+def test_remove_and_reload_replays_tombstones(tmp_path):
+    directory = str(tmp_path / "vectors")
+    index = VectorIndex(directory)
+    add_text(index, "A", "Ala: rollback")
+    add_text(index, "B", "Bob: rollback zupa")
+    index.remove("A")
+    assert ids(index.search(embed("rollback"), limit=5)) == ["B"]
+
+    reopened = VectorIndex(directory)
+    assert "A" not in reopened and "B" in reopened
+    assert ids(reopened.search(embed("rollback"), limit=5)) == ["B"]
+
+
+def test_tombstone_only_hides_rows_written_before_it(tmp_path):
+    directory = str(tmp_path / "vectors")
+    index = VectorIndex(directory)
+    add_text(index, "A", "Ala: rollback")
+    add_text(index, "B", "Bob: zupa")
+    index.remove("A")
+    add_text(index, "A", "Ala: rollback ponownie")
+
+    reopened = VectorIndex(directory)
+    assert "A" in reopened
+    assert reopened.status()["vectors"] == 2
+    assert ids(reopened.search(embed("rollback ponownie"), limit=1)) == ["A"]
+
+
+def test_reload_rewrites_when_most_rows_are_dead(tmp_path):
+    directory = str(tmp_path / "vectors")
+    index = VectorIndex(directory)
+    for i in range(5):
+        add_text(index, f"S{i}", f"Ala: temat {i}")
+    for i in range(4):
+        index.remove(f"S{i}")
+
+    reopened = VectorIndex(directory)
+    assert reopened.status()["vectors"] == 1
+    assert os.path.getsize(os.path.join(directory, "vectors.f32")) == 4 * DIM
+    with open(os.path.join(directory, "ids.jsonl"), encoding="utf-8") as f:
+        assert [json.loads(line)["id"] for line in f] == ["S4"]
+
+
+def test_reload_after_crash_mid_append(tmp_path):
+    directory = str(tmp_path / "vectors")
+    index = VectorIndex(directory)
+    add_text(index, "A", "Ala: rollback")
+    add_text(index, "B", "Bob: zupa")
+    # Awaria: opis wiersza bez wektora, urwany wektor i urwana linia JSON.
+    with open(os.path.join(directory, "ids.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "C", "line": 0, "lines": 1}) + "\n")
+        f.write('{"id": "D", "li')
+    with open(os.path.join(directory, "vectors.f32"), "ab") as f:
+        f.write(b"\0" * (4 * DIM // 2))
+
+    reopened = VectorIndex(directory)
+    assert "A" in reopened and "B" in reopened and "C" not in reopened
+    assert os.path.getsize(os.path.join(directory, "vectors.f32")) == 2 * 4 * DIM
+    assert ids(reopened.search(embed("zupa"), limit=1)) == ["B"]
+    # Po przepisaniu dopisywanie dalej działa.
+    add_text(reopened, "C", "Cez: obiad")
+    assert ids(VectorIndex(directory).search(embed("obiad"), limit=1)) == ["C"]
+
+
+# ------------------------------------------------------------------- IVF
+def test_ivf_falls_back_to_exact_search_when_too_few_vectors(tmp_path):
+    index = VectorIndex(str(tmp_path / "vectors"), ivf_lists=8, ivf_nprobe=1)
+    add_text(index, "A", "Ala: rollback")
+    add_text(index, "B", "Bob: zupa")
+    assert ids(index.search(embed("zupa"), limit=2)) == ["B", "A"]
+    assert index.status()["ivf_lists"] == 0
+
+
+def test_ivf_finds_exact_match_and_tracks_new_rows(tmp_path):
+    rng = np.random.default_rng(1)
+    index = VectorIndex(str(tmp_path / "vectors"), ivf_lists=4, ivf_nprobe=2)
+    vectors = rng.standard_normal((200, DIM)).astype(np.float32)
+    for i, v in enumerate(vectors):
+        index.add(f"S{i}", [(0, 1, f"t{i}")], [v], MODEL)
+    for i in (0, 57, 199):
+        assert ids(index.search(vectors[i], limit=1)) == [f"S{i}"]
+    assert index.status()["ivf_lists"] == 4
+    # Wiersze dopisane po treningu trafiają do list IVF.
+    extra = rng.standard_normal(DIM).astype(np.float32)
+    index.add("NEW", [(0, 1, "nowy")], [extra], MODEL)
+    assert ids(index.search(extra, limit=1)) == ["NEW"]
+    index.remove("S57")
+    assert "S57" not in ids(index.search(vectors[57], limit=5))
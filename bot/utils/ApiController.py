@@ -1,8 +1,12 @@
 import os
-import requests
 import json
+import asyncio
 from enum import Enum
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Union, AsyncIterator, Tuple
+
+import httpx
+
+from utils.audio_dsp import encode_pcm, local_encodings
 
 
 class ModelType(str, Enum):
@@ -13,16 +17,44 @@ class ModelType(str, Enum):
 
 class ApiController:
     """
-    Static client for the Whisper & Ollama transcription/summarization API
-    (the gpuworker service). All network calls are synchronous (built on
-    ``requests``); call them from async code via ``asyncio.to_thread``.
+    Static asyncio client for the Whisper & Ollama transcription/summarization
+    API (the gpuworker service). All calls share one ``httpx.AsyncClient``
+    (connection pool + HTTP keep-alive), created lazily on first use inside
+    the running event loop; ``aclose`` releases it on shutdown.
     """
 
     # Default base URL for the API
     _base_url = "http://localhost:8000"
 
-    # Default timeouts (seconds) - transcription/summarization can be slow.
-    _timeout = 600
+    # Shared pooled client (one per process).
+    _client: Optional[httpx.AsyncClient] = None
+    _limits = httpx.Limits(
+        max_connections=20,
+        max_keepalive_connections=10,
+        keepalive_expiry=60.0,
+    )
+
+    # Per-endpoint timeouts (seconds). Connecting is always quick; the read
+    # timeout depends on how long the worker may legitimately take.
+    _timeouts = {
+        'transcribe': httpx.Timeout(600.0, connect=10.0),
+        'summarize': httpx.Timeout(600.0, connect=10.0),
+        'embed': httpx.Timeout(300.0, connect=10.0),
+        'models': httpx.Timeout(30.0, connect=10.0),
+        'health': httpx.Timeout(10.0, connect=5.0),
+    }
+
+    # How many times to retry when the worker's inference queue is full
+    # (HTTP 429). The wait between attempts follows the Retry-After header.
+    _busy_retries = 5
+    _busy_max_wait = 30
+
+    # Wire encoding for /transcribe_pcm/ uploads ("pcm", "flac" or "opus"),
+    # negotiated against the worker's /health/ capabilities.
+    _wire_encoding = "pcm"
+
+    # Whether the worker can split a packed window into parts (``capabilities``).
+    _spans = False
 
     @classmethod
     def set_base_url(cls, url: str) -> None:
@@ -36,7 +68,52 @@ class ApiController:
         cls._base_url = url.rstrip("/")
 
     @classmethod
-    def transcribe(
+    def _get_client(cls) -> httpx.AsyncClient:
+        if cls._client is None or cls._client.is_closed:
+            cls._client = httpx.AsyncClient(limits=cls._limits)
+        return cls._client
+
+    @classmethod
+    async def aclose(cls) -> None:
+        """Close the shared client and its pooled connections."""
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
+
+    @classmethod
+    def negotiate_encoding(cls, preferred: str, health: Dict[str, Any]) -> str:
+        """
+        Pick the upload encoding supported by both this client and the worker.
+
+        Args:
+            preferred: "auto" (FLAC if possible), "flac", "opus" or "pcm".
+            health: Result of ``check_health`` (``capabilities.encodings``).
+
+        Returns:
+            The encoding that will be used from now on.
+        """
+        offered = (health.get('capabilities') or {}).get('encodings') or ['pcm']
+        usable = set(offered) & set(local_encodings())
+        preferred = (preferred or 'auto').lower()
+        order = ['flac'] if preferred == 'auto' else [preferred]
+        cls._wire_encoding = next((e for e in order if e in usable), 'pcm')
+        return cls._wire_encoding
+
+    @classmethod
+    def negotiate_spans(cls, health: Dict[str, Any]) -> bool:
+        """
+        Remember whether the worker can split a packed window back into
+        its parts (``capabilities.spans``); older workers cannot.
+        """
+        cls._spans = bool((health.get('capabilities') or {}).get('spans'))
+        return cls._spans
+
+    @classmethod
+    def spans_available(cls) -> bool:
+        return cls._spans
+
+    @classmethod
+    async def transcribe(
             cls,
             file_path: str,
             model_type: Union[ModelType, str] = ModelType.WHISPER,
@@ -45,7 +122,7 @@ class ApiController:
         Transcribe an audio file using Whisper.
 
         Args:
-            file_path: Path to audio file (WAV or MP3)
+            file_path: Path to audio file (WAV, MP3, FLAC or Ogg/Opus)
             model_type: Kept for backwards compatibility; only WHISPER is
                 supported for transcription (Ollama cannot transcribe audio).
 
@@ -68,25 +145,86 @@ class ApiController:
                 )
 
         file_ext = os.path.splitext(file_path)[1].lower()
-        if file_ext not in ['.wav', '.mp3']:
+        mimes = {'.wav': 'audio/wav', '.mp3': 'audio/mpeg', '.flac': 'audio/flac',
+                 '.ogg': 'audio/ogg', '.opus': 'audio/ogg'}
+        if file_ext not in mimes:
             raise ValueError(
-                f"Unsupported file format: {file_ext}. Only WAV and MP3 are supported"
+                f"Unsupported file format: {file_ext}. "
+                "Only WAV, MP3, FLAC and Ogg/Opus are supported"
             )
 
-        mime = 'audio/wav' if file_ext == '.wav' else 'audio/mpeg'
+        mime = mimes[file_ext]
         url = f"{cls._base_url}/transcribe/?model_type={ModelType.WHISPER.value}"
 
-        with open(file_path, 'rb') as f:
-            files = {'file': (os.path.basename(file_path), f, mime)}
-            try:
-                response = requests.post(url, files=files, timeout=cls._timeout)
-                response.raise_for_status()
-                return response.json()
-            except requests.RequestException as e:
-                cls._handle_request_error(e)
+        def _read():
+            with open(file_path, 'rb') as f:
+                return f.read()
+
+        data = await asyncio.to_thread(_read)
+        files = {'file': (os.path.basename(file_path), data, mime)}
+        try:
+            response = await cls._post_with_retry(url, 'transcribe', files=files)
+            return response.json()
+        except httpx.HTTPError as e:
+            cls._handle_request_error(e)
+
+    @classmethod
+    async def transcribe_pcm(
+            cls,
+            pcm: Union[bytes, memoryview],
+            sample_rate: int = 48000,
+            channels: int = 2,
+            spans: Optional[List[Tuple[float, float]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Transcribe raw little-endian int16 PCM frames with Whisper.
+
+        The frames are sent as the request body (no multipart, no temp files);
+        the format is described by the ``X-Sample-Rate``/``X-Channels`` headers
+        and the server converts it straight to a float32 array. If a
+        compressed encoding was negotiated (see ``negotiate_encoding``) the
+        body is FLAC/Opus instead, flagged with ``X-Audio-Encoding``.
+
+        ``spans`` are the (start, end) seconds of utterances packed into
+        ``pcm``; the result then also has ``parts`` - the text of each one,
+        split by word timestamps and filtered for hallucinations separately.
+
+        Returns:
+            Dict containing the transcription result (``text`` key).
+        """
+        if not pcm:
+            raise ValueError("pcm must be non-empty")
+
+        encoding = cls._wire_encoding
+        if encoding == 'pcm':
+            body = bytes(pcm)
+        else:
+            # Encoding is CPU work - keep it off the event loop.
+            body = await asyncio.to_thread(encode_pcm, pcm, sample_rate, channels, encoding)
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            'X-Sample-Rate': str(int(sample_rate)),
+            'X-Channels': str(int(channels)),
+            'X-Audio-Encoding': encoding,
+        }
+        url = f"{cls._base_url}/transcribe_pcm/"
+        params = {'spans': ','.join(f"{a:.3f}-{b:.3f}" for a, b in spans)} if spans else None
+        try:
+            response = await cls._post_with_retry(
+                url, 'transcribe', content=body, headers=headers, params=params
+            )
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            # Worker lost the codec (e.g. redeployed) - fall back to raw PCM.
+            if e.response.status_code == 415 and encoding != 'pcm':
+                cls._wire_encoding = 'pcm'
+                return await cls.transcribe_pcm(pcm, sample_rate, channels, spans)
+            cls._handle_request_error(e)
+        except httpx.HTTPError as e:
+            cls._handle_request_error(e)
 
     @classmethod
-    def summarize(
+    async def summarize(
             cls,
             text: str,
             model_name: str,
@@ -94,6 +232,7 @@ class ApiController:
             temperature: float = 0.0,
             context: Optional[str] = None,
             task: str = "summary",
+            task_models: Optional[Dict[str, str]] = None,
     ) -> Dict[str, Any]:
         """
         Summarize (or otherwise process) text with an Ollama model via the
@@ -101,6 +240,9 @@ class ApiController:
 
         Args:
             task: "summary" (default) or "title" (short conversation title).
+            task_models: Optional per-task model routing, e.g.
+                ``{"title": "gemma3:1b"}``; tasks without an entry use
+                ``model_name``.
 
         Returns:
             Dict containing the result (``text`` key).
@@ -110,6 +252,76 @@ class ApiController:
         if not model_name or not isinstance(model_name, str):
             raise ValueError("model_name must be a non-empty string")
 
+        payload = cls._summarize_payload(
+            text, model_name, system_prompt, temperature, context, task, task_models
+        )
+        try:
+            response = await cls._get_client().post(
+                f"{cls._base_url}/summarize/", json=payload,
+                timeout=cls._timeouts['summarize'],
+            )
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            cls._handle_request_error(e)
+
+    @classmethod
+    async def summarize_stream(
+            cls,
+            text: str,
+            model_name: str,
+            system_prompt: Optional[str] = None,
+            temperature: float = 0.0,
+            context: Optional[str] = None,
+            task: str = "summary",
+            task_models: Optional[Dict[str, str]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of ``summarize``: yields text fragments as soon as
+        the model produces them (``/summarize/stream/``, NDJSON lines).
+
+        Raises:
+            RuntimeError: On HTTP errors or an ``error`` line mid-stream.
+        """
+        if not text or not isinstance(text, str):
+            raise ValueError("text must be a non-empty string")
+        if not model_name or not isinstance(model_name, str):
+            raise ValueError("model_name must be a non-empty string")
+
+        payload = cls._summarize_payload(
+            text, model_name, system_prompt, temperature, context, task, task_models
+        )
+        try:
+            async with cls._get_client().stream(
+                    "POST", f"{cls._base_url}/summarize/stream/", json=payload,
+                    timeout=cls._timeouts['summarize'],
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise RuntimeError(f"API error: {chunk['error']}")
+                    if chunk.get('delta'):
+                        yield chunk['delta']
+                    if chunk.get('done'):
+                        return
+        except httpx.HTTPError as e:
+            cls._handle_request_error(e)
+
+    @staticmethod
+    def _summarize_payload(
+            text: str,
+            model_name: str,
+            system_prompt: Optional[str],
+            temperature: float,
+            context: Optional[str],
+            task: str,
+            task_models: Optional[Dict[str, str]],
+    ) -> Dict[str, Any]:
         payload: Dict[str, Any] = {
             "text": text,
             "model_name": model_name,
@@ -120,21 +332,49 @@ class ApiController:
             payload["system_prompt"] = system_prompt
         if context:
             payload["context"] = context
+        if task_models:
+            payload["task_models"] = task_models
+        return payload
+
+    @classmethod
+    async def embed(
+            cls,
+            texts: List[str],
+            model_name: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Embedding vectors for ``texts`` (``/embed/``, proxied to Ollama).
+
+        Args:
+            model_name: Embedding model; None uses the worker's default
+                (``OLLAMA_EMBED_MODEL``).
+
+        Returns:
+            ``{"embeddings": [[float, ...], ...], "model_used": str, "dim": int}``
+            with one vector per input text, in order.
+        """
+        if not texts or not all(isinstance(t, str) and t.strip() for t in texts):
+            raise ValueError("texts must be a non-empty list of non-empty strings")
 
+        payload: Dict[str, Any] = {"texts": texts}
+        if model_name:
+            payload["model_name"] = model_name
         try:
-            response = requests.post(
-                f"{cls._base_url}/summarize/", json=payload, timeout=cls._timeout
+            response = await cls._get_client().post(
+                f"{cls._base_url}/embed/", json=payload, timeout=cls._timeouts['embed'],
             )
             response.raise_for_status()
             return response.json()
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             cls._handle_request_error(e)
 
     @classmethod
-    def list_ollama_models(cls) -> List[Dict[str, Any]]:
+    async def list_ollama_models(cls) -> List[Dict[str, Any]]:
         """Get the list of available Ollama models."""
         try:
-            response = requests.get(f"{cls._base_url}/ollama/models/", timeout=30)
+            response = await cls._get_client().get(
+                f"{cls._base_url}/ollama/models/", timeout=cls._timeouts['models']
+            )
             response.raise_for_status()
 
             data = response.json()
@@ -142,18 +382,20 @@ class ApiController:
                 raise RuntimeError("Unexpected API response format")
 
             return data['models']
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             cls._handle_request_error(e)
 
     @classmethod
-    def check_health(cls) -> Dict[str, Any]:
+    async def check_health(cls) -> Dict[str, Any]:
         """Check the health status of the API (never raises)."""
         error_shape = {
             'whisper': {'loaded': False},
             'ollama': {'available': False},
         }
         try:
-            response = requests.get(f"{cls._base_url}/health/", timeout=10)
+            response = await cls._get_client().get(
+                f"{cls._base_url}/health/", timeout=cls._timeouts['health']
+            )
 
             if response.status_code >= 400:
                 return {
@@ -171,7 +413,7 @@ class ApiController:
                     'services': error_shape,
                 }
             return data
-        except requests.RequestException as e:
+        except (httpx.HTTPError, ValueError) as e:
             return {
                 'status': 'error',
                 'message': f"Failed to connect to API: {str(e)}",
@@ -179,14 +421,37 @@ class ApiController:
                              'ollama': {'available': False, 'error': str(e)}},
             }
 
+    @classmethod
+    async def _post_with_retry(cls, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        """
+        POST that backs off while the worker reports a full inference queue
+        (429 + Retry-After). Any other error status is raised immediately.
+        """
+        client = cls._get_client()
+        for attempt in range(cls._busy_retries + 1):
+            response = await client.post(url, timeout=cls._timeouts[endpoint], **kwargs)
+            if response.status_code != 429 or attempt == cls._busy_retries:
+                response.raise_for_status()
+                return response
+            await asyncio.sleep(cls._retry_after(response))
+
+    @classmethod
+    def _retry_after(cls, response: httpx.Response) -> float:
+        try:
+            wait = float(response.headers.get('Retry-After', 1))
+        except ValueError:
+            wait = 1.0
+        return min(max(wait, 0.5), cls._busy_max_wait)
+
     @staticmethod
-    def _handle_request_error(error: requests.RequestException) -> None:
-        """Translate a requests exception into a RuntimeError with detail."""
-        if getattr(error, 'response', None) is not None:
-            status_code = error.response.status_code
+    def _handle_request_error(error: httpx.HTTPError) -> None:
+        """Translate an httpx exception into a RuntimeError with detail."""
+        response = getattr(error, 'response', None) if isinstance(error, httpx.HTTPStatusError) else None
+        if response is not None:
+            status_code = response.status_code
             try:
-                detail = error.response.json().get('detail', error.response.reason)
-            except (ValueError, json.JSONDecodeError):
-                detail = error.response.text or error.response.reason or 'Unknown error'
+                detail = response.json().get('detail', response.reason_phrase)
+            except (ValueError, json.JSONDecodeError, AttributeError):
+                detail = response.text or response.reason_phrase or 'Unknown error'
             raise RuntimeError(f"API error ({status_code}): {detail}")
         raise RuntimeError(f"API request failed: {str(error)}")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Przetwarzanie PCM z Discorda przy odbiorze (wątek voice-recv).
+
+Discord wysyła 48 kHz, 16-bit, stereo (192 000 B/s), a Whisper i tak liczy
+na 16 kHz mono (32 000 B/s). Konwersja od razu przy odbiorze zmniejsza 6x
+wszystko, co dalej trzymamy w RAM, zapisujemy na dysk i wysyłamy do API.
+Tutaj też kodowanie wypowiedzi do wysyłki (FLAC/Opus) - patrz ``encode_pcm``.
+"""
+import io
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+try:  # kodowanie FLAC/Opus (libsndfile); bez niego wysyłamy surowe PCM
+    import soundfile as sf
+except (ImportError, OSError):
+    sf = None
+
+# Parametry konwersji: 48 kHz stereo -> 16 kHz mono.
+SRC_RATE = 48000
+DST_RATE = 16000
+DECIMATION = SRC_RATE // DST_RATE
+
+
+def _lowpass_taps(factor: int, numtaps: int) -> np.ndarray:
+    """Filtr antyaliasingowy (okienkowany sinc) pod decymację o ``factor``."""
+    n = np.arange(numtaps) - (numtaps - 1) / 2
+    cutoff = 0.45 / factor   # trochę poniżej Nyquista docelowej częstotliwości
+    h = np.sinc(2 * cutoff * n) * np.hamming(numtaps)
+    return (h / h.sum()).astype(np.float32)
+
+
+class StereoDownsampler:
+    """
+    Stereo 48 kHz int16 -> mono 16 kHz int16, ramka po ramce (20 ms = 960 próbek).
+
+    Decymator polifazowy 3:1: filtr liczony jest TYLKO dla zachowywanych próbek
+    (co trzeciej), a historia filtra i faza przechodzą między ramkami, więc
+    wynik jest ciągły niezależnie od długości kolejnych ramek.
+    Jeden obiekt na mówcę - używany wyłącznie z wątku odbioru.
+    """
+
+    def __init__(self, factor: int = DECIMATION, numtaps: int = 48):
+        self.factor = factor
+        self._taps = _lowpass_taps(factor, numtaps)[::-1].copy()
+        self._hist = np.zeros(numtaps - 1, dtype=np.float32)
+        self._phase = 0
+
+    def process(self, pcm: bytes) -> bytes:
+        x = np.frombuffer(pcm, dtype="<i2")
+        if len(x) % 2:
+            x = x[:-1]
+        mono = x.reshape(-1, 2).mean(axis=1, dtype=np.float32)
+        buf = np.concatenate((self._hist, mono))
+        windows = sliding_window_view(buf, len(self._taps))[self._phase::self.factor]
+        y = windows @ self._taps
+        self._phase = (self._phase - len(mono)) % self.factor
+        self._hist = buf[len(buf) - len(self._hist):]
+        return np.clip(np.rint(y), -32768, 32767).astype("<i2").tobytes()
+
+
+# Kodowania wysyłki do whisper-api: nazwa -> (format, subtype) soundfile.
+WIRE_FORMATS = {
+    "flac": ("FLAC", "PCM_16"),   # bezstratnie, ~2x mniej niż PCM
+    "opus": ("OGG", "OPUS"),      # stratnie, kilkanaście razy mniej
+}
+
+
+def local_encodings():
+    """Kodowania, które potrafimy tu wyprodukować ("pcm" zawsze)."""
+    encodings = ["pcm"]
+    if sf is not None:
+        if "FLAC" in sf.available_formats():
+            encodings.append("flac")
+        if "OPUS" in sf.available_subtypes("OGG"):
+            encodings.append("opus")
+    return encodings
+
+
+def encode_pcm(pcm: bytes, rate: int, channels: int, encoding: str) -> bytes:
+    """int16 LE (kanały przeplatane) -> FLAC albo Ogg/Opus w pamięci."""
+    fmt, subtype = WIRE_FORMATS[encoding]
+    data = np.frombuffer(pcm, dtype="<i2").reshape(-1, channels)
+    buf = io.BytesIO()
+    sf.write(buf, data, rate, format=fmt, subtype=subtype)
+    return buf.getvalue()
@@ -1,39 +1,180 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import time
-import audioop
 import datetime
 import threading
-from collections import defaultdict
+from collections import deque
 
+import numpy as np
 from discord.ext import voice_recv
 
+from utils.audio_dsp import StereoDownsampler, SRC_RATE, DST_RATE
+from utils.vad import SpeechGate, make_vad
+
+# Cisza zostawiana za ostatnią ramką mowy (reszta "hangover" jest obcinana).
+TRAIL_PAD_SEC = 0.1
+# Podział długiej wypowiedzi: szukamy najcichszego miejsca w tylu ostatnich
+# sekundach przed docelową długością, energią uśrednianą w oknie SPLIT_SMOOTH_SEC.
+SPLIT_SEARCH_SEC = 8.0
+SPLIT_FRAME_SEC = 0.02
+SPLIT_SMOOTH_SEC = 0.1
+
+
+class PCMRing:
+    """
+    Prealokowany bufor cykliczny PCM jednego mówcy.
+
+    Pozycje są bezwzględne (liczba bajtów zapisanych od początku), więc
+    wypowiedź to po prostu zakres ``[begin, end)``. Jeden producent (wątek
+    odbioru: ``append``, pisze tylko ``write_pos``) i jeden konsument (pętla
+    zdarzeń: ``view``/``release``, pisze tylko ``read_pos``) - bez blokad. ``view`` oddaje zakres
+    jako ``memoryview`` bez kopiowania (kopia tylko, gdy zakres zawija się
+    przez koniec bufora - raz na ``capacity`` bajtów). Miejsca nie można
+    nadpisać, dopóki konsument go nie zwolni (``release``); ``append`` ramki,
+    która się nie mieści, zwraca False i niczego nie zapisuje.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self.write_pos = 0
+        self.read_pos = 0
+
+    @property
+    def used(self) -> int:
+        return self.write_pos - self.read_pos
+
+    def append(self, data) -> bool:
+        n = len(data)
+        if n > self.capacity - self.used:
+            return False
+        src = memoryview(data)
+        i = self.write_pos % self.capacity
+        first = min(n, self.capacity - i)
+        self._buf[i:i + first] = src[:first]
+        if first < n:
+            self._buf[:n - first] = src[first:]
+        self.write_pos += n
+        return True
+
+    def view(self, begin: int, end: int):
+        i = begin % self.capacity
+        n = end - begin
+        mv = memoryview(self._buf)
+        if i + n <= self.capacity:
+            return mv[i:i + n]
+        return b"".join((mv[i:], mv[:i + n - self.capacity]))
+
+    def release(self, end: int):
+        self.read_pos = max(self.read_pos, min(end, self.write_pos))
+
+
+class _Speaker:
+    """Stan jednego mówcy; ``lock`` chroni tylko jego aktywną wypowiedź."""
+    __slots__ = ("uid", "display", "lock", "ring", "raw_ring", "active", "done",
+                 "downsampler", "gate", "preroll")
+
+    def __init__(self, uid, display, ring, raw_ring, gate):
+        self.uid = uid
+        self.display = display
+        self.lock = threading.Lock()
+        self.ring = ring
+        self.raw_ring = raw_ring
+        # {"start": datetime, "last_mono": float, "begin": int, "end": int,
+        #  "speech_end": int, ["raw_begin", "raw_end", "raw_speech_end"]} albo None
+        self.active = None
+        self.done = deque()     # zamknięte wypowiedzi czekające na odbiór
+        self.downsampler = None
+        self.gate = gate        # VAD tego mówcy (własny poziom szumu)
+        self.preroll = deque()  # (pcm, raw, sekundy) - ostatnie ramki ciszy
+
 
 class PerUserPCMSink(voice_recv.AudioSink):
     """
     Zbiera PCM osobno dla każdego użytkownika, dzieląc na WYPOWIEDZI
     (nowa wypowiedź po przerwie > ``utterance_gap`` s; każda ma znacznik czasu).
 
-    Bezpieczny wątkowo: ``write`` woła wątek odbioru, a ``pop_completed`` /
-    ``drain_all`` woła pętla asynchroniczna (przetwarzanie przyrostowe, aby nie
-    trzymać całej sesji w pamięci).
+    ``write`` woła wątek odbioru, a ``pop_completed`` / ``drain_all`` /
+    ``has_audio`` - pętla asynchroniczna (przetwarzanie przyrostowe, aby nie
+    trzymać całej sesji w pamięci). Nie ma wspólnej blokady: każdy mówca ma
+    własny stan (``_Speaker``) i własną blokadę tylko na aktywną wypowiedź
+    (obie strony trzymają ją przez kilka przypisań; miejsca podziału długiej
+    wypowiedzi pętla szuka już bez niej). Wypowiedzi zamknięte przez ``write``
+    przechodzą do pętli przez kolejkę SPSC (``deque``: dopisuje tylko wątek
+    odbioru, zdejmuje tylko pętla), a ``has_audio`` to porównanie dwóch
+    liczników - bez przeglądania wypowiedzi.
+
+    Audio mówcy trafia do jego ``PCMRing`` (``buffer_sec`` sekund, alokowany
+    przy pierwszej wypowiedzi), a wypowiedź to zakres w nim. Zakończone
+    wypowiedzi wychodzą jako ``memoryview`` na bufor (bez kopii) z funkcją
+    ``release`` - wołający MUSI ją wywołać, gdy skończy z audio (inaczej
+    bufor się zapełni i kolejne ramki będą odrzucane: ``stats["overflow_drops"]``).
+
+    Przed buforem każda ramka przechodzi przez VAD (``utils.vad``, backend
+    ``vad_backend``) - także w trybie ręcznym; ``rms_threshold`` jest tylko
+    dodatkowym minimum głośności. Cisza nie trafia do bufora (poza krótkim
+    "preroll" przed mową), a końcówka ciszy po mowie (``hangover_ms``) jest
+    obcinana przy wydawaniu wypowiedzi - do Whispera idzie sama mowa.
+
+    ``downsample=True`` zamienia każdą ramkę od razu na 16 kHz mono (format
+    Whispera, 6x mniej danych). ``keep_full_rate=True`` dodatkowo zachowuje
+    oryginalne 48 kHz stereo w kluczu ``raw`` - do archiwum audio.
     """
 
-    def __init__(self, rms_threshold: int = 0, utterance_gap: float = 1.5):
+    def __init__(self, rms_threshold: int = 0, utterance_gap: float = 1.5,
+                 downsample: bool = False, keep_full_rate: bool = False,
+                 buffer_sec: float = 180.0, vad_backend: str = "numpy",
+                 hangover_ms: float = 300):
         super().__init__()
         self.rms_threshold = rms_threshold
+        self.vad_backend = vad_backend
+        self.hangover_ms = hangover_ms
         self.utterance_gap = utterance_gap
-        self._lock = threading.Lock()
-        # uid -> lista wypowiedzi: {"start": datetime, "last_mono": float, "pcm": bytearray}
-        self.utterances = defaultdict(list)
-        self.users = {}          # uid -> display_name
+        self.downsample = downsample
+        self.keep_full_rate = keep_full_rate and downsample
+        self.sample_rate = DST_RATE if downsample else SRC_RATE
+        self.channels = 1 if downsample else 2
+        self._bytes_per_sec = self.sample_rate * self.channels * 2
+        self.buffer_sec = buffer_sec
+        self._trail_pad = int(TRAIL_PAD_SEC * self._bytes_per_sec) // 4 * 4
+        self._raw_trail_pad = int(TRAIL_PAD_SEC * SRC_RATE * 4) // 4 * 4
+        self._speakers = {}                     # uid -> _Speaker
+        self._speakers_lock = threading.Lock()  # tylko przy dodaniu mówcy
+        # Bajty PCM przyjęte (pisze tylko wątek odbioru) i odebrane (pisze
+        # tylko pętla) - różne = w sinku czeka audio.
+        self._captured = 0
+        self._taken = 0
         self.last_sound = time.monotonic()
         self.started_at = None
-        self.stats = {"writes": 0, "none_user": 0, "empty_pcm": 0, "silence": 0}
+        self.stats = {"writes": 0, "none_user": 0, "empty_pcm": 0, "silence": 0,
+                      "overflow_drops": 0, "trimmed_bytes": 0}
 
     def wants_opus(self) -> bool:
         return False
 
+    def _ring(self, bytes_per_sec):
+        # Wielokrotność 4 B - ramka int16 stereo nigdy nie zawija się w połowie.
+        return PCMRing(max(4, int(self.buffer_sec * bytes_per_sec) // 4 * 4))
+
+    def _speaker(self, uid, user):
+        sp = self._speakers.get(uid)
+        if sp is None:
+            sp = _Speaker(
+                uid, getattr(user, "display_name", None) or uid,
+                self._ring(self._bytes_per_sec),
+                self._ring(SRC_RATE * 4) if self.keep_full_rate else None,
+                SpeechGate(make_vad(self.vad_backend, self.sample_rate), self.hangover_ms),
+            )
+            if self.downsample:
+                sp.downsampler = StereoDownsampler()
+            with self._speakers_lock:
+                self._speakers[uid] = sp
+        return sp
+
+    def _snapshot(self):
+        with self._speakers_lock:
+            return list(self._speakers.values())
+
     def write(self, user, data: voice_recv.VoiceData):
         try:
             self.stats["writes"] += 1
@@ -45,100 +186,248 @@ class PerUserPCMSink(voice_recv.AudioSink):
                 self.stats["empty_pcm"] += 1
                 return
 
-            if self.rms_threshold > 0:
-                try:
-                    if audioop.rms(pcm, 2) < self.rms_threshold:
-                        self.stats["silence"] += 1
-                        return
-                except Exception:
-                    pass
-
             now = time.monotonic()
             uid = str(user.id)
-            with self._lock:
-                self.users[uid] = getattr(user, "display_name", None) or uid
-                segs = self.utterances[uid]
-                if not segs or (now - segs[-1]["last_mono"]) > self.utterance_gap:
-                    segs.append({
+            sp = self._speaker(uid, user)
+            sp.display = getattr(user, "display_name", None) or sp.display
+            raw = pcm
+            if sp.downsampler is not None:
+                pcm = sp.downsampler.process(raw)
+            samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+            if self.channels == 2:
+                samples = samples.reshape(-1, 2).mean(axis=1)
+            try:
+                state = sp.gate.feed(samples, self.rms_threshold)
+            except Exception:
+                state = "speech"  # VAD zawiódł - lepiej przepuścić niż zgubić mowę
+            duration = len(samples) / self.sample_rate
+            if state is None:
+                self.stats["silence"] += 1
+                sp.preroll.append((pcm, raw, duration))
+                held = sum(f[2] for f in sp.preroll)
+                while sp.preroll and held - sp.preroll[0][2] >= sp.gate.preroll:
+                    held -= sp.preroll.popleft()[2]
+                return
+            frames = list(sp.preroll) + [(pcm, raw, duration)]
+            sp.preroll.clear()
+
+            ring, raw_ring = sp.ring, sp.raw_ring
+            # Ramki w całości albo wcale (pcm i raw muszą się zgadzać).
+            size = sum(len(f[0]) for f in frames)
+            if size > ring.capacity - ring.used or (
+                    raw_ring is not None
+                    and sum(len(f[1]) for f in frames) > raw_ring.capacity - raw_ring.used):
+                self.stats["overflow_drops"] += 1
+                return
+            with sp.lock:
+                seg = sp.active
+                if seg is None or (now - seg["last_mono"]) > self.utterance_gap:
+                    if seg is not None:
+                        sp.done.append(seg)
+                    seg = sp.active = {
                         "start": datetime.datetime.now(),
                         "last_mono": now,
-                        "pcm": bytearray(),
-                    })
-                seg = segs[-1]
-                seg["pcm"].extend(pcm)
+                        "begin": ring.write_pos,
+                        "end": ring.write_pos,
+                        "speech_end": ring.write_pos,
+                    }
+                    if raw_ring is not None:
+                        seg["raw_begin"] = seg["raw_end"] = seg["raw_speech_end"] = raw_ring.write_pos
+                for f_pcm, f_raw, _ in frames:
+                    ring.append(f_pcm)
+                    if raw_ring is not None:
+                        raw_ring.append(f_raw)
+                seg["end"] = ring.write_pos
+                if state == "speech":
+                    seg["speech_end"] = seg["end"]
+                if raw_ring is not None:
+                    seg["raw_end"] = raw_ring.write_pos
+                    if state == "speech":
+                        seg["raw_speech_end"] = seg["raw_end"]
                 seg["last_mono"] = now
-                self.last_sound = now
-                if self.started_at is None:
-                    self.started_at = now
+            self._captured += size
+            self.last_sound = now
+            if self.started_at is None:
+                self.started_at = now
         except Exception:
             pass
 
     def has_audio(self) -> bool:
-        with self._lock:
-            return any(any(s["pcm"] for s in segs) for segs in self.utterances.values())
+        return self._captured != self._taken
 
     def silent_for(self) -> float:
         return time.monotonic() - self.last_sound
 
-    # Discord PCM: 48000 Hz * 2 kanały * 2 bajty = 192000 B/s.
-    _BYTES_PER_SEC = 192000
+    def _item(self, sp, seg):
+        ring, raw_ring = sp.ring, sp.raw_ring
+        end, raw_end = seg["end"], seg.get("raw_end")
+        self._taken += end - seg["begin"]
+
+        def release():
+            ring.release(end)
+            if raw_ring is not None and raw_end is not None:
+                raw_ring.release(raw_end)
+
+        # Bez ciszy z "hangover" na końcu (zwalniamy jednak cały zakres);
+        # wypowiedź bez mowy (sam preroll/hangover) ma pusty ``pcm``.
+        speech = seg["speech_end"] > seg["begin"]
+        trimmed = min(end, seg["speech_end"] + self._trail_pad) if speech else seg["begin"]
+        self.stats["trimmed_bytes"] += end - trimmed
+        item = {
+            "uid": sp.uid,
+            "display": sp.display,
+            "start": seg["start"],
+            "pcm": ring.view(seg["begin"], trimmed),
+            "rate": self.sample_rate,
+            "channels": self.channels,
+            "release": release,
+        }
+        if raw_ring is not None and "raw_begin" in seg:
+            raw_trimmed = (min(raw_end, seg["raw_speech_end"] + self._raw_trail_pad)
+                           if speech else seg["raw_begin"])
+            item["raw"] = raw_ring.view(seg["raw_begin"], raw_trimmed)
+        return item
 
-    def pop_completed(self, min_idle: float, max_seconds: float = 0):
+    def _emit(self, sp, seg, out):
+        # Także bez mowy (pusty ``pcm``): zwolnienie teraz oddałoby też
+        # wcześniejsze wypowiedzi mówcy, które wołający jeszcze przetwarza.
+        if seg["end"] > seg["begin"]:
+            out.append(self._item(sp, seg))
+
+    def _emit_owned(self, sp, seg, target_bytes, out):
+        """Zamknięta wypowiedź (pisarz już jej nie dotyka) -> kawałki <= celu."""
+        while target_bytes and seg["end"] - seg["begin"] >= target_bytes:
+            self._emit(sp, self._split(seg, self._split_point(sp, seg["begin"], target_bytes)), out)
+        self._emit(sp, seg, out)
+
+    def _split_point(self, sp, begin, target_bytes):
+        """
+        Najcichsze miejsce (granica ramki) w ostatnich ``SPLIT_SEARCH_SEC``
+        przed ``begin + target_bytes`` - tam tniemy, żeby nie przeciąć słowa.
+        Czyta tylko zapisany i niezwolniony zakres bufora - bez ``sp.lock``.
         """
-        Zwraca ZAKOŃCZONE wypowiedzi i usuwa je z pamięci. Wypowiedź jest
-        zakończona, gdy: nie jest ostatnią (aktywną), albo była bezczynna dłużej
-        niż min_idle, albo przekroczyła max_seconds (twardy limit długiego
-        monologu - domykamy chunk, mowa płynie dalej w nowej wypowiedzi).
-        Element: {"uid", "display", "start", "pcm"(bytes)}.
+        frame = max(2, int(SPLIT_FRAME_SEC * self._bytes_per_sec) // 4 * 4)
+        hi = begin + max(1, target_bytes // frame) * frame
+        lo = max(begin + frame, hi - int(SPLIT_SEARCH_SEC * self._bytes_per_sec) // frame * frame)
+        if hi - lo < frame:
+            return hi
+        x = np.frombuffer(sp.ring.view(lo, hi), dtype="<i2").astype(np.float32)
+        energy = np.mean((x * x).reshape(-1, frame // 2), axis=1)
+        k = max(1, int(round(SPLIT_SMOOTH_SEC / SPLIT_FRAME_SEC)))
+        if len(energy) > k:
+            energy = np.convolve(energy, np.ones(k) / k, mode="same")
+        # Przy remisie (np. kilka ramek ciszy) - najpóźniejsza, by okno było pełne.
+        i = len(energy) - 1 - int(np.argmin(energy[::-1]))
+        return lo + i * frame
+
+    def _split(self, seg, at):
+        """Odcina i zwraca ``[begin, at)``; ``seg`` zaczyna się odtąd w ``at``."""
+        head = dict(seg, end=at, speech_end=min(seg["speech_end"], at))
+        offset = (at - seg["begin"]) / self._bytes_per_sec
+        if "raw_begin" in seg:
+            # Ramki pcm i raw są zapisywane parami, więc proporcja czasu się zgadza.
+            raw_at = seg["raw_begin"] + (at - seg["begin"]) * SRC_RATE * 4 // self._bytes_per_sec // 4 * 4
+            raw_at = min(seg["raw_end"], raw_at)
+            head["raw_end"] = raw_at
+            head["raw_speech_end"] = min(seg["raw_speech_end"], raw_at)
+            seg["raw_begin"] = raw_at
+            seg["raw_speech_end"] = max(seg["raw_speech_end"], raw_at)
+        seg["begin"] = at
+        seg["speech_end"] = max(seg["speech_end"], at)
+        seg["start"] = seg["start"] + datetime.timedelta(seconds=offset)
+        return head
+
+    def _split_active(self, sp, target_bytes, out):
+        """
+        Tnie aktywną wypowiedź na kawałki <= celu. Szukanie miejsca (NumPy)
+        idzie bez blokady - ``write`` w tym czasie dalej dopisuje - a pod
+        ``sp.lock`` tylko odczyt granic i przesunięcie początku.
+        """
+        while target_bytes:
+            with sp.lock:
+                seg = sp.active
+                if seg is None or seg["end"] - seg["begin"] < target_bytes:
+                    return
+                begin = seg["begin"]
+            at = self._split_point(sp, begin, target_bytes)
+            with sp.lock:
+                if sp.active is not seg:
+                    return  # pisarz ją zamknął (przerwa) - jest już w ``done``
+                head = self._split(seg, at)
+            self._emit(sp, head, out)
+
+    def pop_completed(self, min_idle: float, max_seconds: float = 0, target_seconds: float = 0):
+        """
+        Zwraca ZAKOŃCZONE wypowiedzi. Wypowiedź jest zakończona, gdy: nie jest
+        ostatnią (aktywną), albo była bezczynna dłużej niż min_idle, albo
+        przekroczyła max_seconds (twardy limit długiego monologu - domykamy
+        chunk, mowa płynie dalej w nowej wypowiedzi), albo zajmuje pół bufora
+        mówcy (żeby monolog go nie zapchał).
+
+        ``target_seconds`` (np. 28 - tuż poniżej 30-sekundowego okna Whispera)
+        dzieli wypowiedź dłuższą niż cel w najcichszym miejscu przed nim:
+        początek wychodzi jako osobny chunk, reszta zostaje aktywna i rośnie
+        dalej - każde wywołanie Whispera dostaje niemal pełne okno, a cięcie
+        nie wypada w środku słowa.
+
+        Kolejność w mówcy = kolejność w jego buforze (zwalnianie ``release``
+        w tej kolejności nie zwolni audio, które jeszcze czeka).
+
+        Element: {"uid", "display", "start", "pcm"(memoryview), "rate",
+        "channels", "release", opcjonalnie "raw"(memoryview, 48 kHz stereo)}.
+        Pusty ``pcm`` = wypowiedź bez mowy (sam preroll/hangover) - nic do
+        transkrypcji, ale ``release`` też trzeba wywołać w kolejności.
         """
         now = time.monotonic()
+        target_bytes = int(target_seconds * self._bytes_per_sec)
         out = []
-        with self._lock:
-            for uid in list(self.utterances.keys()):
-                segs = self.utterances[uid]
-                keep = []
-                for i, s in enumerate(segs):
-                    is_last = (i == len(segs) - 1)
-                    idle = now - s["last_mono"]
-                    dur = len(s["pcm"]) / self._BYTES_PER_SEC
-                    completed = (
-                        (not is_last)
-                        or idle > min_idle
-                        or (max_seconds and dur >= max_seconds)
-                    )
-                    if completed:
-                        if s["pcm"]:
-                            out.append({
-                                "uid": uid,
-                                "display": self.users.get(uid, uid),
-                                "start": s["start"],
-                                "pcm": bytes(s["pcm"]),
-                            })
+        for sp in self._snapshot():
+            # ``done`` dopisuje tylko ``write``, a stąd tylko zdejmujemy (SPSC).
+            while sp.done:
+                self._emit_owned(sp, sp.done.popleft(), target_bytes, out)
+            self._split_active(sp, target_bytes, out)
+            while sp.done:  # zamknięta przez pisarza w trakcie podziału
+                self._emit_owned(sp, sp.done.popleft(), target_bytes, out)
+            with sp.lock:
+                seg = sp.active
+                if seg is not None:
+                    size = seg["end"] - seg["begin"]
+                    if (now - seg["last_mono"] > min_idle
+                            or (max_seconds and size / self._bytes_per_sec >= max_seconds)
+                            or size >= sp.ring.capacity // 2):
+                        sp.active = None
                     else:
-                        keep.append(s)
-                if keep:
-                    self.utterances[uid] = keep
-                else:
-                    del self.utterances[uid]
+                        seg = None
+            if seg is not None:
+                self._emit_owned(sp, seg, target_bytes, out)
         return out
 
-    def drain_all(self):
+    def drain_all(self, target_seconds: float = 0):
         """Zwraca WSZYSTKIE pozostałe wypowiedzi i czyści sink (do finalizacji)."""
+        target_bytes = int(target_seconds * self._bytes_per_sec)
         out = []
-        with self._lock:
-            for uid, segs in self.utterances.items():
-                for s in segs:
-                    if s["pcm"]:
-                        out.append({
-                            "uid": uid,
-                            "display": self.users.get(uid, uid),
-                            "start": s["start"],
-                            "pcm": bytes(s["pcm"]),
-                        })
-            self.utterances = defaultdict(list)
-            self.started_at = None
-            self.last_sound = time.monotonic()
+        for sp in self._snapshot():
+            while sp.done:
+                self._emit_owned(sp, sp.done.popleft(), target_bytes, out)
+            with sp.lock:
+                seg, sp.active = sp.active, None
+            if seg is not None:
+                self._emit_owned(sp, seg, target_bytes, out)
+        self.started_at = None
+        self.last_sound = time.monotonic()
         return out
 
+    def buffer_stats(self):
+        """Zajętość buforów mówców (bajty) i liczba odrzuconych ramek."""
+        speakers = self._snapshot()
+        return {
+            "speakers": len(speakers),
+            "used": sum(sp.ring.used for sp in speakers),
+            "capacity": sum(sp.ring.capacity for sp in speakers),
+            "overflow_drops": self.stats["overflow_drops"],
+            "silence": self.stats["silence"],
+            "trimmed_bytes": self.stats["trimmed_bytes"],
+        }
+
     def cleanup(self):
         pass
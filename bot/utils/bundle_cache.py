@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dyskowy cache LRU gotowych paczek ZIP (``/recordings <ID>``).
+
+Klucz to ID nagrania + wersja treści (nazwa, podsumowania, obecność audio)
++ limit rozmiaru, dla którego paczka powstała (od niego zależy, czy audio
+weszło). Wpis to plik ``<katalog>/<id>__<wersja>__<limit>[.na].zip``
+(``.na`` = audio pominięte); kolejność LRU w pamięci, odtwarzana z mtime
+przy starcie, trafienie odświeża mtime. Zmiana nagrania w magazynie
+(zdarzenia "update"/"delete") od razu usuwa jego paczki.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class BundleCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # nazwa pliku -> rozmiar
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def version(session) -> str:
+        """Skrót tego, co trafia do paczki (poza samym transkryptem, który się nie zmienia)."""
+        material = json.dumps({
+            "name": session.get("name") or "",
+            "summaries": [sm.get("file") for sm in session.get("summaries", [])],
+            "has_audio": bool(session.get("has_audio")),
+            "audio": [e.get("file") for e in session.get("audio", [])],
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(material.encode("utf-8")).hexdigest()[:12]
+
+    def _prefix(self, session_id):
+        return f"{session_id.lower()}__"
+
+    def _name(self, session, limit_bytes, omitted):
+        return f"{self._prefix(session['id'])}{self.version(session)}__{limit_bytes}{'.na' if omitted else ''}.zip"
+
+    def _load(self):
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)  # niedokończony zapis sprzed restartu
+                continue
+            if not name.endswith(".zip"):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found.append((st.st_mtime, name, st.st_size))
+        for _mtime, name, size in sorted(found):
+            self._entries[name] = size
+            self._bytes += size
+        self._evict()
+
+    def get(self, session, limit_bytes):
+        """(otwarty plik paczki, czy pominięto audio) albo None."""
+        if not self.enabled:
+            return None
+        for omitted in (False, True):
+            name = self._name(session, limit_bytes, omitted)
+            with self._lock:
+                if name not in self._entries:
+                    continue
+                self._entries.move_to_end(name)
+            path = os.path.join(self.directory, name)
+            try:
+                f = open(path, "rb")
+                os.utime(path)
+            except OSError:
+                self._drop(name)
+                continue
+            self.stats["hits"] += 1
+            return f, omitted
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, session, limit_bytes, fileobj, omitted):
+        """Kopiuje gotową paczkę do cache (strumieniowo) i przewija ``fileobj``."""
+        if not self.enabled:
+            return
+        name = self._name(session, limit_bytes, omitted)
+        path = os.path.join(self.directory, name)
+        tmp = path + ".tmp"
+        fileobj.seek(0)
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        fileobj.seek(0)
+        # Nagranie mogło się zmienić w trakcie budowania - wtedy paczka już
+        # jest nieaktualna, ale inna wersja = inny klucz, więc nikt jej nie
+        # dostanie; wyleci przy najbliższym unieważnieniu albo z LRU.
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+        self._evict()
+
+    def invalidate(self, session_id):
+        """Usuwa wszystkie paczki nagrania."""
+        prefix = self._prefix(session_id)
+        with self._lock:
+            names = [n for n in self._entries if n.startswith(prefix)]
+        for name in names:
+            self._drop(name)
+        if names:
+            self.stats["invalidations"] += 1
+
+    def watch(self, store):
+        """Unieważnia paczki przy zmianie nagrania (set_name, add_summary, delete_*)."""
+        def on_event(event, session):
+            if event in ("update", "delete"):
+                self.invalidate(session["id"])
+        store.subscribe(on_event)
+
+    def _drop(self, name):
+        with self._lock:
+            self._bytes -= self._entries.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._bytes <= self.max_bytes or not self._entries:
+                    return
+                name = next(iter(self._entries))
+            self._drop(name)
+            self.stats["evictions"] += 1
+
+    def status(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                **self.stats,
+            }
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Eksport nagrania do ZIP-a (``/recordings <ID>``).
+
+Audio i pliki już skompresowane idą jako ``ZIP_STORED`` (deflate nic by
+nie dał, a kosztuje CPU), więc ich udział w archiwum znamy z rozmiarów
+plików co do bajtu, zanim cokolwiek zapiszemy. Kompresowany jest tylko
+tekst (transkrypt, podsumowania, info.json) - on idzie pierwszy, a potem
+wiadomo dokładnie, czy audio się zmieści. Jeśli nie, jest pomijane od
+razu - bez budowania drugiego archiwum.
+
+Archiwum zapisywane jest strumieniowo do ``SpooledTemporaryFile``: małe
+zostaje w RAM, większe ląduje na dysku, a pliki czytane są kawałkami
+przez ``zipfile`` - zużycie pamięci nie zależy od długości nagrania.
+"""
+import io
+import os
+import json
+import zipfile
+import tempfile
+
+from utils.storage import _safe
+
+# Powyżej tylu bajtów archiwum przechodzi z RAM do pliku tymczasowego.
+SPOOL_MAX_BYTES = 4 * 1024 * 1024
+
+# Audio i formaty już skompresowane - bez deflate.
+STORED_EXTENSIONS = {
+    ".wav", ".pcm", ".flac", ".opus", ".ogg", ".mp3", ".m4a", ".aac",
+    ".zip", ".gz", ".xz", ".bz2", ".zst", ".7z", ".png", ".jpg", ".jpeg", ".webp",
+}
+
+
+class Member:
+    """Jeden plik archiwum: z dysku (``path``) albo z pamięci (``data``)."""
+    __slots__ = ("arcname", "path", "data", "size", "compress", "audio")
+
+    def __init__(self, arcname, path=None, data=None, audio=False):
+        self.arcname = arcname
+        self.path = path
+        self.data = data.encode("utf-8") if isinstance(data, str) else data
+        self.size = os.path.getsize(path) if path is not None else len(self.data)
+        ext = os.path.splitext(path or arcname)[1].lower()
+        self.compress = not audio and ext not in STORED_EXTENSIONS
+        self.audio = audio
+
+    def local_bytes(self):
+        """Nagłówek lokalny + dane (dokładnie dla ZIP_STORED)."""
+        return zipfile.sizeFileHeader + len(self.arcname.encode("utf-8")) + self.size
+
+    def central_bytes(self):
+        """Wpis w katalogu centralnym."""
+        return zipfile.sizeCentralDir + len(self.arcname.encode("utf-8"))
+
+
+def plan_members(session, bundle):
+    """Lista plików archiwum (pliki znikające w międzyczasie są pomijane)."""
+    info = {
+        "id": session.get("id"),
+        "name": session.get("name") or "",
+        "created_at": session.get("created_at"),
+        "channel": session.get("channel"),
+        "participants": session.get("participants", []),
+    }
+    members = [Member("info.json", data=json.dumps(info, ensure_ascii=False, indent=2))]
+    if bundle.get("transcript_file"):
+        candidates = [("transkrypcja.txt", bundle["transcript_file"], False)]
+    else:
+        members.append(Member("transkrypcja.txt", data=bundle.get("transcript_text") or "(brak transkrypcji)"))
+        candidates = []
+    candidates += [(f"podsumowanie_{i}.txt", p, False) for i, p in enumerate(bundle.get("summaries", []), 1)]
+    candidates += [(f"audio/{_safe(display)}_{os.path.basename(p)}", p, True)
+                   for display, p in bundle.get("audio", [])]
+    for arcname, path, audio in candidates:
+        try:
+            members.append(Member(arcname, path=path, audio=audio))
+        except OSError:
+            pass
+    return members
+
+
+def build_zip(session, bundle, limit_bytes):
+    """
+    Buduje ZIP nagrania w pliku tymczasowym.
+
+    Najpierw tekst (deflate), potem audio (ZIP_STORED) - ale tylko jeśli
+    przewidywany rozmiar całości (dotychczasowy plik + nagłówki i dane audio
+    + katalog centralny, co do bajtu) mieści się w ``limit_bytes``.
+
+    Zwraca (plik ustawiony na początek albo None, czy pominięto audio,
+    rozmiar). None = nawet bez audio archiwum nie mieści się w limicie.
+    """
+    members = plan_members(session, bundle)
+    text = [m for m in members if not m.audio]
+    audio = [m for m in members if m.audio]
+
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        with zipfile.ZipFile(out, "w") as z:
+            for m in text:
+                _write(z, m)
+            predicted = (out.tell() + sum(m.local_bytes() for m in audio)
+                         + sum(m.central_bytes() for m in members) + zipfile.sizeEndCentDir)
+            omitted = bool(audio) and predicted > limit_bytes
+            if not omitted:
+                for m in audio:
+                    _write(z, m)
+        size = out.tell()
+        if size > limit_bytes:
+            out.close()
+            return None, omitted, size
+        out.seek(0)
+        return out, omitted, size
+    except BaseException:
+        out.close()
+        raise
+
+
+def _write(z, m):
+    method = zipfile.ZIP_DEFLATED if m.compress else zipfile.ZIP_STORED
+    if m.path is None:
+        z.writestr(m.arcname, m.data, compress_type=method)
+        return
+    try:
+        z.write(m.path, arcname=m.arcname, compress_type=method)
+    except OSError:
+        pass  # plik zniknął w międzyczasie (np. czyszczenie audio)
+
+
+def upload_file(archive):
+    """
+    Obiekt pliku dla ``discord.File``. Na Pythonie < 3.11
+    ``SpooledTemporaryFile`` nie dziedziczy z ``io.IOBase`` i discord.py
+    wziąłby go za ścieżkę - wtedy podajemy plik pod spodem (BytesIO albo
+    plik tymczasowy; zamknięcie ``archive`` zamyka i jego).
+    """
+    return archive if isinstance(archive, io.IOBase) else archive._file
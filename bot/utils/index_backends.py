@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backendy indeksu sesji dla TranscriptionStore.
+
+Oba trzymają sesje jako słowniki (ten sam model co w storage.py) i mają
+wspólny interfejs: ``all`` (od najnowszych), ``count``, ``page``, ``get``
+(id bez rozróżniania wielkości liter), ``put`` (insert/update), ``put_many``
+i ``delete``.
+
+- ``JsonIndex``   - index.json + dziennik zmian scalany w tle.
+- ``SqliteIndex`` - SQLite w trybie WAL; zapis dotyka jednego wiersza,
+  wyszukiwanie po id/dacie/kanale/uczestniku idzie po indeksach.
+
+Nad backendem stoi ``CachedIndex``: posortowany indeks w pamięci z rekordów
+``SessionRecord`` (``__slots__``), aktualizowany przy zapisach i przeładowywany,
+gdy plik/bazę zmieni ktoś z zewnątrz (``version()``). Odczyty oddają rekordy
+współdzielone - zmiany robi się na kopii (``SessionRecord.copy``).
+"""
+import os
+import copy
+import json
+import bisect
+import sqlite3
+import threading
+
+
+class SessionRecord:
+    """
+    Zwarty rekord sesji zgodny z dotychczasowym słownikiem: ``s["id"]``,
+    ``s.get(...)``, ``"audio" in s``, ``s.setdefault(...)``. Pola spoza
+    modelu (np. stary format ``transcripts``) lądują w ``extra``.
+    """
+    __slots__ = ("id", "name", "created_at", "channel", "participants",
+                 "transcript_file", "transcript_len", "audio", "summaries", "has_audio", "extra")
+    _FIELDS = __slots__[:-1]
+    _MISSING = object()
+
+    def __init__(self, data):
+        extra = {}
+        for k in self._FIELDS:
+            object.__setattr__(self, k, self._MISSING)
+        for k, v in data.items():
+            if k in self._FIELDS:
+                object.__setattr__(self, k, v)
+            else:
+                extra[k] = v
+        self.extra = extra
+
+    @property
+    def sort_key(self):
+        return self.get("created_at", ""), self.id
+
+    def __getitem__(self, key):
+        if key in self._FIELDS:
+            value = getattr(self, key)
+            if value is not self._MISSING:
+                return value
+        elif key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._FIELDS:
+            object.__setattr__(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        if key in self._FIELDS:
+            return getattr(self, key) is not self._MISSING
+        return key in self.extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def keys(self):
+        return [k for k in self._FIELDS if k in self] + list(self.extra)
+
+    def to_dict(self):
+        return {k: self[k] for k in self.keys()}
+
+    def copy(self):
+        """Głęboka kopia - do zmiany rekordu bez ruszania tego w indeksie."""
+        return SessionRecord(copy.deepcopy(self.to_dict()))
+
+    def __repr__(self):
+        return f"SessionRecord({self.id!r})"
+
+
+class JsonIndex:
+    """
+    index.json jako migawka + dziennik zmian (index.json.journal, JSON lines).
+
+    Zapis dopisuje do dziennika jedną linię ``{"op": "put"|"delete", ...}``
+    zamiast przepisywać cały plik. Odczyt = migawka + odtworzenie dziennika.
+    Gdy dziennik przekroczy ``journal_max_bytes``, wątek w tle scala go do
+    nowej migawki (operacje są idempotentne, więc awaria w trakcie scalania
+    niczego nie psuje - najwyżej część zmian zostanie odtworzona dwa razy).
+
+    ``fsync``: "always" (po każdym dopisaniu), "snapshot" (tylko przy
+    scalaniu) albo "never" (decyduje system).
+    """
+    name = "json"
+
+    def __init__(self, path: str, fsync: str = "always", journal_max_bytes: int = 256 * 1024):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.fsync = fsync if fsync in ("always", "snapshot", "never") else "always"
+        self.journal_max_bytes = journal_max_bytes
+        self._lock = threading.Lock()
+        self._compactor = None
+        if not os.path.exists(self.path):
+            self._write_snapshot([])
+
+    # ------------------------------------------------------------- pliki
+    def _load_snapshot(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _write_snapshot(self, data):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            if self.fsync != "never":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _replay(self, data, limit=None):
+        """Nakłada dziennik (do bajtu ``limit``) na listę sesji z migawki."""
+        try:
+            with open(self.journal_path, "rb") as f:
+                raw = f.read() if limit is None else f.read(limit)
+        except FileNotFoundError:
+            return data
+        pos = {s["id"].lower(): i for i, s in enumerate(data)}
+        for line in raw.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # urwana ostatnia linia po awarii
+            if entry.get("op") == "put":
+                session = entry["session"]
+                key = session["id"].lower()
+                if key in pos:
+                    data[pos[key]] = session
+                else:
+                    pos[key] = len(data)
+                    data.append(session)
+            elif entry.get("op") == "delete":
+                key = entry["id"].lower()
+                if key in pos:
+                    data[pos.pop(key)] = None
+        return [s for s in data if s is not None]
+
+    def _read(self):
+        with self._lock:
+            return self._replay(self._load_snapshot())
+
+    def _append(self, entries):
+        payload = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+        with self._lock:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(payload)
+                if self.fsync == "always":
+                    f.flush()
+                    os.fsync(f.fileno())
+            size = os.path.getsize(self.journal_path)
+        if size > self.journal_max_bytes:
+            self.compact(background=True)
+
+    def compact(self, background=False):
+        """Scala dziennik do migawki (domyślnie synchronicznie)."""
+        if background:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self.compact, daemon=True,
+                                               name="index-compactor")
+            self._compactor.start()
+            return
+        with self._lock:
+            try:
+                offset = os.path.getsize(self.journal_path)
+            except OSError:
+                return
+            data = self._replay(self._load_snapshot(), offset)
+        # Serializacja migawki bez blokady - zapisy w tym czasie trafiają
+        # do dziennika za ``offset`` i zostaną przeniesione niżej.
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            if self.fsync != "never":
+                f.flush()
+                os.fsync(f.fileno())
+        with self._lock:
+            with open(self.journal_path, "rb") as f:
+                f.seek(offset)
+                tail = f.read()
+            os.replace(tmp, self.path)
+            jtmp = self.journal_path + ".tmp"
+            with open(jtmp, "wb") as f:
+                f.write(tail)
+                if self.fsync != "never":
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(jtmp, self.journal_path)
+
+    # --------------------------------------------------------- interfejs
+    def version(self):
+        stamps = []
+        for path in (self.path, self.journal_path):
+            try:
+                st = os.stat(path)
+                stamps.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def all(self):
+        return sorted(self._read(), key=lambda s: s.get("created_at", ""), reverse=True)
+
+    def count(self):
+        return len(self._read())
+
+    def page(self, offset, limit):
+        return self.all()[offset:offset + limit]
+
+    def get(self, session_id):
+        sid = session_id.lower()
+        return next((s for s in self._read() if s["id"].lower() == sid), None)
+
+    def by_participant(self, user_id):
+        uid = str(user_id)
+        return [s for s in self.all()
+                if any(str(p.get("user_id")) == uid for p in s.get("participants", []))
+                or uid in s.get("transcripts", {})]
+
+    def put(self, session):
+        self.put_many([session])
+
+    def put_many(self, sessions):
+        if sessions:
+            self._append([{"op": "put", "session": s} for s in sessions])
+
+    def delete(self, session_id):
+        if self.get(session_id) is None:
+            return False
+        self._append([{"op": "delete", "id": session_id}])
+        return True
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.join()
+
+
+class SqliteIndex:
+    name = "sqlite"
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id         TEXT PRIMARY KEY COLLATE NOCASE,
+        created_at TEXT NOT NULL DEFAULT '',
+        channel    TEXT,
+        name       TEXT,
+        data       TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS sessions_created ON sessions(created_at);
+    CREATE INDEX IF NOT EXISTS sessions_channel ON sessions(channel);
+    CREATE TABLE IF NOT EXISTS participants (
+        session_id   TEXT NOT NULL COLLATE NOCASE
+                     REFERENCES sessions(id) ON DELETE CASCADE,
+        user_id      TEXT NOT NULL,
+        display_name TEXT
+    );
+    CREATE INDEX IF NOT EXISTS participants_user ON participants(user_id);
+    CREATE INDEX IF NOT EXISTS participants_session ON participants(session_id);
+    """
+
+    # Polityka fsync -> PRAGMA synchronous (w WAL: NORMAL = fsync przy checkpoincie).
+    _SYNCHRONOUS = {"always": "FULL", "snapshot": "NORMAL", "never": "OFF"}
+
+    def __init__(self, path: str, fsync: str = "always"):
+        self.path = path
+        # Wywołania przychodzą z różnych wątków (asyncio.to_thread), ale
+        # TranscriptionStore serializuje je własnym zamkiem.
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={self._SYNCHRONOUS.get(fsync, 'FULL')}")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(self._SCHEMA)
+
+    def version(self):
+        # Zmienia się po commitach z INNYCH połączeń - czyli dokładnie wtedy,
+        # gdy ktoś z zewnątrz zmienił bazę.
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    @staticmethod
+    def _participants(session):
+        if "participants" in session:
+            return [(str(p.get("user_id")), p.get("display_name")) for p in session["participants"]]
+        # stary format: transcripts[uid]
+        return [(str(uid), t.get("display_name", uid))
+                for uid, t in session.get("transcripts", {}).items()]
+
+    def all(self):
+        rows = self._db.execute("SELECT data FROM sessions ORDER BY created_at DESC, id DESC")
+        return [json.loads(r[0]) for r in rows]
+
+    def count(self):
+        return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def page(self, offset, limit):
+        rows = self._db.execute(
+            "SELECT data FROM sessions ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        )
+        return [json.loads(r[0]) for r in rows]
+
+    def get(self, session_id):
+        row = self._db.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def by_participant(self, user_id):
+        rows = self._db.execute(
+            "SELECT s.data FROM sessions s JOIN participants p ON p.session_id = s.id "
+            "WHERE p.user_id = ? ORDER BY s.created_at DESC, s.id DESC",
+            (str(user_id),),
+        )
+        return [json.loads(r[0]) for r in rows]
+
+    def put(self, session):
+        self.put_many([session])
+
+    def put_many(self, sessions):
+        with self._db:
+            self._db.execute("BEGIN")
+            for s in sessions:
+                self._db.execute(
+                    "INSERT INTO sessions (id, created_at, channel, name, data) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                    "created_at = excluded.created_at, channel = excluded.channel, "
+                    "name = excluded.name, data = excluded.data",
+                    (s["id"], s.get("created_at", ""), s.get("channel"), s.get("name"),
+                     json.dumps(s, ensure_ascii=False)),
+                )
+                self._db.execute("DELETE FROM participants WHERE session_id = ?", (s["id"],))
+                self._db.executemany(
+                    "INSERT INTO participants (session_id, user_id, display_name) VALUES (?, ?, ?)",
+                    [(s["id"], uid, disp) for uid, disp in self._participants(s)],
+                )
+
+    def delete(self, session_id):
+        with self._db:
+            self._db.execute("BEGIN")
+            cur = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        return cur.rowcount > 0
+
+    def close(self):
+        self._db.close()
+
+
+class CachedIndex:
+    """
+    Indeks w pamięci nad backendem: słownik po id (małe litery) + lista
+    rekordów posortowana rosnąco po (created_at, id). ``get`` to O(1),
+    ``page`` to O(strona). Zapisy idą do backendu, a dopiero po udanym
+    zapisie nowy rekord podmienia stary w pamięci; zmiana ``version()``
+    backendu (edycja z zewnątrz) powoduje pełne przeładowanie przy
+    następnym odczycie.
+
+    Zwracane rekordy są współdzielone przez wszystkich czytelników (także
+    z innych wątków) i nie wolno ich zmieniać - zapis to ``put`` kopii.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self._by_id = {}
+        self._linked = {}   # id (małe litery) -> klucz, pod którym rekord leży w _keys
+        self._keys = []
+        self._order = []
+        self._version = object()
+
+    def _fresh(self):
+        version = self.backend.version()
+        if version == self._version:
+            return
+        records = sorted((SessionRecord(s) for s in self.backend.all()), key=lambda r: r.sort_key)
+        self._by_id = {r.id.lower(): r for r in records}
+        self._linked = {r.id.lower(): r.sort_key for r in records}
+        self._order = records
+        self._keys = [r.sort_key for r in records]
+        self._version = version
+
+    def _unlink(self, rid):
+        key = self._linked.pop(rid, None)
+        if key is None:
+            return
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+            del self._order[i]
+
+    def _link(self, record):
+        rid, key = record.id.lower(), record.sort_key
+        i = bisect.bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self._order.insert(i, record)
+        self._linked[rid] = key
+        self._by_id[rid] = record
+
+    def all(self):
+        self._fresh()
+        return self._order[::-1]
+
+    def count(self):
+        self._fresh()
+        return len(self._order)
+
+    def page(self, offset, limit):
+        self._fresh()
+        end = len(self._order) - max(offset, 0)
+        if end <= 0 or limit <= 0:
+            return []
+        return self._order[max(end - limit, 0):end][::-1]
+
+    def get(self, session_id):
+        self._fresh()
+        return self._by_id.get(session_id.lower())
+
+    def by_participant(self, user_id):
+        uid = str(user_id)
+        return [r for r in self.all()
+                if any(str(p.get("user_id")) == uid for p in r.get("participants") or [])
+                or uid in r.get("transcripts", {})]
+
+    def put(self, session):
+        self.put_many([session])
+
+    def put_many(self, sessions):
+        self._fresh()
+        records = [s if isinstance(s, SessionRecord) else SessionRecord(s) for s in sessions]
+        self.backend.put_many([r.to_dict() for r in records])
+        for record in records:
+            self._unlink(record.id.lower())
+            self._link(record)
+        self._version = self.backend.version()
+
+    def delete(self, session_id):
+        self._fresh()
+        removed = self.backend.delete(session_id)
+        rid = session_id.lower()
+        self._unlink(rid)
+        self._by_id.pop(rid, None)
+        self._version = self.backend.version()
+        return removed
+
+    def close(self):
+        self.backend.close()
+
+
+def open_index(backend: str, base_dir: str, fsync: str = "always",
+               journal_max_bytes: int = 256 * 1024):
+    """
+    Otwiera indeks wybranego backendu. SQLite przy pierwszym uruchomieniu
+    jednorazowo importuje istniejący index.json (także stary format sesji
+    z per-user "transcripts"); plik zostaje jako index.json.imported.
+    """
+    json_path = os.path.join(base_dir, "index.json")
+    if (backend or "sqlite").lower() == "json":
+        return CachedIndex(JsonIndex(json_path, fsync, journal_max_bytes))
+
+    index = SqliteIndex(os.path.join(base_dir, "index.sqlite3"), fsync)
+    if os.path.exists(json_path) and index.count() == 0:
+        legacy = JsonIndex(json_path)
+        sessions = legacy.all()
+        index.put_many(sessions)
+        os.replace(json_path, json_path + ".imported")
+        if os.path.exists(legacy.journal_path):
+            os.replace(legacy.journal_path, legacy.journal_path + ".imported")
+        print(f"Zaimportowano {len(sessions)} nagrań z index.json do SQLite")
+    return CachedIndex(index)
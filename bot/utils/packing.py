@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pakowanie krótkich wypowiedzi w jedno okno Whispera.
+
+Większość wypowiedzi na Discordzie trwa 1-5 s, a Whisper i tak liczy
+pełne 30-sekundowe okno (resztę dopełnia ciszą) - GPU dekoduje głównie
+dopełnienie. Tu kilka kolejnych wypowiedzi (także różnych osób) jest
+sklejanych w jedno nagranie, rozdzielone krótką ciszą, i wysyłanych
+jednym żądaniem z zakresami części (``spans``). whisper-api przypisuje
+każde słowo części, w której zakresie leży jego środek, i filtruje
+halucynacje osobno dla każdej - z tego odtwarzamy linie per mówca, jak
+przy osobnych żądaniach.
+"""
+
+
+def duration(it) -> float:
+    """Długość wypowiedzi (s) z rozmiaru PCM int16."""
+    return len(it["pcm"]) / (it["rate"] * it["channels"] * 2)
+
+
+def plan_packs(items, window_sec: float, gap_sec: float):
+    """
+    Dzieli wypowiedzi (w kolejności) na grupy mieszczące się w ``window_sec``
+    razem z przerwami ``gap_sec`` między nimi. Wypowiedź dłuższa niż okno
+    idzie sama. Kolejność się nie zmienia.
+    """
+    packs, current, used = [], [], 0.0
+    for it in items:
+        d = duration(it)
+        need = d if not current else used + gap_sec + d
+        if current and (need > window_sec or it["rate"] != current[0]["rate"]
+                        or it["channels"] != current[0]["channels"]):
+            packs.append(current)
+            current, need = [], d
+        current.append(it)
+        used = need
+    if current:
+        packs.append(current)
+    return packs
+
+
+def build_pack(parts, gap_sec: float):
+    """
+    Skleja PCM wypowiedzi z ciszą pomiędzy (kopia - widoki na bufor sinka
+    nie są dalej potrzebne). Zwraca element potoku: {"parts", "pcm", "rate",
+    "channels", "spans"} - ``spans`` to (początek, koniec) każdej części w
+    sekundach sklejonego nagrania.
+    """
+    rate, channels = parts[0]["rate"], parts[0]["channels"]
+    frame = channels * 2
+    gap = bytes(int(gap_sec * rate) * frame)
+    pcm = bytearray()
+    spans = []
+    for i, it in enumerate(parts):
+        if i:
+            pcm += gap
+        begin = len(pcm) / (rate * frame)
+        pcm += it["pcm"]
+        spans.append((begin, len(pcm) / (rate * frame)))
+    return {"parts": parts, "pcm": pcm, "rate": rate, "channels": channels, "spans": spans}
+
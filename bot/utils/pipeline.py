@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Współbieżne przetwarzanie z zachowaniem kolejności wyników.
+
+Używane do transkrypcji wypowiedzi: kilka żądań do whisper-api leci naraz,
+ale transkrypt i „żywa" wiadomość dostają linie w kolejności zgłoszeń.
+"""
+import time
+import asyncio
+
+
+class OrderedPipeline:
+    """
+    ``submit(item)`` wraca od razu; ``worker(item)`` liczy się w tle (maks.
+    ``concurrency`` naraz, start w kolejności zgłoszeń), a ``on_results``
+    dostaje listę ``[(item, wynik), ...]`` ściśle w kolejności zgłoszeń -
+    wynik, który przyszedł wcześniej, czeka na swoich poprzedników.
+
+    Wszystkie metody wołane z pętli zdarzeń (bez blokad wątkowych).
+    """
+
+    def __init__(self, worker, on_results, concurrency: int = 4):
+        self._worker = worker
+        self._on_results = on_results
+        self.concurrency = max(1, int(concurrency))
+        self._cond = asyncio.Condition()
+        self._emit_lock = asyncio.Lock()
+        self._running = 0
+        self._next_seq = 0    # numer następnego zgłoszenia
+        self._start_seq = 0   # numer następnego zadania do uruchomienia
+        self._emit_seq = 0    # numer następnego wyniku do wydania
+        self._pending = {}    # seq -> (item, czas zgłoszenia) - jeszcze niewydane
+        self._done = {}       # seq -> wynik (czeka na poprzedników)
+        self._abandoned = set()  # anulowane przed startem - kolejka startu je pomija
+        self._tasks = set()
+        self.stats = {"submitted": 0, "completed": 0, "errors": 0, "max_depth": 0}
+
+    def submit(self, item):
+        seq = self._next_seq
+        self._next_seq += 1
+        self._pending[seq] = (item, time.monotonic())
+        self.stats["submitted"] += 1
+        self.stats["max_depth"] = max(self.stats["max_depth"], len(self._pending))
+        task = asyncio.create_task(self._run(seq, item))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def set_concurrency(self, value: int):
+        async with self._cond:
+            self.concurrency = max(1, int(value))
+            self._cond.notify_all()
+
+    def _skip_abandoned(self):
+        while self._start_seq in self._abandoned:
+            self._abandoned.discard(self._start_seq)
+            self._start_seq += 1
+
+    async def _run(self, seq, item):
+        result = None
+        started = False
+        try:
+            async with self._cond:
+                await self._cond.wait_for(
+                    lambda: self._start_seq == seq and self._running < self.concurrency
+                )
+                self._start_seq += 1
+                self._skip_abandoned()
+                self._running += 1
+                started = True
+                self._cond.notify_all()
+            result = await self._worker(item)
+        except Exception as e:  # noqa: BLE001
+            print(f"[pipeline] Błąd przetwarzania: {e}")
+            self.stats["errors"] += 1
+        except BaseException:
+            # Anulowanie (np. wyładowanie cog-a) - wynik None, ale kolejne
+            # elementy nie mogą czekać na ten numer w nieskończoność.
+            self.stats["errors"] += 1
+            raise
+        finally:
+            async with self._cond:
+                if started:
+                    self._running -= 1
+                else:
+                    self._abandoned.add(seq)
+                    self._skip_abandoned()
+                self._cond.notify_all()
+            self._done[seq] = result
+            self.stats["completed"] += 1
+            await self._emit()
+
+    async def _emit(self):
+        async with self._emit_lock:
+            batch = []
+            while self._emit_seq in self._done:
+                item, _ = self._pending.pop(self._emit_seq)
+                batch.append((item, self._done.pop(self._emit_seq)))
+                self._emit_seq += 1
+            if batch:
+                try:
+                    await self._on_results(batch)
+                except Exception as e:  # noqa: BLE001
+                    print(f"[pipeline] Błąd obsługi wyników: {e}")
+
+    async def drain(self):
+        """Czeka, aż wszystkie zgłoszone elementy zostaną przetworzone i wydane."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def status(self):
+        """Głębokość kolejki (zgłoszone, niewydane), w toku i opóźnienie (s)."""
+        oldest = min((t for _, t in self._pending.values()), default=None)
+        return {
+            "depth": len(self._pending),
+            "in_flight": self._running,
+            "concurrency": self.concurrency,
+            "lag_sec": round(time.monotonic() - oldest, 1) if oldest is not None else 0.0,
+            **self.stats,
+        }
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Wyszukiwanie pełnotekstowe w transkrypcjach (odwrócony indeks).
+
+Jednostką jest linia transkryptu (jedna wypowiedź). Słowa normalizowane są
+tak samo jak w gpuworkerze (``_normalize``: małe litery, bez polskich
+znaków i interpunkcji), więc "Wdrożenie" znajdzie też "wdrozenie".
+
+Indeks żyje w pamięci (termin -> {nr sesji -> [nr linii]}), a na dysku jako
+dziennik ``search/postings.jsonl`` - dopisywany przy każdym nowym nagraniu
+(``add``) i usunięciu (``remove``), odtwarzany przy starcie i przepisywany,
+gdy martwych wpisów jest więcej niż żywych.
+"""
+import os
+import re
+import json
+import bisect
+import threading
+import unicodedata
+
+# [2026-06-30 21:30:45] Ala: tekst   albo stary format   [Ala]: tekst
+_LINE_RE = re.compile(r"^\[(?P<ts>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\] (?P<who>[^:]+): (?P<text>.*)$")
+_LEGACY_RE = re.compile(r"^\[(?P<who>[^\]]+)\]: (?P<text>.*)$")
+
+
+def _normalize(text: str) -> str:
+    """Małe litery, bez znaków diakrytycznych i interpunkcji, pojedyncze spacje."""
+    # "ł" nie rozkłada się w NFKD (osobna litera), więc mapujemy ją ręcznie.
+    t = text.lower().replace("ł", "l")
+    t = unicodedata.normalize("NFKD", t)
+    t = "".join(c for c in t if not unicodedata.combining(c))
+    t = re.sub(r"[^a-z0-9 ]+", " ", t)
+    return re.sub(r"\s+", " ", t).strip()
+
+
+def parse_line(line: str):
+    """Linia transkryptu -> (znacznik czasu lub None, mówca lub None, tekst)."""
+    m = _LINE_RE.match(line)
+    if m:
+        return m.group("ts"), m.group("who"), m.group("text")
+    m = _LEGACY_RE.match(line)
+    if m:
+        return None, m.group("who"), m.group("text")
+    return None, None, line
+
+
+class SearchIndex:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, "postings.jsonl")
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._postings = {}      # termin -> {nr sesji -> [nr linii]}
+        self._sessions = {}      # id sesji -> nr
+        self._ids = []           # nr -> id sesji (None = usunięta)
+        self._created = []       # nr -> created_at (do sortowania wyników)
+        self._terms_of = []      # nr -> terminy sesji (szybkie usuwanie)
+        self._vocab = None       # posortowane terminy (do wyszukiwania po prefiksie)
+        self._dead = 0
+        self._load()
+
+    # ---------------------------------------------------------------- dysk
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # urwana linia po awarii
+                    if "del" in entry:
+                        self._drop(entry["del"])
+                    else:
+                        self._insert(entry["id"], entry.get("created_at", ""), entry["terms"])
+        except FileNotFoundError:
+            return
+        if self._dead > len(self._sessions):
+            self._rewrite()
+
+    def _append(self, entry):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _rewrite(self):
+        """Przepisuje dziennik bez martwych wpisów."""
+        by_no = {no: {} for no in self._sessions.values()}
+        for term, hits in self._postings.items():
+            for no, lines in hits.items():
+                by_no[no][term] = lines
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for sid, no in self._sessions.items():
+                entry = {"id": sid, "created_at": self._created[no], "terms": by_no[no]}
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self._dead = 0
+
+    # ------------------------------------------------------------- pamięć
+    def _insert(self, session_id, created_at, terms):
+        self._drop(session_id)
+        no = len(self._ids)
+        self._ids.append(session_id)
+        self._created.append(created_at)
+        self._terms_of.append(list(terms))
+        self._sessions[session_id] = no
+        for term, lines in terms.items():
+            self._postings.setdefault(term, {})[no] = lines
+        self._vocab = None
+
+    def _drop(self, session_id):
+        no = self._sessions.pop(session_id, None)
+        if no is None:
+            return
+        self._ids[no] = None
+        self._dead += 1
+        for term in self._terms_of[no]:
+            hits = self._postings.get(term)
+            if hits is None:
+                continue
+            hits.pop(no, None)
+            if not hits:
+                del self._postings[term]
+        self._terms_of[no] = []
+        self._vocab = None
+
+    @staticmethod
+    def _terms(transcript_text):
+        terms = {}
+        for i, line in enumerate(transcript_text.splitlines()):
+            _ts, _who, text = parse_line(line)
+            for word in set(_normalize(text).split()):
+                terms.setdefault(word, []).append(i)
+        return terms
+
+    # ------------------------------------------------------------ publiczne
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def add(self, session_id, created_at, transcript_text):
+        """Indeksuje (lub reindeksuje) transkrypt jednej sesji."""
+        terms = self._terms(transcript_text or "")
+        with self._lock:
+            self._insert(session_id, created_at or "", terms)
+            self._append({"id": session_id, "created_at": created_at or "", "terms": terms})
+
+    def remove(self, session_id):
+        with self._lock:
+            if session_id not in self._sessions:
+                return
+            self._drop(session_id)
+            self._append({"del": session_id})
+            if self._dead > max(len(self._sessions), 100):
+                self._rewrite()
+
+    def watch(self, store):
+        """Aktualizuje indeks przyrostowo przy zmianach w magazynie."""
+        def on_event(event, session):
+            if event == "add" and store.has_transcript(session):
+                self.add(session["id"], session.get("created_at", ""), store.read_transcript(session))
+            elif event == "delete":
+                self.remove(session["id"])
+        store.subscribe(on_event)
+
+    def sync(self, store):
+        """Dociąga sesje brakujące w indeksie i usuwa nieistniejące (start bota)."""
+        sessions = store.list_sessions()
+        live = {s["id"] for s in sessions}
+        for sid in [sid for sid in list(self._sessions) if sid not in live]:
+            self.remove(sid)
+        added = 0
+        for s in sessions:
+            if s["id"] not in self._sessions and store.has_transcript(s):
+                self.add(s["id"], s.get("created_at", ""), store.read_transcript(s))
+                added += 1
+        return added
+
+    def _expand(self, token):
+        """
+        Terminy pasujące do słowa z zapytania: dokładnie albo po prefiksie
+        (odmiana: "wdrozen" -> "wdrozenie", "wdrozenia"); najwyżej
+        ``_MAX_EXPANSION`` najkrótszych, żeby krótkie prefiksy nie eksplodowały.
+        """
+        if self._vocab is None:
+            self._vocab = sorted(self._postings)
+        i = bisect.bisect_left(self._vocab, token)
+        out = []
+        while i < len(self._vocab) and self._vocab[i].startswith(token):
+            out.append(self._vocab[i])
+            i += 1
+        if len(out) > self._MAX_EXPANSION:
+            out = sorted(out, key=len)[:self._MAX_EXPANSION]
+        return out
+
+    _MAX_EXPANSION = 64
+
+    def search(self, query, limit=10):
+        """
+        Linie zawierające WSZYSTKIE słowa zapytania, od najnowszych nagrań.
+        Zwraca (liczba nagrań zawierających wszystkie słowa, [(id sesji, nr linii)]).
+
+        Najpierw przecięcie po sesjach (klucze list trafień, od najrzadszego
+        słowa), potem linie sprawdzane tylko do zebrania ``limit`` wyników.
+        """
+        tokens = list(dict.fromkeys(_normalize(query).split()))
+        if not tokens:
+            return 0, []
+        with self._lock:
+            per_token = []
+            for token in tokens:
+                postings = [self._postings[t] for t in self._expand(token)]
+                if not postings:
+                    return 0, []
+                per_token.append(postings)
+            per_token.sort(key=lambda ps: sum(len(p) for p in ps))
+            candidates = set().union(*(p.keys() for p in per_token[0]))
+            for postings in per_token[1:]:
+                candidates = {no for no in candidates if any(no in p for p in postings)}
+                if not candidates:
+                    return 0, []
+            ordered = sorted(candidates, key=lambda no: self._created[no], reverse=True)
+            out = []
+            for no in ordered:
+                common = None
+                for postings in per_token:
+                    lines = set()
+                    for p in postings:
+                        lines.update(p.get(no, ()))
+                    common = lines if common is None else common & lines
+                    if not common:
+                        break
+                for line_no in sorted(common or ()):
+                    out.append((self._ids[no], line_no))
+                    if len(out) >= limit:
+                        return len(candidates), out
+        return len(candidates), out
+
+
+def resolve_hits(store, hits):
+    """[(id sesji, nr linii)] -> [{id, ts, who, text}] (jeden odczyt pliku na sesję)."""
+    lines_of = {}
+    out = []
+    for sid, line_no in hits:
+        if sid not in lines_of:
+            session = store.get_by_id(sid)
+            lines_of[sid] = store.read_transcript(session).splitlines() if session else []
+        lines = lines_of[sid]
+        if line_no >= len(lines):
+            continue
+        ts, who, text = parse_line(lines[line_no])
+        out.append({"id": sid, "ts": ts, "who": who, "text": text})
+    return out
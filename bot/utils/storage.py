@@ -8,19 +8,24 @@ Model sesji (nagrania):
     transcript_file  -> transcripts/<id>.txt  (CHRONOLOGICZNY, wielu mówców)
     transcript_len
     audio: [{user_id, display_name, file}]     (audio per osoba, w RECORDINGS_DIR)
+    has_audio                                  (czy któryś plik audio jeszcze jest)
     summaries: [{file, label, created_at}]
 
 Audio kasowane po N dniach; transkrypcje i podsumowania - bezterminowo.
 Czyta też stary format (per-user "transcripts") dla zgodności wstecznej.
+
+Indeks sesji trzyma backend z index_backends.py: SQLite (domyślnie, WAL)
+albo dotychczasowy index.json.
 """
 import os
 import re
-import json
 import glob
 import time
 import datetime
 import threading
 
+from utils.index_backends import open_index
+
 
 def _safe(name: str, limit: int = 40) -> str:
     cleaned = re.sub(r'[^0-9A-Za-z_-]+', '_', str(name)).strip('_')
@@ -28,39 +33,52 @@ def _safe(name: str, limit: int = 40) -> str:
 
 
 class TranscriptionStore:
-    def __init__(self, base_dir: str, recordings_dir: str, audio_retention_days: int = 7):
+    def __init__(self, base_dir: str, recordings_dir: str, audio_retention_days: int = 7,
+                 backend: str = "sqlite", fsync: str = "always", journal_max_kb: int = 256):
         self.base_dir = base_dir
         self.recordings_dir = recordings_dir
         self.audio_retention_days = audio_retention_days
         self.transcripts_dir = os.path.join(base_dir, "transcripts")
         self.summaries_dir = os.path.join(base_dir, "summaries")
-        self.index_path = os.path.join(base_dir, "index.json")
         self._lock = threading.RLock()
 
         os.makedirs(self.transcripts_dir, exist_ok=True)
         os.makedirs(self.summaries_dir, exist_ok=True)
         os.makedirs(self.recordings_dir, exist_ok=True)
-        if not os.path.exists(self.index_path):
-            self._write_index([])
+        self._index = open_index(backend, base_dir, fsync, journal_max_kb * 1024)
+        self._listeners = []
+        self._backfill_audio_flags()
 
-    # ------------------------------------------------------------------ utils
-    def _read_index(self):
-        try:
-            with open(self.index_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+    def _backfill_audio_flags(self):
+        """Jednorazowo: flaga ``has_audio`` dla sesji zapisanych przed jej wprowadzeniem."""
+        with self._lock:
+            missing = [s.copy() for s in self._index.all() if "has_audio" not in s]
+            for s in missing:
+                s["has_audio"] = self._audio_on_disk(s)
+            if missing:
+                self._index.put_many(missing)
+
+    def close(self):
+        """Domyka indeks (czeka na scalanie dziennika w tle, zamyka bazę)."""
+        with self._lock:
+            self._index.close()
 
-    def _write_index(self, data):
-        tmp = self.index_path + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        os.replace(tmp, self.index_path)
+    def subscribe(self, callback):
+        """
+        Rejestruje ``callback(event, session)`` wołany po każdej zmianie:
+        "add" (nowe nagranie), "update" (nazwa, podsumowania, audio),
+        "delete" (usunięte nagranie). Woła się w wątku zapisu, pod zamkiem.
+        """
+        self._listeners.append(callback)
 
-    @staticmethod
-    def _sorted(sessions):
-        return sorted(sessions, key=lambda s: s.get("created_at", ""), reverse=True)
+    def _notify(self, event, session):
+        for callback in self._listeners:
+            try:
+                callback(event, session)
+            except Exception as e:  # noqa: BLE001
+                print(f"[store] Błąd obsługi zdarzenia {event}: {e}")
 
+    # ------------------------------------------------------------------ utils
     def _abs(self, rel):
         return os.path.join(self.base_dir, rel) if rel else None
 
@@ -118,19 +136,49 @@ class TranscriptionStore:
         return any((t.get("length") or 0) > 0 for t in session.get("transcripts", {}).values())
 
     def has_audio(self, session) -> bool:
+        """Flaga z indeksu (utrzymywana przy zapisie/usuwaniu audio) - bez stat-ów."""
+        flag = session.get("has_audio")
+        if flag is not None:
+            return bool(flag)
+        return self._audio_on_disk(session)
+
+    def _audio_on_disk(self, session) -> bool:
         return any(e.get("file") and os.path.exists(e["file"]) for e in self._audio_entries(session))
 
     # -------------------------------------------------------------- public API
     def list_sessions(self):
         with self._lock:
-            return self._sorted(self._read_index())
+            return self._index.all()
 
     def get_by_id(self, session_id: str):
         with self._lock:
-            for s in self._read_index():
-                if s["id"].lower() == session_id.lower():
-                    return s
-        return None
+            return self._index.get(session_id)
+
+    def if_present(self, session_id, fn):
+        """
+        Woła ``fn()`` tylko, jeśli nagranie nadal istnieje - pod zamkiem, więc
+        usunięcie (i jego zdarzenie "delete") nie wejdzie między sprawdzenie
+        a ``fn``. Zwraca True, gdy ``fn`` zostało wywołane.
+        """
+        with self._lock:
+            if self._index.get(session_id) is None:
+                return False
+            fn()
+            return True
+
+    def count_sessions(self):
+        with self._lock:
+            return self._index.count()
+
+    def page_sessions(self, offset, limit):
+        """Nagrania [offset, offset + limit) od najnowszego."""
+        with self._lock:
+            return self._index.page(offset, limit)
+
+    def list_by_participant(self, user_id):
+        """Nagrania z udziałem danej osoby (od najnowszych)."""
+        with self._lock:
+            return self._index.by_participant(user_id)
 
     def add_session(self, channel_name, transcript_text, audio_files, created_at=None, name=""):
         """
@@ -138,13 +186,11 @@ class TranscriptionStore:
         audio_files: dict[uid -> {"display_name", "audio_file" (ścieżka abs)}]
         """
         with self._lock:
-            sessions = self._read_index()
             created = created_at or datetime.datetime.now()
             base_id = "T" + created.strftime("%Y%m%d%H%M%S")
-            existing = {s["id"] for s in sessions}
             session_id = base_id
             suffix = ord('a')
-            while session_id in existing:
+            while self._index.get(session_id) is not None:
                 session_id = base_id + chr(suffix)
                 suffix += 1
 
@@ -173,24 +219,32 @@ class TranscriptionStore:
                 "audio": audio,
                 "summaries": [],
             }
-            sessions.append(session)
-            self._write_index(sessions)
+            session["has_audio"] = self._audio_on_disk(session)
+            self._index.put(session)
+            self._notify("add", session)
             return session
 
+    def _editable(self, session_id):
+        """
+        Kopia rekordu do zmiany. Indeks oddaje rekordy współdzielone z innymi
+        wątkami - kopia trafia do niego dopiero po udanym ``put``.
+        """
+        target = self._index.get(session_id)
+        return None if target is None else target.copy()
+
     def set_name(self, session_id, name):
         with self._lock:
-            sessions = self._read_index()
-            target = next((s for s in sessions if s["id"] == session_id), None)
+            target = self._editable(session_id)
             if target is None:
                 return False
             target["name"] = name or ""
-            self._write_index(sessions)
+            self._index.put(target)
+            self._notify("update", target)
             return True
 
     def add_summary(self, session_id, label, text):
         with self._lock:
-            sessions = self._read_index()
-            target = next((s for s in sessions if s["id"] == session_id), None)
+            target = self._editable(session_id)
             if target is None:
                 return None
             ts = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
@@ -202,13 +256,13 @@ class TranscriptionStore:
                 "label": label,
                 "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
             })
-            self._write_index(sessions)
+            self._index.put(target)
+            self._notify("update", target)
             return sfile
 
     def delete_session(self, session_id: str) -> bool:
         with self._lock:
-            sessions = self._read_index()
-            target = next((s for s in sessions if s["id"].lower() == session_id.lower()), None)
+            target = self._index.get(session_id)
             if target is None:
                 return False
             # transkrypt (nowy i stary)
@@ -221,14 +275,13 @@ class TranscriptionStore:
             # podsumowania
             for sm in target.get("summaries", []):
                 self._rm(self._abs(sm.get("file")))
-            sessions = [s for s in sessions if s["id"] != target["id"]]
-            self._write_index(sessions)
+            self._index.delete(target["id"])
+            self._notify("delete", target)
             return True
 
     def delete_audio(self, session_id: str) -> bool:
         with self._lock:
-            sessions = self._read_index()
-            target = next((s for s in sessions if s["id"].lower() == session_id.lower()), None)
+            target = self._editable(session_id)
             if target is None:
                 return False
             for e in target.get("audio", []):
@@ -237,19 +290,21 @@ class TranscriptionStore:
             for t in target.get("transcripts", {}).values():  # stary format
                 self._rm(t.get("audio_file"))
                 t["audio_file"] = None
-            self._write_index(sessions)
+            target["has_audio"] = False
+            self._index.put(target)
+            self._notify("update", target)
             return True
 
     def delete_summaries(self, session_id: str) -> bool:
         with self._lock:
-            sessions = self._read_index()
-            target = next((s for s in sessions if s["id"].lower() == session_id.lower()), None)
+            target = self._editable(session_id)
             if target is None:
                 return False
             for sm in target.get("summaries", []):
                 self._rm(self._abs(sm.get("file")))
             target["summaries"] = []
-            self._write_index(sessions)
+            self._index.put(target)
+            self._notify("update", target)
             return True
 
     def export_bundle(self, session):
@@ -264,8 +319,14 @@ class TranscriptionStore:
             f = e.get("file")
             if f and os.path.exists(f):
                 audio.append((e.get("display_name", e.get("user_id")), f))
+        # Nowy format: plik transkryptu pakowany wprost z dysku (bez wczytywania).
+        tfile = self._abs(session.get("transcript_file"))
+        if tfile and self.has_transcript(session) and os.path.exists(tfile):
+            transcript = {"transcript_file": tfile, "transcript_text": None}
+        else:
+            transcript = {"transcript_file": None, "transcript_text": self.read_transcript(session)}
         return {
-            "transcript_text": self.read_transcript(session),
+            **transcript,
             "summaries": summaries,
             "audio": audio,
         }
@@ -274,23 +335,32 @@ class TranscriptionStore:
         cutoff = time.time() - self.audio_retention_days * 86400
         removed = []
         with self._lock:
-            sessions = self._read_index()
-            changed = False
-            for s in sessions:
+            changed = []
+            for s in self._index.all():
+                # Kopia tylko nagrań z audio (reszty i tak nie zmieniamy).
+                if not any(e.get("file") for e in self._audio_entries(s)):
+                    continue
+                s = s.copy()
+                dirty = False
                 for e in self._audio_entries(s):
                     f = e.get("file")
                     if not f:
                         continue
                     if not os.path.exists(f):
                         e["file"] = None
-                        changed = True
+                        dirty = True
                     elif os.path.getmtime(f) < cutoff:
                         self._rm(f)
                         e["file"] = None
-                        changed = True
+                        dirty = True
                         removed.append(f)
+                if dirty:
+                    s["has_audio"] = self._audio_on_disk(s)
+                    changed.append(s)
             if changed:
-                self._write_index(sessions)
+                self._index.put_many(changed)
+                for s in changed:
+                    self._notify("update", s)
 
         for pat in ("*.wav", "*.pcm"):
             for f in glob.glob(os.path.join(self.recordings_dir, pat)):
@@ -304,23 +374,20 @@ class TranscriptionStore:
 
     # ------------------------------------------------------ rozwiązywanie celów
     def resolve_targets(self, arg: str):
-        sessions = self.list_sessions()
         a = (arg or "").strip()
         if not a:
             return []
         if a.lower() == "all":
-            return sessions
+            return self.list_sessions()
         m = re.match(r'^(\d+)\s*-\s*(\d+)$', a)
-        if m:
-            start, end = int(m.group(1)), int(m.group(2))
-            if start > end:
-                start, end = end, start
-            start = max(start, 1)
-            return sessions[start - 1:end]
-        if a.isdigit():
-            idx = int(a)
-            if 1 <= idx <= len(sessions):
-                return [sessions[idx - 1]]
-            return []
-        s = next((x for x in sessions if x["id"].lower() == a.lower()), None)
+        with self._lock:
+            if m:
+                start, end = int(m.group(1)), int(m.group(2))
+                if start > end:
+                    start, end = end, start
+                start = max(start, 1)
+                return self._index.page(start - 1, end - start + 1)
+            if a.isdigit():
+                return self._index.page(int(a) - 1, 1) if int(a) >= 1 else []
+            s = self._index.get(a)
         return [s] if s else []
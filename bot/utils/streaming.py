@@ -0,0 +1,82 @@
+"""
+Progresywne wysyłanie długiego tekstu na Discord w trakcie jego generowania.
+
+``StreamingMessage`` dostaje kolejne fragmenty (np. tokeny z Ollamy) i edytuje
+jedną wiadomość co ``interval`` sekund (limit edycji Discorda), a po
+przekroczeniu ``limit`` znaków zaczyna następną. Efekt końcowy jest taki sam
+jak przy ``send_chunks`` - tyle że tekst pojawia się od pierwszego tokenu.
+"""
+import time
+
+
+class StreamingMessage:
+    def __init__(self, send, header=None, limit=1900, interval=1.5):
+        self._send = send
+        self._header = header
+        self._limit = limit
+        self._interval = interval
+        self._text = ""
+        self._offset = 0          # początek treści bieżącej wiadomości w _text
+        self._msg = None          # bieżąca (edytowana) wiadomość
+        self._shown = ""          # co aktualnie w niej widać
+        self._last_edit = 0.0
+        # Jeśli ``send`` nie zwraca wiadomości, nie da się jej edytować -
+        # wtedy wysyłamy tylko pełne kawałki (jak send_chunks).
+        self._editable = True
+
+    @property
+    def text(self):
+        return self._text
+
+    async def feed(self, delta):
+        if not delta:
+            return
+        self._text += delta
+        if time.monotonic() - self._last_edit >= self._interval:
+            await self._flush(final=False)
+
+    async def finish(self, replace=None):
+        """Domyka strumień; ``replace`` podmienia treść (np. komunikat błędu)."""
+        if replace is not None and replace != self._text:
+            if self._offset == 0:
+                self._text = replace
+            else:
+                self._text += "\n" + replace
+        if not self._text:
+            self._text = "(pusto)"
+        await self._flush(final=True)
+        return self._text
+
+    async def _flush(self, final):
+        if self._header is not None:
+            header, self._header = self._header, None
+            await self._send(header)
+        # Pełne kawałki - domknij bieżącą wiadomość i przejdź do następnej.
+        while len(self._text) - self._offset > self._limit:
+            await self._show(self._text[self._offset:self._offset + self._limit])
+            self._offset += self._limit
+            self._msg, self._shown = None, ""
+        tail = self._text[self._offset:]
+        if tail and (final or self._editable):
+            if not await self._show(tail):
+                # Wysłane bez możliwości edycji - ten fragment jest już zamknięty.
+                self._offset += len(tail)
+        self._last_edit = time.monotonic()
+
+    async def _show(self, content):
+        """Pokazuje ``content`` w bieżącej wiadomości; False = nie da się jej edytować."""
+        if content == self._shown:
+            return True
+        if self._msg is None:
+            self._msg = await self._send(content)
+            if self._msg is None or not hasattr(self._msg, "edit"):
+                self._msg, self._shown, self._editable = None, "", False
+                return False
+        else:
+            try:
+                await self._msg.edit(content=content)
+            except Exception as e:  # noqa: BLE001
+                print(f"[stream] Nie udało się edytować wiadomości: {e}")
+                return True
+        self._shown = content
+        return True
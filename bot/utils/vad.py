@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Wykrywanie mowy (VAD) ramka po ramce - w wątku odbioru, przed buforem sinka.
+
+Sam próg RMS przepuszcza każdy głośniejszy szum (wentylator, klawiatura,
+muzyka w tle), a w trybie ręcznym był wyłączony - do Whispera szła cisza
+i szum, a on "transkrybował" z nich halucynacje. Tutaj ramka jest mową, gdy:
+
+* energia jest wyraźnie ponad śledzonym poziomem szumu tego mówcy
+  (i ponad ``min_rms`` - ustawieniem ``silence_rms_threshold``),
+* większość energii leży w paśmie mowy (~80-4000 Hz), a nie w buczeniu
+  sieci czy sykach,
+* sygnał jest okresowy w zakresie tonu głosu (autokorelacja) - mowa
+  dźwięczna tak, szum wentylatora, szum biały czy stuk klawiatury nie.
+
+``SpeechGate`` wygładza decyzje: po mowie przez ``hangover_ms`` ramki są
+jeszcze przepuszczane (końcówki słów, krótkie pauzy), a kilka ramek sprzed
+początku mowy (``preroll_ms``) jest dołączanych, żeby nie ucinać nagłosu.
+
+Backend jest wymienny (``VAD_BACKEND``): "numpy" (domyślny, ten opisany
+wyżej), "webrtc" (``webrtcvad``, jeśli zainstalowany) albo "rms" (stary
+pojedynczy próg RMS).
+"""
+import numpy as np
+
+try:  # opcjonalny backend; bez niego zostaje "numpy"
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+
+def _features(frames: np.ndarray, rate: int):
+    """
+    frames: [n, próbki] float32 (-1..1). Zwraca po jednej wartości na ramkę:
+    rms (skala int16), udział energii w paśmie mowy i okresowość - maksimum
+    znormalizowanej autokorelacji w zakresie tonu krtaniowego (70-400 Hz).
+    """
+    n = frames.shape[1]
+    x = frames - frames.mean(axis=1, keepdims=True)
+    rms = np.sqrt(np.mean(frames * frames, axis=1)) * 32768.0
+    size = 1 << int(np.ceil(np.log2(2 * n)))
+    power = np.abs(np.fft.rfft(x, n=size, axis=1)) ** 2
+    freqs = np.fft.rfftfreq(size, 1.0 / rate)
+    band = (freqs >= 80) & (freqs <= min(4000, rate / 2))
+    ratio = power[:, band].sum(axis=1) / (power.sum(axis=1) + 1e-12)
+    # Autokorelacja przez FFT (Wiener-Chinczyn), nieobciążona: r[k] / (r[0] * (n-k)/n).
+    ac = np.fft.irfft(power, n=size, axis=1)[:, :n]
+    lags = np.arange(n)
+    lo, hi = int(rate / 400), min(int(rate / 70), n - 1)
+    norm = ac[:, :1] * (n - lags[lo:hi]) / n + 1e-9
+    periodicity = (ac[:, lo:hi] / norm).max(axis=1) if hi > lo else np.zeros(len(frames))
+    return rms, ratio, periodicity
+
+
+class SpectralVAD:
+    """Energia względem poziomu szumu + pasmo mowy + okresowość (NumPy)."""
+
+    SNR = 3.0               # ~10 dB ponad szum
+    MIN_BAND_RATIO = 0.5
+    MIN_PERIODICITY = 0.6
+    FLOOR_ALPHA = 0.02      # tempo podążania za szumem (ramki bez mowy)
+    MIN_FLOOR = 30.0
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        # Discord zwykle nie przysyła pakietów w ciszy (VAD/PTT po stronie
+        # klienta), więc poziomu szumu nie da się zmierzyć "z góry" - startujemy
+        # od minimum, a w górę ciągną go tylko ramki bez cech mowy.
+        self.floor = self.MIN_FLOOR
+
+    def is_speech(self, frames: np.ndarray, min_rms: float = 0) -> np.ndarray:
+        rms, ratio, periodicity = _features(frames, self.rate)
+        voiced = (ratio >= self.MIN_BAND_RATIO) & (periodicity >= self.MIN_PERIODICITY)
+        # Decyzje dla całego bloku względem poziomu szumu z jego początku
+        # (``write`` podaje jeden pakiet 20 ms, więc blok to zwykle 1 ramka).
+        out = voiced & (rms >= max(min_rms, self.floor * self.SNR))
+        # Poziom szumu (tylko ramki bez mowy): w dół od razu do poziomu ramki,
+        # w górę powoli - pojedynczy stuk nie podnosi progu. Między spadkami to
+        # średnia wykładnicza, liczona wektorowo; pętla idzie tylko po spadkach.
+        noise = rms[~voiced]
+        floor = self.floor
+        while len(noise):
+            before = self._ema(floor, noise)
+            drops = np.flatnonzero(noise < before[:-1])
+            if not len(drops):
+                floor = float(before[-1])
+                break
+            j = drops[0]
+            floor, noise = max(self.MIN_FLOOR, float(noise[j])), noise[j + 1:]
+        self.floor = floor
+        return out
+
+    def _ema(self, floor: float, values: np.ndarray) -> np.ndarray:
+        """Poziom przed każdą z ``values`` i po ostatniej (bez spadków)."""
+        a = self.FLOOR_ALPHA
+        decay = (1 - a) ** np.arange(len(values) + 1)
+        # f_k = (1-a)^k * (f_0 + sum_{i<k} a * v_i / (1-a)^(i+1))
+        acc = np.concatenate(([0.0], np.cumsum(a * values / decay[1:])))
+        return decay * (floor + acc)
+
+
+class RmsVAD:
+    """Stary próg: mowa = RMS ramki >= ``min_rms`` (0 = wszystko jest mową)."""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+
+    def is_speech(self, frames: np.ndarray, min_rms: float = 0) -> np.ndarray:
+        rms = np.sqrt(np.mean(frames * frames, axis=1)) * 32768.0
+        return rms >= min_rms
+
+
+class WebRtcVAD:
+    """``webrtcvad`` (GMM z WebRTC); ramki 10/20/30 ms, 8/16/32/48 kHz."""
+
+    def __init__(self, rate: int, mode: int = 2):
+        self.rate = rate
+        self._vad = webrtcvad.Vad(mode)
+
+    def is_speech(self, frames: np.ndarray, min_rms: float = 0) -> np.ndarray:
+        pcm = np.clip(frames * 32768.0, -32768, 32767).astype("<i2")
+        rms = np.sqrt(np.mean(frames * frames, axis=1)) * 32768.0
+        out = np.zeros(len(frames), dtype=bool)
+        for i, f in enumerate(pcm):
+            try:
+                out[i] = rms[i] >= min_rms and self._vad.is_speech(f.tobytes(), self.rate)
+            except Exception:  # nietypowa długość ramki - przepuszczamy
+                out[i] = rms[i] >= min_rms
+        return out
+
+
+BACKENDS = {"numpy": SpectralVAD, "rms": RmsVAD}
+if webrtcvad is not None:
+    BACKENDS["webrtc"] = WebRtcVAD
+
+
+def make_vad(name: str, rate: int):
+    """Detektor dla jednego mówcy; nieznany/niedostępny backend -> "numpy"."""
+    return BACKENDS.get((name or "numpy").lower(), SpectralVAD)(rate)
+
+
+class SpeechGate:
+    """
+    Wygładzanie decyzji VAD jednego mówcy. ``feed`` zwraca:
+    "speech" (mowa), "hang" (cisza tuż po mowie - jeszcze nagrywamy) albo
+    None (cisza - ramka odrzucana, trafia tylko do preroll).
+    """
+
+    def __init__(self, detector, hangover_ms: float = 300, preroll_ms: float = 60):
+        self.detector = detector
+        self.hangover = hangover_ms / 1000.0
+        self.preroll = preroll_ms / 1000.0
+        self._hang_left = 0.0
+
+    def feed(self, samples: np.ndarray, min_rms: float = 0):
+        duration = len(samples) / self.detector.rate
+        if self.detector.is_speech(samples.reshape(1, -1), min_rms)[0]:
+            self._hang_left = self.hangover
+            return "speech"
+        if self._hang_left > 0:
+            self._hang_left -= duration
+            return "hang"
+        return None
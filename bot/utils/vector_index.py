@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Wyszukiwanie semantyczne w transkrypcjach (embeddingi + podobieństwo cosinusowe).
+
+Transkrypt dzielony jest po liniach na kawałki po ~``CHUNK_CHARS`` znaków;
+każdy kawałek dostaje wektor z modelu embeddingów (gpuworker ``/embed/``).
+Na dysku (katalog ``vectors/``):
+
+* ``vectors.f32``  - macierz float32 (wiersz = kawałek), znormalizowana do
+  długości 1, więc cosinus to zwykły iloczyn skalarny; czytana przez
+  ``np.memmap`` - system trzyma w RAM tylko to, co potrzebne,
+* ``ids.jsonl``    - opis wierszy w tej samej kolejności
+  (``{"id", "line", "lines"}`` - sesja i zakres linii transkryptu) oraz
+  nagrobki ``{"del": id}`` po usunięciu nagrania,
+* ``meta.json``    - model i wymiar; zmiana modelu czyści indeks.
+
+Wiersze usuniętych nagrań są tylko maskowane; plik przepisywany jest, gdy
+martwych jest więcej niż żywych. Przy dużych zbiorach opcjonalny tryb IVF
+(``ivf_lists`` > 0): k-means dzieli wektory na listy, a zapytanie przeszukuje
+tylko ``ivf_nprobe`` list najbliższych centroidów.
+"""
+import os
+import json
+import threading
+
+import numpy as np
+
+from .search import parse_line
+
+CHUNK_CHARS = 800
+
+
+def chunk_transcript(transcript_text, max_chars=CHUNK_CHARS):
+    """
+    Transkrypt -> [(nr pierwszej linii, liczba linii, tekst kawałka)].
+    Kawałki nie dzielą wypowiedzi; znaczniki czasu są pomijane (szum dla modelu).
+    """
+    chunks = []
+    start, parts, size = 0, [], 0
+    for i, line in enumerate(transcript_text.splitlines()):
+        _ts, who, text = parse_line(line)
+        text = text.strip()
+        piece = f"{who}: {text}" if who else text
+        if not text:
+            piece = ""
+        if parts and size + len(piece) > max_chars:
+            chunks.append((start, i - start, "\n".join(parts)))
+            parts, size = [], 0
+        if not parts:
+            start = i
+        if piece:
+            parts.append(piece)
+            size += len(piece) + 1
+    if parts:
+        chunks.append((start, len(transcript_text.splitlines()) - start, "\n".join(parts)))
+    return chunks
+
+
+class VectorIndex:
+    IVF_MIN_PER_LIST = 39     # poniżej tylu wektorów na listę IVF nie ma sensu
+    IVF_ITERATIONS = 10
+
+    def __init__(self, directory: str, ivf_lists: int = 0, ivf_nprobe: int = 8):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.ids_path = os.path.join(directory, "ids.jsonl")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.ivf_lists = max(0, int(ivf_lists))
+        self.ivf_nprobe = max(1, int(ivf_nprobe))
+        self._lock = threading.Lock()
+        self.model = None
+        self.dim = 0
+        self._rows = []           # nr wiersza -> (id sesji, nr linii, liczba linii)
+        self._alive = np.zeros(0, dtype=bool)
+        self._by_session = {}     # id sesji -> [nr wierszy]
+        self._matrix = None       # memmap (wiersze x dim) albo None
+        self._ivf = None          # (centroidy, przypisanie wiersz -> lista)
+        self._load()
+
+    # ---------------------------------------------------------------- dysk
+    def _load(self):
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.model, self.dim = meta.get("model"), int(meta.get("dim", 0))
+        except (FileNotFoundError, ValueError):
+            self._reset_files()
+            return
+        rows, deleted = [], set()
+        try:
+            with open(self.ids_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # urwana linia po awarii
+                    if "del" in entry:
+                        deleted.add((entry["del"], len(rows)))
+                    else:
+                        rows.append((entry["id"], entry["line"], entry["lines"]))
+        except FileNotFoundError:
+            pass
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        n = min(len(rows), size // (4 * self.dim)) if self.dim else 0
+        # Opis bez wektora (awaria w trakcie dopisywania) - odcinamy.
+        self._rows = rows[:n]
+        self._alive = np.ones(n, dtype=bool)
+        for no, (sid, _line, _lines) in enumerate(self._rows):
+            self._by_session.setdefault(sid, []).append(no)
+        # Nagrobek dotyczy wierszy dopisanych PRZED nim (sesję można dodać ponownie).
+        for sid, upto in deleted:
+            for no in self._by_session.get(sid, []):
+                if no < upto:
+                    self._alive[no] = False
+        for sid in list(self._by_session):
+            self._by_session[sid] = [no for no in self._by_session[sid] if self._alive[no]]
+            if not self._by_session[sid]:
+                del self._by_session[sid]
+        self._remap()
+        if n != len(rows) or n * 4 * self.dim != size or self._dead() > self.live_rows:
+            self._rewrite()
+
+    def _reset_files(self):
+        for path in (self.vectors_path, self.ids_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._rows, self._by_session = [], {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._matrix, self._ivf = None, None
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "dim": self.dim}, f)
+        os.replace(tmp, self.meta_path)
+
+    def _remap(self):
+        n = len(self._rows)
+        if n == 0 or not self.dim:
+            self._matrix = None
+            return
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    def _dead(self):
+        return len(self._rows) - self.live_rows
+
+    def _rewrite(self):
+        """Przepisuje macierz i opis bez usuniętych wierszy."""
+        keep = np.flatnonzero(self._alive)
+        old = self._matrix
+        rows = [self._rows[no] for no in keep]
+        tmp_vec, tmp_ids = self.vectors_path + ".tmp", self.ids_path + ".tmp"
+        with open(tmp_vec, "wb") as f:
+            if old is not None and len(keep):
+                for i in range(0, len(keep), 4096):
+                    f.write(np.ascontiguousarray(old[keep[i:i + 4096]]).tobytes())
+        with open(tmp_ids, "w", encoding="utf-8") as f:
+            for sid, line, lines in rows:
+                f.write(json.dumps({"id": sid, "line": line, "lines": lines}, ensure_ascii=False) + "\n")
+        self._matrix = None  # zwolnij memmap przed podmianą pliku
+        del old
+        os.replace(tmp_vec, self.vectors_path)
+        os.replace(tmp_ids, self.ids_path)
+        self._rows = rows
+        self._alive = np.ones(len(rows), dtype=bool)
+        self._by_session = {}
+        for no, (sid, _line, _lines) in enumerate(rows):
+            self._by_session.setdefault(sid, []).append(no)
+        self._ivf = None
+        self._remap()
+
+    # ------------------------------------------------------------ publiczne
+    def __contains__(self, session_id):
+        return session_id in self._by_session
+
+    @property
+    def live_rows(self):
+        return int(self._alive.sum())
+
+    def status(self):
+        return {
+            "model": self.model,
+            "dim": self.dim,
+            "sessions": len(self._by_session),
+            "vectors": self.live_rows,
+            "ivf_lists": len(self._ivf[0]) if self._ivf is not None else 0,
+        }
+
+    def add(self, session_id, chunks, vectors, model):
+        """
+        Dopisuje wektory kawałków jednej sesji (``chunks`` z ``chunk_transcript``,
+        ``vectors`` w tej samej kolejności). Inny model niż dotąd = indeks od nowa.
+        """
+        vecs = np.array(vectors, dtype=np.float32)
+        if vecs.ndim != 2 or len(vecs) != len(chunks) or not len(chunks):
+            raise ValueError("Liczba wektorów nie zgadza się z liczbą kawałków")
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs /= np.maximum(norms, 1e-12)
+        with self._lock:
+            if model != self.model or vecs.shape[1] != self.dim:
+                if self._rows:
+                    print(f"[vectors] Zmiana modelu ({self.model} -> {model}) - indeks od nowa.")
+                self.model, self.dim = model, int(vecs.shape[1])
+                self._reset_files()
+            self._drop(session_id)
+            first = len(self._rows)
+            with open(self.vectors_path, "ab") as f:
+                f.write(vecs.tobytes())
+            with open(self.ids_path, "a", encoding="utf-8") as f:
+                for line, lines, _text in chunks:
+                    f.write(json.dumps({"id": session_id, "line": line, "lines": lines},
+                                       ensure_ascii=False) + "\n")
+            self._rows.extend((session_id, line, lines) for line, lines, _text in chunks)
+            self._alive = np.concatenate([self._alive, np.ones(len(chunks), dtype=bool)])
+            self._by_session[session_id] = list(range(first, len(self._rows)))
+            self._matrix = None
+            self._remap()
+            if self._ivf is not None:
+                centroids, assign = self._ivf
+                self._ivf = (centroids, np.concatenate([assign, np.argmax(vecs @ centroids.T, axis=1)]))
+
+    def remove(self, session_id):
+        with self._lock:
+            if session_id not in self._by_session:
+                return
+            self._drop(session_id)
+            with open(self.ids_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"del": session_id}, ensure_ascii=False) + "\n")
+            if self._dead() > max(self.live_rows, 1000):
+                self._rewrite()
+
+    def _drop(self, session_id):
+        rows = self._by_session.pop(session_id, None)
+        if rows:
+            self._alive[rows] = False
+
+    # ---------------------------------------------------------------- IVF
+    def _train_ivf(self):
+        """k-means (sferyczny) na próbce żywych wektorów -> centroidy + przypisania."""
+        live = np.flatnonzero(self._alive)
+        k = min(self.ivf_lists, len(live) // self.IVF_MIN_PER_LIST)
+        if k < 2:
+            return None
+        rng = np.random.default_rng(0)
+        sample = live if len(live) <= 256 * k else rng.choice(live, 256 * k, replace=False)
+        data = np.asarray(self._matrix[np.sort(sample)])
+        centroids = data[rng.choice(len(data), k, replace=False)].copy()
+        for _ in range(self.IVF_ITERATIONS):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            for c in range(k):
+                members = data[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        assign = np.empty(len(self._rows), dtype=np.int64)
+        for i in range(0, len(self._rows), 65536):
+            assign[i:i + 65536] = np.argmax(self._matrix[i:i + 65536] @ centroids.T, axis=1)
+        return centroids, assign
+
+    def _candidates(self, query):
+        """Wiersze do porównania: wszystkie żywe albo tylko z najbliższych list IVF."""
+        if self.ivf_lists and self._ivf is None:
+            self._ivf = self._train_ivf()
+        if self._ivf is None:
+            return None
+        centroids, assign = self._ivf
+        probe = np.argsort(-(centroids @ query))[:self.ivf_nprobe]
+        return np.flatnonzero(np.isin(assign, probe) & self._alive)
+
+    # ------------------------------------------------------------ szukanie
+    def search(self, query_vector, limit=5, per_session=1):
+        """
+        Najbardziej podobne kawałki: [(id sesji, nr linii, liczba linii, wynik)],
+        od najlepszego; najwyżej ``per_session`` kawałków z jednego nagrania.
+        """
+        q = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self._matrix is None or q.shape[0] != self.dim:
+                return []
+            q = q / max(float(np.linalg.norm(q)), 1e-12)
+            rows = self._candidates(q)
+            if rows is None:
+                scores = np.asarray(self._matrix @ q)
+                scores[~self._alive] = -np.inf
+                rows = np.arange(len(scores))
+            else:
+                if not len(rows):
+                    return []
+                scores = np.asarray(self._matrix[rows] @ q)
+            # Zapas na odrzucone duplikaty sesji; argpartition = O(n), sort tylko top.
+            want = min(len(scores), limit * per_session * 4 + 16)
+            while True:
+                top = np.argpartition(-scores, want - 1)[:want] if want < len(scores) else np.arange(len(scores))
+                top = top[np.argsort(-scores[top])]
+                out, taken = [], {}
+                for i in top:
+                    if not np.isfinite(scores[i]):
+                        break
+                    sid, line, lines = self._rows[rows[i]]
+                    if taken.get(sid, 0) >= per_session:
+                        continue
+                    taken[sid] = taken.get(sid, 0) + 1
+                    out.append((sid, line, lines, float(scores[i])))
+                    if len(out) >= limit:
+                        return out
+                if want >= len(scores):
+                    return out
+                want = min(len(scores), want * 4)
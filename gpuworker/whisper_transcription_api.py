@@ -1,22 +1,40 @@
+import io
 import os
 import re
+import json
+import math
+import time
+import bisect
+import asyncio
 import tempfile
+import hashlib
 import logging
+import functools
+import threading
 import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 
 import httpx
-import torch  # noqa: F401  (ensures CUDA libs load before whisper)
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import torch  # (import przed whisperem - ładuje biblioteki CUDA)
 import whisper
 import uvicorn
 from dotenv import load_dotenv
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Body
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Body, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from whisper import Whisper
 
+try:  # dekodowanie FLAC/Opus w procesie (libsndfile) - bez ffmpeg
+    import soundfile as sf
+except (ImportError, OSError):  # brak pakietu lub biblioteki libsndfile
+    sf = None
+
 # Załaduj zmienne środowiskowe z pliku .env
 config_path = os.environ.get("CONFIG_PATH", ".")
 env_file = os.path.join(config_path, ".env")
@@ -50,24 +68,510 @@ OLLAMA_NUM_CTX_MAX = int(os.environ.get("OLLAMA_NUM_CTX_MAX", "32768"))
 # Zapas kontekstu (tokeny) zarezerwowany na wygenerowaną odpowiedź.
 _CTX_OUTPUT_RESERVE = 2048
 
+# Podsumowanie hierarchiczne (map-reduce) długich transkryptów: zamiast
+# rozdmuchiwać num_ctx, transkrypt dzieli się po liniach wypowiedzi na
+# kawałki po ~OLLAMA_CHUNK_TOKENS tokenów, każdy streszcza się osobno
+# (OLLAMA_MAP_CONCURRENCY naraz), a streszczenia łączy w jedno podsumowanie.
+#   - SummarizeRequest.mode: "auto" (map-reduce gdy tekst > 1 kawałek),
+#     "single" (zawsze jedno wywołanie) albo "map_reduce" (wymuś).
+OLLAMA_CHUNK_TOKENS = max(512, int(os.environ.get("OLLAMA_CHUNK_TOKENS", "6000")))
+OLLAMA_MAP_CONCURRENCY = max(1, int(os.environ.get("OLLAMA_MAP_CONCURRENCY", "3")))
+
+# Model embeddingów dla /embed/ (wyszukiwanie semantyczne po stronie bota).
+OLLAMA_EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+
+# Kolejka zadań Whispera. Inferencja jest blokująca (GPU), więc wykonuje ją
+# osobny wątek - pętla uvicorna zostaje wolna dla /health/, /summarize/ itd.
+#   - WHISPER_WORKERS     - ile transkrypcji liczy się równolegle (1 = jedna na GPU)
+#   - WHISPER_QUEUE_DEPTH - ile zadań może naraz czekać/liczyć się; powyżej -> 429
+WHISPER_WORKERS = max(1, int(os.environ.get("WHISPER_WORKERS", "1")))
+WHISPER_QUEUE_DEPTH = max(1, int(os.environ.get("WHISPER_QUEUE_DEPTH", "16")))
+
+
+class QueueFullError(Exception):
+    """Kolejka inferencji jest pełna - klient ma spróbować ponownie później."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Kolejka transkrypcji pełna (retry after {retry_after}s)")
+        self.retry_after = retry_after
+
+
+class InferenceQueue:
+    """
+    Dedykowany executor inferencji z ograniczoną kolejką zadań.
+
+    Licznik zajętych miejsc jest modyfikowany wyłącznie z pętli zdarzeń, więc
+    nie potrzebuje blokady. ``slot()`` rezerwuje miejsce (albo zgłasza
+    ``QueueFullError``), ``run()`` wykonuje funkcję blokującą w wątku GPU.
+    """
+
+    def __init__(self, workers: int, depth: int):
+        self.workers = workers
+        self.depth = depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whisper")
+        self._pending = 0
+        self._avg_sec = 0.0   # średni czas zadania (EMA) - do Retry-After
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0}
+
+    def retry_after(self) -> int:
+        """Szacowany czas (s), po którym zwolni się miejsce w kolejce."""
+        per_job = self._avg_sec or 5.0
+        return max(1, math.ceil(per_job * self._pending / self.workers))
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._pending >= self.depth:
+            self.stats["rejected"] += 1
+            raise QueueFullError(self.retry_after())
+        self._pending += 1
+        self.stats["accepted"] += 1
+        try:
+            yield
+        finally:
+            self._pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        t0 = time.monotonic()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            elapsed = time.monotonic() - t0
+            self._avg_sec = elapsed if not self._avg_sec else 0.8 * self._avg_sec + 0.2 * elapsed
+            self.stats["completed"] += 1
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pending": self._pending,
+            "depth": self.depth,
+            "workers": self.workers,
+            "avg_job_sec": round(self._avg_sec, 3),
+            **self.stats,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Mikro-batching: krótkie wypowiedzi (≤ 30 s, jedno okno Whispera) z różnych
+# żądań, które przyjdą w krótkim odstępie, dekodowane są w JEDNYM przebiegu
+# modelu (wspólny batch log-mel). WHISPER_BATCH_SIZE=1 wyłącza batching.
+WHISPER_BATCH_SIZE = max(1, int(os.environ.get("WHISPER_BATCH_SIZE", "8")))
+WHISPER_BATCH_WAIT_MS = max(0.0, float(os.environ.get("WHISPER_BATCH_WAIT_MS", "50")))
+
+
+class WhisperBatcher:
+    """
+    Zbiera żądania transkrypcji krótkich nagrań i dekoduje je wsadowo.
+
+    Pętla ``_loop`` czeka na pierwsze żądanie, potem dobiera kolejne przez
+    maks. ``max_wait_ms`` (albo do ``max_size``). Gdy GPU jest zajęte
+    poprzednim batchem, żądania gromadzą się w kolejce i następny batch
+    formuje się natychmiast - im większe obciążenie, tym większe batche.
+    """
+
+    def __init__(self, queue: InferenceQueue, max_size: int, max_wait_ms: float):
+        self._inference = queue
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # Tyle batchy naraz, ile wątków inferencji - reszta czeka w kolejce.
+        self._slots = asyncio.Semaphore(queue.workers)
+        self._task: Optional[asyncio.Task] = None
+        self._dispatches: set = set()  # referencje - inaczej GC może zebrać zadanie
+        self.stats = {"batches": 0, "items": 0, "max_batch": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Rozpoczęte batche kończą się - czekający dostają wyniki.
+        await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+    async def submit(self, audio: np.ndarray, lang: str) -> Dict[str, Any]:
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((audio, lang, fut))
+        return await fut
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_size:
+            # Najpierw to, co już czeka (bez czekania), potem okno max_wait.
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _loop(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            # Jeden batch = jeden język (opcja dekodowania wspólna dla batcha).
+            groups: Dict[str, list] = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for lang, items in groups.items():
+                live = [it for it in items if not it[2].done()]
+                if not live:
+                    continue
+                try:
+                    results = await self._inference.run(
+                        _decode_batch, [it[0] for it in live], lang
+                    )
+                except Exception as e:  # noqa: BLE001
+                    for it in live:
+                        if not it[2].done():
+                            it[2].set_exception(e)
+                    continue
+                self.stats["batches"] += 1
+                self.stats["items"] += len(live)
+                self.stats["max_batch"] = max(self.stats["max_batch"], len(live))
+                for it, res in zip(live, results):
+                    if not it[2].done():
+                        it[2].set_result(res)
+        finally:
+            self._slots.release()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "max_size": self.max_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "waiting": self._queue.qsize(),
+            **self.stats,
+        }
+
+
+inference: Optional[InferenceQueue] = None
+batcher: Optional[WhisperBatcher] = None
+
+
+# Pula połączeń do Ollamy - jeden klient na cały czas życia aplikacji, więc
+# TLS handshake (HTTPS) robimy raz, a nie przy każdym podsumowaniu, tytule
+# i sondzie /health/. HTTP/2 (multipleksacja), jeśli serwer je obsługuje.
+OLLAMA_HTTP2 = os.environ.get("OLLAMA_HTTP2", "true").lower() in ("1", "true", "yes", "on")
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "10"))
+OLLAMA_MAX_KEEPALIVE = int(os.environ.get("OLLAMA_MAX_KEEPALIVE", "5"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.environ.get("OLLAMA_KEEPALIVE_EXPIRY", "120"))
+
+
+class OllamaPool:
+    """
+    Współdzielony ``httpx.AsyncClient`` do Ollamy (tworzony w ``lifespan``).
+
+    Zlicza żądania i NOWE połączenia TCP (rozszerzenie ``trace`` httpcore),
+    więc ``status()`` pokazuje, ile żądań poszło po istniejącym połączeniu.
+    """
+
+    def __init__(self, base_url: str):
+        http2 = OLLAMA_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401  (httpx potrzebuje pakietu h2 dla HTTP/2)
+            except ImportError:
+                logger.warning("Pakiet h2 niedostępny - Ollama po HTTP/1.1")
+                http2 = False
+        self.http2 = http2
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+                keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self.stats = {"requests": 0, "new_connections": 0, "http2_responses": 0}
+
+    async def _trace(self, event: str, _info):
+        if event == "connection.connect_tcp.complete":
+            self.stats["new_connections"] += 1
+
+    def _count(self, response: httpx.Response) -> httpx.Response:
+        if response.http_version == "HTTP/2":
+            self.stats["http2_responses"] += 1
+        return response
+
+    async def get(self, path: str, timeout: float) -> httpx.Response:
+        self.stats["requests"] += 1
+        return self._count(await self.client.get(
+            path, timeout=timeout, extensions={"trace": self._trace}
+        ))
+
+    async def post(self, path: str, timeout: float, **kwargs) -> httpx.Response:
+        self.stats["requests"] += 1
+        return self._count(await self.client.post(
+            path, timeout=timeout, extensions={"trace": self._trace}, **kwargs
+        ))
+
+    async def send_stream(self, path: str, timeout: float, **kwargs) -> httpx.Response:
+        """POST ze strumieniowaną odpowiedzią - wołający musi ją zamknąć (aclose)."""
+        self.stats["requests"] += 1
+        request = self.client.build_request(
+            "POST", path, timeout=timeout, extensions={"trace": self._trace}, **kwargs
+        )
+        return self._count(await self.client.send(request, stream=True))
+
+    def status(self) -> Dict[str, Any]:
+        reused = max(0, self.stats["requests"] - self.stats["new_connections"])
+        return {"http2": self.http2, "reused": reused, **self.stats}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+ollama: Optional[OllamaPool] = None
+
+# Cache wyników /summarize/ (podsumowania, tytuły) adresowany treścią:
+# klucz = sha256 z (tekst, model, prompt systemowy, kontekst, zadanie,
+# temperatura, ...). `/summarize all` dla już podsumowanych nagrań nie
+# odpala wtedy Ollamy ponownie. Wpisy leżą na dysku (przeżywają restart),
+# najdawniej używane są usuwane po przekroczeniu SUMMARY_CACHE_MAX_MB
+# (0 = cache wyłączony). Identyczne żądania w locie idą do Ollamy raz.
+SUMMARY_CACHE_DIR = os.environ.get("SUMMARY_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "summaries"
+)
+SUMMARY_CACHE_MAX_MB = max(0.0, float(os.environ.get("SUMMARY_CACHE_MAX_MB", "64")))
+
+
+class SummaryCache:
+    """
+    Dyskowy cache LRU tekstów wynikowych + single-flight dla żądań w locie.
+
+    Każdy wpis to osobny plik ``<katalog>/<ab>/<klucz>.json``; kolejność LRU
+    trzymana w pamięci (odtwarzana z mtime przy starcie), trafienie odświeża
+    mtime pliku, więc kolejność przeżywa restart.
+
+    Żądanie w locie to przyszłość w ``_inflight``: wynik albo anulowanie, gdy
+    prowadzące żądanie go nie dało - czekający liczą wtedy sami.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # klucz -> rozmiar
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key_for(request: "SummarizeRequest") -> str:
+        material = json.dumps({
+            "text": request.text,
+            "model_name": _model_for(request),
+            # Modele kroków map-reduce też wpływają na wynik.
+            "map_models": [_model_for(request, "map"), _model_for(request, "reduce")],
+            "system_prompt": request.system_prompt,
+            "context": request.context,
+            "task": (request.task or "summary").lower(),
+            "temperature": request.temperature or 0.0,
+            # Też zmieniają wynik, więc wchodzą do klucza.
+            "mode": (request.mode or "auto").lower(),
+            "additional_params": request.additional_params,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def load(self) -> None:
+        """Odtwarza indeks LRU z plików na dysku (wołane raz, w wątku)."""
+        found = []
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                found.append((st.st_mtime, name[:-5], st.st_size))
+        with self._lock:
+            for _mtime, key, size in sorted(found):
+                self._entries[key] = size
+                self._bytes += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = json.load(f)["text"]
+            os.utime(path)
+            return text
+        except (OSError, ValueError, KeyError):
+            self._drop(key)
+            return None
+
+    def put(self, key: str, text: str, meta: Dict[str, Any]) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"text": text, **meta}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+        self._evict()
+
+    def _drop(self, key: str) -> None:
+        with self._lock:
+            self._bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        while True:
+            with self._lock:
+                if self._bytes <= self.max_bytes or not self._entries:
+                    return
+                key = next(iter(self._entries))
+                self.stats["evictions"] += 1
+            self._drop(key)
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """Wynik z dysku albo z identycznego żądania, które właśnie trwa."""
+        if not self.enabled:
+            return None
+        text = await asyncio.to_thread(self.get, key)
+        if text is not None:
+            self.stats["hits"] += 1
+            return text
+        pending = self._inflight.get(key)
+        while pending is not None:
+            self.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise  # anulowano nas, nie prowadzące żądanie
+            # Prowadzące żądanie nie dało wyniku: czekamy na kolejne, które
+            # już ruszyło, albo wołający liczy sam.
+            nxt = self._inflight.get(key)
+            pending = nxt if nxt is not pending else None
+        return None
+
+    async def get_or_compute(self, key: str, compute, meta: Dict[str, Any]) -> str:
+        """Single-flight: równoległe identyczne żądania czekają na jedno wywołanie."""
+        if not self.enabled:
+            return await compute()
+        cached = await self.lookup(key)
+        if cached is not None:
+            return cached
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            text = await compute()
+        except BaseException:
+            future.cancel()  # czekający policzą sami (``lookup``)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(text)
+        await self.store(key, text, meta)
+        return text
+
+    def begin(self, key: str) -> Optional[asyncio.Future]:
+        """Rejestruje strumień jako żądanie w locie (bez niego cache wyłączony)."""
+        if not self.enabled or key in self._inflight:
+            return None
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    async def finish(self, key: str, future: Optional[asyncio.Future], text: Optional[str],
+                     meta: Dict[str, Any]) -> None:
+        """Domyka ``begin``: ``text=None`` oznacza błąd (nic nie zapisujemy)."""
+        if future is None:
+            return
+        self._inflight.pop(key, None)
+        if text is None:
+            future.cancel()  # czekający policzą sami (``lookup``)
+            return
+        future.set_result(text)
+        await self.store(key, text, meta)
+
+    async def store(self, key: str, text: str, meta: Dict[str, Any]) -> None:
+        if not text:
+            return
+        try:
+            await asyncio.to_thread(self.put, key, text, meta)
+        except OSError as e:
+            logger.warning(f"Nie udało się zapisać wpisu cache podsumowań: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "in_flight": len(self._inflight),
+            **self.stats,
+        }
+
+
+summary_cache: Optional[SummaryCache] = None
+
+
+def _approx_tokens(text: str) -> int:
+    # Zgrubnie ~3 znaki/token dla polskiego tekstu (bezpieczny, lekko zawyżony).
+    return len(text) // 3
+
 
 def _estimate_num_ctx(system_prompt: str, user_prompt: str) -> int:
     """Dobiera num_ctx tak, by zmieścił cały prompt + odpowiedź (z granicami)."""
-    # Zgrubnie ~3 znaki/token dla polskiego tekstu (bezpieczny, lekko zawyżony).
-    approx_tokens = (len(system_prompt) + len(user_prompt)) // 3
-    needed = approx_tokens + _CTX_OUTPUT_RESERVE
+    needed = _approx_tokens(system_prompt) + _approx_tokens(user_prompt) + _CTX_OUTPUT_RESERVE
     return max(OLLAMA_NUM_CTX, min(needed, OLLAMA_NUM_CTX_MAX))
 
 
 async def ollama_is_available() -> Dict[str, Any]:
     """Sprawdza dostępność Ollamy. Ollama nie ma /api/health - używamy /api/tags."""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{OLLAMA_API_URL}/api/tags")
-            return {
-                "available": response.status_code == 200,
-                "status_code": response.status_code,
-            }
+        response = await ollama.get("/api/tags", timeout=5.0)
+        return {
+            "available": response.status_code == 200,
+            "status_code": response.status_code,
+            "pool": ollama.status(),
+        }
     except Exception as e:  # noqa: BLE001
         return {"available": False, "error": str(e)}
 
@@ -75,7 +579,7 @@ async def ollama_is_available() -> Dict[str, Any]:
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     """Ładuje model Whisper przy starcie aplikacji (zamiast on_event)."""
-    global whisper_model
+    global whisper_model, inference, batcher, ollama, summary_cache
     try:
         logger.info(f"Ładowanie modelu Whisper o rozmiarze: {WHISPER_MODEL_SIZE}")
         whisper_model = whisper.load_model(WHISPER_MODEL_SIZE)
@@ -84,6 +588,21 @@ async def lifespan(_app: FastAPI):
         logger.error(f"Błąd podczas ładowania modelu Whisper: {e}")
         raise
 
+    inference = InferenceQueue(WHISPER_WORKERS, WHISPER_QUEUE_DEPTH)
+    logger.info(f"Kolejka Whispera: {WHISPER_WORKERS} wątek(i), głębokość {WHISPER_QUEUE_DEPTH}")
+    if WHISPER_BATCH_SIZE > 1:
+        batcher = WhisperBatcher(inference, WHISPER_BATCH_SIZE, WHISPER_BATCH_WAIT_MS)
+        batcher.start()
+        logger.info(f"Batching Whispera: do {WHISPER_BATCH_SIZE} nagrań, okno {WHISPER_BATCH_WAIT_MS:.0f} ms")
+
+    ollama = OllamaPool(OLLAMA_API_URL)
+    summary_cache = SummaryCache(SUMMARY_CACHE_DIR, int(SUMMARY_CACHE_MAX_MB * 1024 * 1024))
+    if summary_cache.enabled:
+        await asyncio.to_thread(summary_cache.load)
+        logger.info(
+            f"Cache podsumowań: {SUMMARY_CACHE_DIR} "
+            f"({summary_cache.status()['entries']} wpisów, limit {SUMMARY_CACHE_MAX_MB:g} MB)"
+        )
     ollama_status = await ollama_is_available()
     if ollama_status.get("available"):
         logger.info("Ollama API jest dostępne")
@@ -91,7 +610,10 @@ async def lifespan(_app: FastAPI):
         logger.warning(f"Ollama API nie jest dostępne: {ollama_status}")
 
     yield
-    # (brak specjalnego sprzątania przy zamknięciu)
+    if batcher is not None:
+        await batcher.stop()
+    inference.shutdown()
+    await ollama.aclose()
 
 
 app = FastAPI(
@@ -110,11 +632,21 @@ app.add_middleware(
 )
 
 
+class WordTiming(BaseModel):
+    word: str
+    start: float
+    end: float
+
+
 class TranscriptionResponse(BaseModel):
     text: str
     language: Optional[str] = None
     duration: Optional[float] = None
     model_used: str
+    # Tylko z ?word_timestamps=true: słowa z czasem (s) względem początku audio.
+    words: Optional[List[WordTiming]] = None
+    # Tylko z ?spans=...: tekst każdej sklejonej części (po filtrze halucynacji).
+    parts: Optional[List[str]] = None
 
 
 class SummarizeRequest(BaseModel):
@@ -126,6 +658,12 @@ class SummarizeRequest(BaseModel):
     additional_params: Optional[Dict[str, Any]] = None
     # "summary" (domyślnie) albo "title" - krótki tytuł rozmowy.
     task: Optional[str] = "summary"
+    # "auto" | "single" | "map_reduce" - patrz OLLAMA_CHUNK_TOKENS.
+    mode: Optional[str] = "auto"
+    # Routing modeli per zadanie, np. {"title": "gemma3:1b", "map": "..."}.
+    # Zadania bez wpisu używają model_name. Map-reduce: "map" (kawałki),
+    # "reduce" (redukcje pośrednie); końcowa redukcja to samo zadanie (summary).
+    task_models: Optional[Dict[str, str]] = None
 
 
 class SummarizeResponse(BaseModel):
@@ -133,6 +671,18 @@ class SummarizeResponse(BaseModel):
     model_used: str
 
 
+class EmbedRequest(BaseModel):
+    texts: List[str]
+    # Brak = OLLAMA_EMBED_MODEL.
+    model_name: Optional[str] = None
+
+
+class EmbedResponse(BaseModel):
+    embeddings: List[List[float]]
+    model_used: str
+    dim: int
+
+
 # ---------------------------------------------------------------------------
 # Wykrywanie halucynacji Whispera
 #
@@ -198,6 +748,256 @@ def _looks_like_hallucination(result: Dict[str, Any]) -> bool:
     return False
 
 
+def _resolve_language(language: Optional[str]) -> str:
+    """Język transkrypcji: parametr zapytania > zmienna środowiskowa."""
+    return (language or WHISPER_LANGUAGE or "auto").lower()
+
+
+# Progi ``transcribe`` ograniczające halucynacje na ciszy/szumie - wspólne
+# dla pełnej ścieżki i kontroli wyników batcha (``_decode_batch``).
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+COMPRESSION_RATIO_THRESHOLD = 2.4
+
+
+def _run_whisper(audio, lang: str, word_timestamps: bool = False) -> Dict[str, Any]:
+    """Blokujące wywołanie Whispera - wykonywane w wątku ``inference``."""
+    transcribe_kwargs = {
+        "word_timestamps": word_timestamps,
+        # Ograniczenie halucynacji Whispera na ciszy/szumie:
+        "temperature": 0.0,
+        "condition_on_previous_text": False,
+        "no_speech_threshold": NO_SPEECH_THRESHOLD,
+        "logprob_threshold": LOGPROB_THRESHOLD,
+        "compression_ratio_threshold": COMPRESSION_RATIO_THRESHOLD,
+    }
+    if lang and lang != "auto":
+        transcribe_kwargs["language"] = lang
+    return whisper_model.transcribe(audio, **transcribe_kwargs)
+
+
+def _decode_batch(audios, lang: str):
+    """
+    Dekoduje kilka krótkich nagrań (≤ 30 s) jednym przebiegiem modelu.
+
+    Odpowiednik ``_run_whisper`` dla pojedynczego okna: temperatura 0 i ten
+    sam próg ciszy (no_speech > 0.6 przy avg_logprob < -1.0 -> pusty tekst).
+    Wynik ma kształt zgodny z ``transcribe`` (text/segments/language).
+
+    Element, który nie przechodzi kontroli ``transcribe`` (stopień kompresji
+    > 2.4 albo avg_logprob < -1.0, a nie jest ciszą), jest liczony jeszcze
+    raz przez ``_run_whisper`` - wynik jest wtedy taki sam jak bez batchingu.
+    """
+    n_mels = whisper_model.dims.n_mels
+    device = whisper_model.device
+    mels = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(a), n_mels, device=device)
+        for a in audios
+    ])
+    options = whisper.DecodingOptions(
+        language=None if lang == "auto" else lang,
+        temperature=0.0,
+        without_timestamps=True,
+        fp16=device.type == "cuda",
+    )
+    decoded = whisper.decode(whisper_model, mels, options)
+    out = []
+    for audio, r in zip(audios, decoded):
+        silent = r.no_speech_prob > NO_SPEECH_THRESHOLD
+        if not silent and (r.compression_ratio > COMPRESSION_RATIO_THRESHOLD
+                           or r.avg_logprob < LOGPROB_THRESHOLD):
+            out.append(_run_whisper(audio, lang))
+            continue
+        text = r.text
+        if silent and r.avg_logprob < LOGPROB_THRESHOLD:
+            text = ""
+        out.append({
+            "text": text,
+            "language": r.language,
+            "duration": len(audio) / whisper.audio.SAMPLE_RATE,
+            "segments": [{
+                "text": text,
+                "no_speech_prob": r.no_speech_prob,
+                "avg_logprob": r.avg_logprob,
+                "compression_ratio": r.compression_ratio,
+            }] if text else [],
+        })
+    return out
+
+
+@functools.lru_cache(maxsize=8)
+def _lowpass_taps(factor: int) -> np.ndarray:
+    """Filtr antyaliasingowy (okienkowany sinc) do decymacji o ``factor``."""
+    numtaps = 16 * factor + 1
+    n = np.arange(numtaps) - (numtaps - 1) / 2
+    cutoff = 0.45 / factor   # trochę poniżej Nyquista docelowej częstotliwości
+    h = np.sinc(2 * cutoff * n) * np.hamming(numtaps)
+    return (h / h.sum()).astype(np.float32)
+
+
+# Ile próbek wyjściowych filtrować naraz (okna float32: ~49 x 8192 x 4 B).
+_RESAMPLE_CHUNK = 8192
+
+
+def _resample(audio: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    if src_rate == dst_rate:
+        return audio
+    if src_rate > dst_rate and src_rate % dst_rate == 0:
+        # Typowy przypadek (Discord 48 kHz -> 16 kHz): FIR liczony tylko dla
+        # zachowywanych próbek (polifazowo) - to samo co convolve(..., "same")
+        # [::factor], ale bez liczenia próbek, które i tak byłyby wyrzucone.
+        factor = src_rate // dst_rate
+        if not len(audio):
+            return audio.astype(np.float32)
+        taps = _lowpass_taps(factor)
+        half = (len(taps) - 1) // 2
+        padded = np.pad(audio.astype(np.float32, copy=False), (half, half))
+        n_out = (len(audio) + factor - 1) // factor
+        # Okna filtra tylko co factor-tą próbkę (widok bez kopii), mnożone
+        # kawałkami, żeby kopia robocza matmul miała stały rozmiar.
+        windows = sliding_window_view(padded, len(taps))[::factor][:n_out]
+        out = np.empty(n_out, dtype=np.float32)
+        for i in range(0, n_out, _RESAMPLE_CHUNK):
+            out[i:i + _RESAMPLE_CHUNK] = windows[i:i + _RESAMPLE_CHUNK] @ taps
+        return out
+    # Nietypowe częstotliwości: interpolacja liniowa.
+    n_out = int(round(len(audio) * dst_rate / src_rate))
+    x_out = np.linspace(0, len(audio) - 1, n_out) if n_out else np.empty(0)
+    return np.interp(x_out, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def _pcm_to_float32(raw: bytes, sample_rate: int, channels: int) -> np.ndarray:
+    """
+    Surowe ramki int16 LE (kanały przeplatane) -> float32 mono w rozdzielczości
+    Whispera (16 kHz), w zakresie [-1, 1]. Bez plików tymczasowych i ffmpeg.
+    """
+    if sample_rate <= 0 or channels <= 0:
+        raise ValueError("Nieprawidłowa częstotliwość próbkowania lub liczba kanałów")
+    if len(raw) % (2 * channels):
+        raise ValueError("Długość danych nie jest wielokrotnością ramki int16")
+    samples = np.frombuffer(raw, dtype="<i2")
+    if channels > 1:
+        audio = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    else:
+        audio = samples.astype(np.float32)
+    audio /= 32768.0
+    return _resample(audio, sample_rate, whisper.audio.SAMPLE_RATE)
+
+
+def _wire_encodings() -> list:
+    """Kodowania audio, które serwer dekoduje sam (ogłaszane w /health/)."""
+    encodings = ["pcm"]
+    if sf is not None:
+        if "FLAC" in sf.available_formats():
+            encodings.append("flac")
+        if "OPUS" in sf.available_subtypes("OGG"):
+            encodings.append("opus")
+    return encodings
+
+
+# Rozszerzenia plików dekodowane przez soundfile zamiast ffmpeg.
+_SOUNDFILE_EXTS = {".flac", ".ogg", ".opus"}
+
+
+def _decode_compressed(data: bytes) -> np.ndarray:
+    """FLAC/Ogg-Opus (w pamięci) -> float32 mono 16 kHz, bez ffmpeg."""
+    if sf is None:
+        raise ValueError("Dekodowanie FLAC/Opus niedostępne (brak soundfile)")
+    audio, rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    return _resample(audio.mean(axis=1), rate, whisper.audio.SAMPLE_RATE)
+
+
+def _parse_spans(spans: str) -> List[Tuple[float, float]]:
+    """``"0-3.2,4.2-7"`` -> [(0.0, 3.2), (4.2, 7.0)] (rosnące, niepuste)."""
+    out = []
+    for item in spans.split(","):
+        begin, sep, end = item.strip().partition("-")
+        if not sep:
+            raise ValueError(f"zły zakres: {item!r}")
+        begin, end = float(begin), float(end)
+        if end < begin or (out and begin < out[-1][1]):
+            raise ValueError(f"zakresy nie rosną: {item!r}")
+        out.append((begin, end))
+    if not out:
+        raise ValueError("brak zakresów")
+    return out
+
+
+def _split_parts(result: Dict[str, Any], spans: List[Tuple[float, float]]) -> List[str]:
+    """
+    Tekst sklejonego nagrania -> tekst każdej części. Słowo należy do części,
+    której zakres (poszerzony do połowy przerwy z każdej strony) zawiera jego
+    środek. Filtr halucynacji działa na każdej części osobno - z segmentami,
+    z których pochodzą jej słowa - tak jak przy osobnych żądaniach: cisza
+    jednej części nie zeruje mowy innych, a fraza "Dziękuję za uwagę" na
+    cichej części nie przechodzi dzięki mowie obok.
+    """
+    # Granice = środki przerw między kolejnymi częściami.
+    bounds = [(spans[i][1] + spans[i + 1][0]) / 2 for i in range(len(spans) - 1)]
+    words = [[] for _ in spans]
+    segments = [[] for _ in spans]
+    for seg in result.get("segments") or []:
+        for w in seg.get("words") or []:
+            k = bisect.bisect_right(bounds, (w["start"] + w["end"]) / 2)
+            words[k].append(w["word"])
+            if not segments[k] or segments[k][-1] is not seg:
+                segments[k].append(seg)
+    texts = []
+    for part_words, part_segments in zip(words, segments):
+        part = {"text": "".join(part_words).strip(), "segments": part_segments}
+        if part["text"] and _looks_like_hallucination(part):
+            logger.info(f"Odrzucono prawdopodobną halucynację (część okna): {part['text']!r}")
+            part["text"] = ""
+        texts.append(part["text"])
+    return texts
+
+
+async def _transcribe_array(audio: np.ndarray, lang: str, word_timestamps: bool = False) -> Dict[str, Any]:
+    """
+    Krótkie nagranie (jedno okno) -> batcher; dłuższe -> pełne transcribe.
+    Znaczniki czasu słów liczy tylko pełne transcribe (batcher dekoduje bez nich).
+    """
+    if not word_timestamps and batcher is not None and len(audio) <= whisper.audio.N_SAMPLES:
+        return await batcher.submit(audio, lang)
+    return await inference.run(_run_whisper, audio, lang, word_timestamps)
+
+
+def _to_response(result: Dict[str, Any], word_timestamps: bool = False,
+                 spans: Optional[List[Tuple[float, float]]] = None) -> TranscriptionResponse:
+    text = result.get("text", "").strip()
+    # Odrzuć prawdopodobne halucynacje na ciszy/szumie -> pusty tekst.
+    # Bot zamienia pusty wynik na znacznik "----------------" w podglądzie.
+    hallucination = _looks_like_hallucination(result)
+    if hallucination:
+        logger.info(f"Odrzucono prawdopodobną halucynację: {text!r}")
+        text = ""
+
+    words = None
+    if word_timestamps:
+        words = [] if hallucination else [
+            WordTiming(word=w["word"], start=w["start"], end=w["end"])
+            for seg in result.get("segments") or [] for w in seg.get("words") or []
+        ]
+    return TranscriptionResponse(
+        text=text,
+        language=result.get("language"),
+        duration=result.get("duration"),
+        model_used=f"whisper-{WHISPER_MODEL_SIZE}",
+        words=words,
+        parts=_split_parts(result, spans) if spans else None,
+    )
+
+
+def _queue_full(e: QueueFullError) -> HTTPException:
+    """429 + Retry-After - bot odczekuje i ponawia zamiast zasypywać GPU."""
+    logger.warning(str(e))
+    return HTTPException(
+        status_code=429,
+        detail="Kolejka transkrypcji jest pełna, spróbuj ponownie później",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
 @app.post("/transcribe/", response_model=TranscriptionResponse)
 async def transcribe_audio(
         file: UploadFile = File(...),
@@ -205,7 +1005,7 @@ async def transcribe_audio(
         language: str = Query(None, description="Kod języka (np. 'pl'); 'auto' = autodetekcja. Domyślnie z WHISPER_LANGUAGE."),
 ):
     """
-    Transkrypcja pliku audio (WAV lub MP3) modelem Whisper.
+    Transkrypcja pliku audio (WAV, MP3, FLAC lub Ogg/Opus) modelem Whisper.
 
     Uwaga: Ollama nie potrafi transkrybować audio, więc niezależnie od
     parametru transkrypcję zawsze wykonuje Whisper.
@@ -216,55 +1016,38 @@ async def transcribe_audio(
             detail="Ollama nie obsługuje transkrypcji audio. Użyj model_type=whisper.",
         )
 
-    if whisper_model is None:
+    if whisper_model is None or inference is None:
         raise HTTPException(status_code=503, detail="Model Whisper nie został załadowany")
 
     if not file.filename:
         raise HTTPException(status_code=400, detail="Brak pliku audio")
 
     file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext not in ['.wav', '.mp3']:
-        raise HTTPException(status_code=400, detail="Obsługiwane są tylko pliki WAV i MP3")
+    if file_ext not in ['.wav', '.mp3'] and not (file_ext in _SOUNDFILE_EXTS and sf is not None):
+        raise HTTPException(status_code=400, detail="Obsługiwane są pliki WAV, MP3, FLAC i Ogg/Opus")
 
     temp_path = None
     try:
-        content = await file.read()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-            temp_path = temp_file.name
-            temp_file.write(content)
-
-        # Ustal język: parametr zapytania > zmienna środowiskowa.
-        lang = (language or WHISPER_LANGUAGE or "auto").lower()
-        transcribe_kwargs = {
-            # Ograniczenie halucynacji Whispera na ciszy/szumie:
-            "temperature": 0.0,
-            "condition_on_previous_text": False,
-            "no_speech_threshold": 0.6,
-            "logprob_threshold": -1.0,
-            "compression_ratio_threshold": 2.4,
-        }
-        if lang and lang != "auto":
-            transcribe_kwargs["language"] = lang
+        async with inference.slot():
+            content = await file.read()
+            if file_ext in _SOUNDFILE_EXTS:
+                audio = await asyncio.to_thread(_decode_compressed, content)
+            else:
+                with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
+                    temp_path = temp_file.name
+                    temp_file.write(content)
+                # Dekodowanie ffmpeg poza pętlą i poza wątkiem GPU.
+                audio = await asyncio.to_thread(whisper.load_audio, temp_path)
 
-        logger.info(
-            f"Transkrypcja pliku: {file.filename} "
-            f"(Whisper {WHISPER_MODEL_SIZE}, język: {lang})"
-        )
-        result = whisper_model.transcribe(temp_path, **transcribe_kwargs)
-
-        text = result.get("text", "").strip()
-        # Odrzuć prawdopodobne halucynacje na ciszy/szumie -> pusty tekst.
-        # Bot zamienia pusty wynik na znacznik "----------------" w podglądzie.
-        if _looks_like_hallucination(result):
-            logger.info(f"Odrzucono prawdopodobną halucynację: {text!r}")
-            text = ""
-
-        return TranscriptionResponse(
-            text=text,
-            language=result.get("language"),
-            duration=result.get("duration"),
-            model_used=f"whisper-{WHISPER_MODEL_SIZE}",
-        )
+            lang = _resolve_language(language)
+            logger.info(
+                f"Transkrypcja pliku: {file.filename} "
+                f"(Whisper {WHISPER_MODEL_SIZE}, język: {lang})"
+            )
+            result = await _transcribe_array(audio, lang)
+        return _to_response(result)
+    except QueueFullError as e:
+        raise _queue_full(e)
     except Exception as e:
         logger.error(f"Błąd podczas transkrypcji: {e}")
         raise HTTPException(status_code=500, detail=f"Błąd transkrypcji: {str(e)}")
@@ -273,14 +1056,78 @@ async def transcribe_audio(
             os.unlink(temp_path)
 
 
-@app.post("/summarize/", response_model=SummarizeResponse)
-async def summarize_text(request: SummarizeRequest = Body(...)):
+@app.post("/transcribe_pcm/", response_model=TranscriptionResponse)
+async def transcribe_pcm(
+        request: Request,
+        x_sample_rate: int = Header(48000, description="Częstotliwość próbkowania PCM (Hz)"),
+        x_channels: int = Header(2, description="Liczba kanałów (przeplatanych)"),
+        x_audio_encoding: str = Header("pcm", description="pcm | flac | opus (patrz /health/)"),
+        language: str = Query(None, description="Kod języka (np. 'pl'); 'auto' = autodetekcja. Domyślnie z WHISPER_LANGUAGE."),
+        word_timestamps: bool = Query(False, description="Zwróć słowa ze znacznikami czasu (pole 'words')."),
+        spans: Optional[str] = Query(None, description="Zakresy sklejonych części w sekundach, np. '0-3.2,4.2-7' (pole 'parts')."),
+):
     """
-    Podsumowanie / przetworzenie tekstu modelem Ollama (czysto tekstowo).
+    Transkrypcja surowego PCM (int16 little-endian) przesłanego w treści żądania.
+
+    Format opisują nagłówki ``X-Sample-Rate`` i ``X-Channels``. Dane trafiają
+    do modelu jako tablica NumPy - bez multipart, pliku tymczasowego i ffmpeg.
+    Z ``X-Audio-Encoding: flac|opus`` treść jest skompresowanym strumieniem
+    (format opisuje wtedy sam kontener), dekodowanym w procesie.
+
+    ``word_timestamps=true`` dodaje listę słów z czasami. ``spans`` to zakresy
+    kilku krótkich wypowiedzi sklejonych przez bota w jedno okno - tekst wraca
+    rozdzielony na nie (``parts``, wg czasów słów), a każda część przechodzi
+    przez filtr halucynacji osobno. Wymaga znaczników czasu słów, więc takie
+    żądanie idzie pełnym ``transcribe`` (z wyrównaniem DTW), z pominięciem batchera.
     """
-    if not request.text.strip():
-        raise HTTPException(status_code=400, detail="Pole 'text' nie może być puste")
+    encoding = (x_audio_encoding or "pcm").lower()
+    if encoding not in _wire_encodings():
+        raise HTTPException(status_code=415, detail=f"Nieobsługiwane kodowanie audio: {encoding}")
+    try:
+        part_spans = _parse_spans(spans) if spans else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Niepoprawne spans: {e}")
+    if whisper_model is None or inference is None:
+        raise HTTPException(status_code=503, detail="Model Whisper nie został załadowany")
+
+    try:
+        async with inference.slot():
+            raw = await request.body()
+            if not raw:
+                raise HTTPException(status_code=400, detail="Brak danych audio")
+            try:
+                if encoding == "pcm":
+                    # Konwersja i filtr poza pętlą zdarzeń (jak dekodowanie FLAC/Opus).
+                    audio = await asyncio.to_thread(_pcm_to_float32, raw, x_sample_rate, x_channels)
+                else:
+                    audio = await asyncio.to_thread(_decode_compressed, raw)
+            except (ValueError, RuntimeError) as e:  # RuntimeError = sf.LibsndfileError
+                raise HTTPException(status_code=400, detail=f"Nie udało się zdekodować audio: {e}")
+
+            lang = _resolve_language(language)
+            logger.info(
+                f"Transkrypcja {encoding}: {len(raw)} B, {x_sample_rate} Hz x{x_channels} "
+                f"(Whisper {WHISPER_MODEL_SIZE}, język: {lang})"
+            )
+            result = await _transcribe_array(audio, lang, word_timestamps or bool(part_spans))
+        return _to_response(result, word_timestamps, part_spans)
+    except QueueFullError as e:
+        raise _queue_full(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Błąd podczas transkrypcji PCM: {e}")
+        raise HTTPException(status_code=500, detail=f"Błąd transkrypcji: {str(e)}")
+
 
+def _model_for(request: SummarizeRequest, task: Optional[str] = None) -> str:
+    """Model dla zadania: wpis z task_models albo model_name."""
+    task = (task or request.task or "summary").lower()
+    return (request.task_models or {}).get(task) or request.model_name
+
+
+def _task_prompts(request: SummarizeRequest) -> Tuple[str, str]:
+    """Prompt systemowy i użytkownika dla zadania (title/summary)."""
     if (request.task or "summary").lower() == "title":
         system_prompt = request.system_prompt or (
             "Jesteś generatorem krótkich tytułów rozmów w języku polskim. "
@@ -290,9 +1137,13 @@ async def summarize_text(request: SummarizeRequest = Body(...)):
         user_prompt = ""
         if request.context:
             user_prompt += f"Kontekst: {request.context}\n\n"
+        # Do tytułu wystarczy początek rozmowy - nie rozdmuchujemy num_ctx.
+        text = request.text
+        if _approx_tokens(text) > OLLAMA_CHUNK_TOKENS:
+            text = _split_chunks(text, OLLAMA_CHUNK_TOKENS)[0]
         user_prompt += (
             "Nadaj krótki, konkretny tytuł poniższej rozmowie. Zwróć tylko tytuł.\n\n"
-            f"{request.text}\n\nTytuł:"
+            f"{text}\n\nTytuł:"
         )
     else:
         system_prompt = request.system_prompt or (
@@ -306,11 +1157,17 @@ async def summarize_text(request: SummarizeRequest = Body(...)):
             "Poniżej znajduje się transkrypcja rozmowy. Przygotuj zwięzłe "
             f"podsumowanie:\n\n{request.text}\n\nPodsumowanie:"
         )
+    return system_prompt, user_prompt
 
+
+def _generate_payload(request: SummarizeRequest, system_prompt: str, user_prompt: str,
+                      task: Optional[str] = None) -> Dict[str, Any]:
+    """Prompty + opcje żądania -> payload Ollama /api/generate (model wg zadania)."""
+    model = _model_for(request, task)
     # Dobierz okno kontekstu do długości promptu, by Ollama nie obcięła wejścia.
     num_ctx = _estimate_num_ctx(system_prompt, user_prompt)
     logger.info(
-        f"Ollama /generate: model={request.model_name}, "
+        f"Ollama /generate: model={model}, "
         f"prompt≈{len(system_prompt) + len(user_prompt)} znaków, num_ctx={num_ctx}"
     )
     options: Dict[str, Any] = {
@@ -318,7 +1175,7 @@ async def summarize_text(request: SummarizeRequest = Body(...)):
         "num_ctx": num_ctx,
     }
     payload: Dict[str, Any] = {
-        "model": request.model_name,
+        "model": model,
         "system": system_prompt,
         "prompt": user_prompt,
         "stream": False,
@@ -327,18 +1184,87 @@ async def summarize_text(request: SummarizeRequest = Body(...)):
     # additional_params na końcu - może nadpisać num_ctx/temperature świadomie.
     if request.additional_params:
         payload["options"].update(request.additional_params)
+    return payload
+
+
+def _split_chunks(text: str, budget: int) -> List[str]:
+    """
+    Dzieli transkrypt na kawałki po ~``budget`` tokenów, tnąc wyłącznie na
+    granicach linii (jedna linia = jedna wypowiedź). Pojedyncza linia dłuższa
+    niż budżet jest dzielona twardo po znakach.
+    """
+    max_chars = budget * 3
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        pieces = [line[i:i + max_chars] for i in range(0, len(line), max_chars)]
+        for piece in pieces:
+            if current and size + len(piece) + 1 > max_chars:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _use_map_reduce(request: SummarizeRequest) -> bool:
+    mode = (request.mode or "auto").lower()
+    if mode not in ("auto", "single", "map_reduce"):
+        raise HTTPException(status_code=400, detail=f"Nieznany tryb: {request.mode}")
+    if (request.task or "summary").lower() != "summary" or mode == "single":
+        return False
+    return mode == "map_reduce" or _approx_tokens(request.text) > OLLAMA_CHUNK_TOKENS
+
+
+def _map_prompts(request: SummarizeRequest, chunk: str, index: int, total: int) -> Tuple[str, str]:
+    system_prompt = (
+        "Jesteś ekspertem w podsumowywaniu rozmów. Streszczasz fragment dłuższej "
+        "transkrypcji w języku polskim - zwięźle, ale bez pomijania wątków."
+    )
+    user_prompt = ""
+    if request.context:
+        user_prompt += f"Kontekst rozmowy: {request.context}\n\n"
+    user_prompt += (
+        f"Poniżej fragment {index}/{total} transkrypcji rozmowy. Wypisz zwięźle "
+        "poruszone wątki, ustalenia i decyzje (z osobami, których dotyczą):"
+        f"\n\n{chunk}\n\nStreszczenie fragmentu:"
+    )
+    return system_prompt, user_prompt
+
+
+def _reduce_prompts(request: SummarizeRequest, partials: List[str], final: bool) -> Tuple[str, str]:
+    joined = "\n\n".join(f"### Część {i}\n{p}" for i, p in enumerate(partials, 1))
+    system_prompt = (request.system_prompt if final else None) or (
+        "Jesteś ekspertem w podsumowywaniu rozmów. Tworzysz zwięzłe, "
+        "ale kompletne podsumowania transkrypcji w języku polskim."
+    )
+    user_prompt = ""
+    if request.context:
+        user_prompt += f"Kontekst rozmowy: {request.context}\n\n"
+    user_prompt += (
+        "Poniżej streszczenia kolejnych części jednej rozmowy (w kolejności). "
+        "Połącz je w jedno spójne podsumowanie całej rozmowy, bez powtórzeń:"
+        f"\n\n{joined}\n\nPodsumowanie:"
+    )
+    return system_prompt, user_prompt
 
+
+async def _ollama_generate(payload: Dict[str, Any]) -> str:
+    """Jedno (niestrumieniowe) wywołanie /api/generate; błędy -> HTTPException."""
     try:
-        async with httpx.AsyncClient(timeout=600.0) as client:
-            response = await client.post(f"{OLLAMA_API_URL}/api/generate", json=payload)
-            if response.status_code != 200:
-                logger.error(f"Błąd odpowiedzi Ollama: {response.text}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Ollama API error: {response.text}",
-                )
-            result_text = response.json().get("response", "").strip()
-            return SummarizeResponse(text=result_text, model_used=f"ollama-{request.model_name}")
+        response = await ollama.post("/api/generate", timeout=600.0, json=payload)
+        if response.status_code != 200:
+            logger.error(f"Błąd odpowiedzi Ollama: {response.text}")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Ollama API error: {response.text}",
+            )
+        return response.json().get("response", "").strip()
     except httpx.TimeoutException:
         logger.error("Timeout podczas oczekiwania na odpowiedź z Ollama API")
         raise HTTPException(status_code=504, detail="Timeout podczas podsumowania z Ollama")
@@ -349,18 +1275,216 @@ async def summarize_text(request: SummarizeRequest = Body(...)):
         raise HTTPException(status_code=500, detail=f"Błąd Ollama API: {str(e)}")
 
 
+async def _prepare_payload(request: SummarizeRequest) -> Dict[str, Any]:
+    """
+    Payload końcowego wywołania Ollamy. W trybie map-reduce najpierw liczy
+    streszczenia kawałków (równolegle, z limitem), a gdy razem nadal nie
+    mieszczą się w budżecie - redukuje je piętrami, aż zmieszczą się w jednym.
+    """
+    if not _use_map_reduce(request):
+        return _generate_payload(request, *_task_prompts(request))
+
+    limiter = asyncio.Semaphore(OLLAMA_MAP_CONCURRENCY)
+
+    async def run(task: str, prompts: Tuple[str, str]) -> str:
+        async with limiter:
+            return await _ollama_generate(_generate_payload(request, *prompts, task=task))
+
+    async def reduce_group(group: List[str]) -> str:
+        if len(group) == 1:
+            return group[0]
+        return await run("reduce", _reduce_prompts(request, group, final=False))
+
+    chunks = _split_chunks(request.text, OLLAMA_CHUNK_TOKENS)
+    logger.info(f"Map-reduce: {len(chunks)} kawałków po ~{OLLAMA_CHUNK_TOKENS} tokenów")
+    partials = await asyncio.gather(*(
+        run("map", _map_prompts(request, c, i, len(chunks))) for i, c in enumerate(chunks, 1)
+    ))
+    while len(partials) > 1 and _approx_tokens("\n\n".join(partials)) > OLLAMA_CHUNK_TOKENS:
+        groups: List[List[str]] = [[]]
+        for part in partials:
+            if groups[-1] and _approx_tokens("\n\n".join(groups[-1] + [part])) > OLLAMA_CHUNK_TOKENS:
+                groups.append([])
+            groups[-1].append(part)
+        if len(groups) == len(partials):
+            break  # każde streszczenie osobno przekracza budżet - dalej nie zejdziemy
+        logger.info(f"Map-reduce: redukcja pośrednia {len(partials)} -> {len(groups)}")
+        partials = await asyncio.gather(*(reduce_group(g) for g in groups))
+    return _generate_payload(request, *_reduce_prompts(request, list(partials), final=True))
+
+
+@app.post("/summarize/", response_model=SummarizeResponse)
+async def summarize_text(request: SummarizeRequest = Body(...)):
+    """
+    Podsumowanie / przetworzenie tekstu modelem Ollama (czysto tekstowo).
+    """
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Pole 'text' nie może być puste")
+
+    async def compute() -> str:
+        return await _ollama_generate(await _prepare_payload(request))
+
+    result_text = await summary_cache.get_or_compute(
+        SummaryCache.key_for(request), compute, _cache_meta(request)
+    )
+    return SummarizeResponse(text=result_text, model_used=f"ollama-{_model_for(request)}")
+
+
+def _cache_meta(request: SummarizeRequest) -> Dict[str, Any]:
+    return {"model": _model_for(request), "task": request.task, "created": time.time()}
+
+
+# Zadania czytające strumienie Ollamy (referencje - inaczej GC może je zebrać).
+_stream_tasks: set = set()
+
+
+@app.post("/summarize/stream/")
+async def summarize_text_stream(request: SummarizeRequest = Body(...)):
+    """
+    Jak /summarize/, ale tekst płynie na bieżąco (strumień tokenów Ollamy).
+
+    Odpowiedź to NDJSON: kolejne linie ``{"delta": "..."}``, na końcu
+    ``{"done": true, "model_used": "..."}``. Błąd po rozpoczęciu strumienia
+    (nagłówki już wysłane) przychodzi jako linia ``{"error": "..."}``.
+    """
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Pole 'text' nie może być puste")
+
+    model_used = f"ollama-{_model_for(request)}"
+    key = SummaryCache.key_for(request)
+    cached = await summary_cache.lookup(key)
+    if cached is not None:
+        async def replay():
+            yield _ndjson({"delta": cached})
+            yield _ndjson({"done": True, "model_used": model_used})
+
+        return StreamingResponse(replay(), media_type="application/x-ndjson")
+
+    # Strumień rejestruje się jako żądanie w locie - identyczne żądania
+    # (także /summarize/) poczekają na jego wynik zamiast pytać Ollamę.
+    pending = summary_cache.begin(key)
+    try:
+        # W trybie map-reduce streszczenia kawałków liczą się przed strumieniem;
+        # na bieżąco płynie dopiero końcowa redukcja.
+        payload = await _prepare_payload(request)
+        payload["stream"] = True
+        response = await ollama.send_stream("/api/generate", timeout=600.0, json=payload)
+    except HTTPException:
+        await summary_cache.finish(key, pending, None, {})
+        raise
+    except httpx.TimeoutException:
+        logger.error("Timeout podczas łączenia ze strumieniem Ollama API")
+        await summary_cache.finish(key, pending, None, {})
+        raise HTTPException(status_code=504, detail="Timeout podczas podsumowania z Ollama")
+    except Exception as e:
+        logger.error(f"Błąd podczas komunikacji z Ollama: {e}")
+        await summary_cache.finish(key, pending, None, {})
+        raise HTTPException(status_code=500, detail=f"Błąd Ollama API: {str(e)}")
+
+    if response.status_code != 200:
+        body = (await response.aread()).decode("utf-8", errors="replace")
+        await response.aclose()
+        logger.error(f"Błąd odpowiedzi Ollama: {body}")
+        await summary_cache.finish(key, pending, None, {})
+        raise HTTPException(status_code=response.status_code, detail=f"Ollama API error: {body}")
+
+    # Strumień Ollamy czyta osobne zadanie, a klient dostaje linie z kolejki:
+    # zadanie zawsze domyka ``pending`` i odpowiedź Ollamy - także gdy klient
+    # rozłączy się, zanim Starlette zacznie iterować ``relay`` (wynik i tak
+    # trafia do cache i do czekających na identyczne żądanie).
+    lines: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        parts: List[str] = []
+        complete = False
+        try:
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    lines.put_nowait({"error": f"Ollama API error: {chunk['error']}"})
+                    return
+                if chunk.get("response"):
+                    parts.append(chunk["response"])
+                    lines.put_nowait({"delta": chunk["response"]})
+                if chunk.get("done"):
+                    break
+            complete = True
+            lines.put_nowait({"done": True, "model_used": model_used})
+        except httpx.TimeoutException:
+            logger.error("Timeout podczas strumienia z Ollama API")
+            lines.put_nowait({"error": "Timeout podczas podsumowania z Ollama"})
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Błąd strumienia Ollama: {e}")
+            lines.put_nowait({"error": f"Błąd Ollama API: {str(e)}"})
+        finally:
+            lines.put_nowait(None)
+            try:
+                text = "".join(parts).strip() if complete else None
+                await summary_cache.finish(key, pending, text, _cache_meta(request))
+            finally:
+                await response.aclose()
+
+    task = asyncio.create_task(pump())
+    _stream_tasks.add(task)
+    task.add_done_callback(_stream_tasks.discard)
+
+    async def relay():
+        while True:
+            item = await lines.get()
+            if item is None:
+                return
+            yield _ndjson(item)
+
+    return StreamingResponse(relay(), media_type="application/x-ndjson")
+
+
+def _ndjson(obj: Dict[str, Any]) -> str:
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+
+@app.post("/embed/", response_model=EmbedResponse)
+async def embed_texts(request: EmbedRequest = Body(...)):
+    """Wektory embeddingów dla listy tekstów (proxy do Ollama /api/embed)."""
+    if not request.texts or not all(t.strip() for t in request.texts):
+        raise HTTPException(status_code=400, detail="Pole 'texts' musi zawierać niepuste teksty")
+    model = request.model_name or OLLAMA_EMBED_MODEL
+    try:
+        response = await ollama.post(
+            "/api/embed", timeout=300.0, json={"model": model, "input": request.texts}
+        )
+        if response.status_code != 200:
+            logger.error(f"Błąd odpowiedzi Ollama (embed): {response.text}")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Ollama API error: {response.text}",
+            )
+        vectors = response.json().get("embeddings") or []
+        if len(vectors) != len(request.texts):
+            raise HTTPException(status_code=502, detail="Ollama zwróciła złą liczbę wektorów")
+        return EmbedResponse(embeddings=vectors, model_used=model, dim=len(vectors[0]))
+    except httpx.TimeoutException:
+        logger.error("Timeout podczas liczenia embeddingów w Ollama API")
+        raise HTTPException(status_code=504, detail="Timeout podczas liczenia embeddingów")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Błąd podczas komunikacji z Ollama (embed): {e}")
+        raise HTTPException(status_code=500, detail=f"Błąd Ollama API: {str(e)}")
+
+
 @app.get("/ollama/models/")
 async def list_ollama_models():
     """Lista dostępnych modeli Ollama."""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(f"{OLLAMA_API_URL}/api/tags")
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Ollama API error: {response.text}",
-                )
-            return {"models": response.json().get("models", [])}
+        response = await ollama.get("/api/tags", timeout=30.0)
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Ollama API error: {response.text}",
+            )
+        return {"models": response.json().get("models", [])}
     except HTTPException:
         raise
     except Exception as e:
@@ -372,8 +1496,13 @@ async def list_ollama_models():
 async def health_check():
     """Stan API (Whisper + Ollama)."""
     status = {
-        "whisper": {"loaded": whisper_model is not None},
+        "whisper": {
+            "loaded": whisper_model is not None,
+            "queue": inference.status() if inference is not None else None,
+            "batching": batcher.status() if batcher is not None else None,
+        },
         "ollama": await ollama_is_available(),
+        "summary_cache": summary_cache.status() if summary_cache is not None else None,
     }
 
     if not status["whisper"]["loaded"] and not status["ollama"].get("available"):
@@ -386,7 +1515,9 @@ async def health_check():
             },
         )
 
-    return {"status": "ok", "services": status}
+    # Negocjacja formatu wysyłki audio: bot wybiera kodowanie z tej listy.
+    capabilities = {"encodings": _wire_encodings(), "word_timestamps": True, "spans": True}
+    return {"status": "ok", "services": status, "capabilities": capabilities}
 
 
 if __name__ == "__main__":